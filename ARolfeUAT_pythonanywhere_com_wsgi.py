@@ -9,6 +9,28 @@ if project_home not in sys.path:
 # Set environment variables if needed
 os.environ['FLASK_ENV'] = 'production'
 
+# Worker boots don't touch the database: production creates no tables at
+# import, so run `flask db upgrade` after deploying a schema change.
+#
+# Web workers don't send mail either: contact messages wait in the outbound
+# mail table until a PythonAnywhere task sends them. Tasks don't run this file,
+# so they must set FLASK_ENV themselves or they would use the SQLite database.
+# Schedule (e.g. every few minutes)
+#     cd /home/ARolfeUAT/SIP-Webpage && FLASK_ENV=production flask --app app mail flush
+# or run the same with `mail worker` as an always-on task for immediate delivery.
+#
+# Uploaded images are stored as-is; their resized and WebP variants are made
+# by a scheduled task (IMAGE_PROCESSING defaults to 'task' in production):
+#     cd /home/ARolfeUAT/SIP-Webpage && FLASK_ENV=production flask --app app posts process-images
+# Until it runs, posts show the original image.
+#
+# Startup target: a new worker should serve its first request within 1.5 s
+# of starting (STARTUP_TARGET_MS in startup_profile.py). Check it with
+#     flask startup-profile
+# which imports this file in a fresh interpreter, serves "/" and lists the
+# slowest imports. Setting BCRYPT_LOG_ROUNDS in the environment also spares
+# each worker the bcrypt calibration on its first login.
+
 from app import app as application
 
 if __name__ == "__main__":
@@ -15,13 +15,23 @@ import secrets
 
 from dotenv import load_dotenv
 from flask import Flask, render_template
+from jinja2 import FileSystemBytecodeCache
 
+from assets import asset_manifest
+from compression import compressor
 from extensions import db, bcrypt, login_manager, migrate
+from hashing import password_hasher
+from metrics import request_metrics
+from query_budgets import query_budgets
 
 
-def create_app():
+def create_app(config=None):
     """Application factory function that creates and configures the Flask app.
 
+    Args:
+        config: Mapping of settings applied over those read from the
+            environment, e.g. a scratch database for a check command.
+
     Returns:
         Flask: Configured Flask application instance.
     """
@@ -31,11 +41,17 @@ def create_app():
     # Initialize Flask app
     app = Flask(__name__)
 
+    # Persist compiled templates so worker restarts skip recompiling them
+    jinja_cache_path = os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(jinja_cache_path, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(jinja_cache_path)}
+
     # Config Flask App
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(16)
 
     # Configure database for production vs development
-    if os.environ.get('FLASK_ENV') == 'production':
+    production = os.environ.get('FLASK_ENV') == 'production'
+    if production:
         # Production MySQL configuration for PythonAnywhere
         mysql_username = 'ARolfeUAT'
         mysql_password = os.getenv('MYSQL_PASSWORD')
@@ -57,34 +73,136 @@ def create_app():
         }
 
     else:
-        # Development SQLite configuration
+        # Development SQLite configuration; DATABASE_URL points it elsewhere,
+        # e.g. at a scratch database for `flask bench`
         instance_path = os.path.abspath(os.path.join(app.root_path, 'instance'))
         os.makedirs(instance_path, exist_ok=True)
-        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "sip.db")}'
+        app.config['SQLALCHEMY_DATABASE_URI'] = (os.getenv('DATABASE_URL')
+                                                 or f'sqlite:///{os.path.join(instance_path, "sip.db")}')
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Create missing tables at startup (development only by default). Production
+    # schema changes go through `flask db upgrade`, so worker boots skip the database.
+    app.config['CREATE_SCHEMA_ON_STARTUP'] = os.getenv('CREATE_SCHEMA_ON_STARTUP',
+                                                      str(not production)).lower() == 'true'
     app.config['SMTP2GO_API_KEY'] = os.getenv('SMTP2GO_API_KEY')
     app.config['SMTP2GO_API_URL'] = os.getenv('SMTP2GO_API_URL')
 
+    # Outbound mail queue; see mailer.py
+    app.config['MAIL_CONNECT_TIMEOUT'] = float(os.getenv('MAIL_CONNECT_TIMEOUT', 5))
+    app.config['MAIL_READ_TIMEOUT'] = float(os.getenv('MAIL_READ_TIMEOUT', 15))
+    app.config['MAIL_BATCH_SIZE'] = int(os.getenv('MAIL_BATCH_SIZE', 20))
+    app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+    app.config['MAIL_RETRY_BASE_SECONDS'] = float(os.getenv('MAIL_RETRY_BASE_SECONDS', 30))
+    app.config['MAIL_RETRY_MAX_SECONDS'] = float(os.getenv('MAIL_RETRY_MAX_SECONDS', 3600))
+    app.config['MAIL_WORKER_POLL_SECONDS'] = float(os.getenv('MAIL_WORKER_POLL_SECONDS', 5))
+    # Run the worker as a thread in each web process (development only by default).
+    # Production sends from a PythonAnywhere task instead: `flask mail worker` as
+    # an always-on task, or `flask mail flush` as a scheduled one, both run with
+    # FLASK_ENV=production (see the WSGI file).
+    app.config['MAIL_WORKER_IN_PROCESS'] = os.getenv('MAIL_WORKER_IN_PROCESS',
+                                                    str(not production)).lower() == 'true'
+
+    # Number of posts shown per page of the project blog
+    app.config['SIP_PAGE_SIZE'] = int(os.getenv('SIP_PAGE_SIZE', 10))
+
+    # Posts in the Atom feed, and posts per page of the JSON API
+    app.config['FEED_SIZE'] = int(os.getenv('FEED_SIZE', 20))
+    app.config['API_PAGE_SIZE'] = int(os.getenv('API_PAGE_SIZE', 20))
+
+    # Comment threads: reply levels shown before a "load more replies" link, and
+    # threads per page when loading replies; see comments.py
+    app.config['COMMENT_MAX_DEPTH'] = int(os.getenv('COMMENT_MAX_DEPTH', 3))
+    app.config['COMMENT_PAGE_SIZE'] = int(os.getenv('COMMENT_PAGE_SIZE', 20))
+
+    # Comments per page of the admin moderation console
+    app.config['MODERATION_PAGE_SIZE'] = int(os.getenv('MODERATION_PAGE_SIZE', 50))
+
+    # Results per page of post search; see search.py
+    app.config['SEARCH_PAGE_SIZE'] = int(os.getenv('SEARCH_PAGE_SIZE', 10))
+    # Deepest results page served, as ranked results are paged by offset
+    app.config['SEARCH_MAX_PAGE'] = int(os.getenv('SEARCH_MAX_PAGE', 50))
+
+    # Seconds a shared cache may serve blog pages to anonymous visitors
+    app.config['PUBLIC_CACHE_MAX_AGE'] = int(os.getenv('PUBLIC_CACHE_MAX_AGE', 60))
+
+    # Post image uploads; see images.py
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    app.config['IMAGE_VARIANT_WIDTHS'] = (480, 960, 1600)
+    # Where image variants are generated: 'background' (a worker process, the
+    # development default), 'task' (left for a scheduled `flask posts process-images`,
+    # the production default) or 'inline' (in the request, for tests)
+    app.config['IMAGE_PROCESSING'] = os.getenv('IMAGE_PROCESSING', 'task' if production else 'background')
+
+    # Compress text responses of at least this many bytes with Brotli or gzip; see compression.py
+    app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+
+    # Pre-render the data-free pages at startup (development only by default).
+    # Production workers render each one on its first request instead, so boots stay fast.
+    app.config['WARM_STATIC_PAGES'] = os.getenv('WARM_STATIC_PAGES', str(not production)).lower() == 'true'
+
+    # Number of rendered post cards kept in each worker's fragment cache
+    app.config['POST_CARD_CACHE_SIZE'] = int(os.getenv('POST_CARD_CACHE_SIZE', 500))
+
+    # Logged-in user snapshots kept per worker, and how long other workers may
+    # keep serving a snapshot after a role or password change
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1000))
+    app.config['USER_CACHE_TTL_SECONDS'] = float(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+
+    # Password hashing; see hashing.py. BCRYPT_LOG_ROUNDS pins the cost, otherwise
+    # it is calibrated on the first hash to stay within BCRYPT_TARGET_MS per hash.
+    bcrypt_rounds = os.getenv('BCRYPT_LOG_ROUNDS')
+    app.config['BCRYPT_LOG_ROUNDS'] = int(bcrypt_rounds) if bcrypt_rounds else None
+    app.config['BCRYPT_TARGET_MS'] = float(os.getenv('BCRYPT_TARGET_MS', 250))
+    app.config['BCRYPT_MIN_ROUNDS'] = 10
+    app.config['BCRYPT_MAX_ROUNDS'] = 14
+    app.config['HASH_WORKERS'] = int(os.getenv('HASH_WORKERS', 2))
+    app.config['HASH_MAX_PENDING'] = int(os.getenv('HASH_MAX_PENDING', 8))
+    app.config['HASH_TIMEOUT_SECONDS'] = float(os.getenv('HASH_TIMEOUT_SECONDS', 10))
+
+    # Per-request SQL/template timings in Server-Timing headers and latency
+    # histograms at /admin/metrics; see metrics.py
+    app.config['INSTRUMENTATION_ENABLED'] = os.getenv('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+
+    # What to do when a request runs more SQL statements than its route's
+    # budget: 'raise', 'log' or 'off'. Unset means raise when testing, log in
+    # debug mode, off otherwise; see query_budgets.py
+    app.config['QUERY_BUDGET_MODE'] = os.getenv('QUERY_BUDGET_MODE')
+
+    app.config.update(config or {})
+
     # Initialize Flask Extensions
     db.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
+    request_metrics.init_app(app)
+    query_budgets.init_app(app)
+    compressor.init_app(app)
+    asset_manifest.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'
 
+    from caching import load_user_snapshot, post_card_cache, user_cache
+    post_card_cache.max_entries = app.config['POST_CARD_CACHE_SIZE']
+    user_cache.max_entries = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL_SECONDS']
+
     @login_manager.user_loader
     def load_user(user_id):
         """Load user by ID for Flask-Login.
 
+        Served from the per-process user cache, so most authenticated
+        requests need no database round trip to identify the user.
+
         Args:
             user_id: String, ID of the user to load.
 
         Returns:
-            User: User object or None if not found.
+            UserSnapshot: Snapshot of the user or None if not found.
         """
-        from models import User
-        return db.session.get(User, int(user_id))
+        return load_user_snapshot(int(user_id))
 
     # Register error handlers
     @app.errorhandler(404)
@@ -109,16 +227,48 @@ def create_app():
         return render_template('errors/400.html'), 400
 
     # Register blueprints
-    from routes import main
+    from routes import main, STATIC_PAGE_TEMPLATES
     app.register_blueprint(main)
 
-    # Create database tables within app context
-    from models import User, Post, Comment, Tag
+    if app.config['WARM_STATIC_PAGES']:
+        from caching import warm_static_pages
+        warm_static_pages(app, STATIC_PAGE_TEMPLATES)
+
+    # Register CLI commands
+    from commands import (assets_cli, auth_cli, bench_cli, check_cli, mail_cli, posts_cli, search_cli,
+                          startup_profile)
+    app.cli.add_command(posts_cli)
+    app.cli.add_command(mail_cli)
+    app.cli.add_command(auth_cli)
+    app.cli.add_command(check_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(bench_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(startup_profile)
+
+    if app.config['CREATE_SCHEMA_ON_STARTUP']:
+        create_schema(app)
+
+    return app
+
+
+def create_schema(app):
+    """Create missing tables and the full-text search index.
+
+    Args:
+        app: Flask, the application.
+    """
+    from models import User, Post, Comment, Tag, OutboundMail
+    from search import get_search_index
 
     with app.app_context():
         db.create_all()
 
-    return app
+        # The SQLite search table isn't a model, so create_all() skips it
+        search_index = get_search_index()
+        if search_index.create():
+            search_index.rebuild()
+        db.session.commit()
 
 
 # Create the app instance
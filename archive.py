@@ -0,0 +1,132 @@
+"""Set-based deletion and archival of posts for SIP311 Project Blog.
+
+:func:`delete_posts` removes posts with everything hanging off them: their
+comment trees, ``post_tag`` rows and search index entries. It issues a fixed
+handful of statements whatever the number of posts or comments, in the
+caller's transaction, and never loads ORM objects; tag counts are recounted
+set-based afterwards.
+
+With ``archive=True`` the posts and their comments are first copied to the
+``posts_archive`` and ``comments_archive`` tables with ``INSERT ... SELECT``.
+:func:`archive_posts` does that for every post older than a cutoff, a batch
+per transaction, so the hot tables the blog pages read stay small. Run it
+through ``flask posts archive``.
+"""
+
+from datetime import UTC, datetime
+
+from sqlalchemy import delete, insert, literal, select, update
+
+from extensions import db
+
+
+def _copy_to_archive(post_ids, archived_at):
+    """Copy posts and their comments to the archive tables."""
+    from models import ArchivedComment, ArchivedPost, Comment, Post, Tag
+
+    archived_at = literal(archived_at, db.DateTime)
+    post_columns = ('id', 'title', 'date', 'updated_at', 'content', 'content_html', 'image_path', 'image_width',
+                    'image_height', 'image_variants', 'user_id')
+    db.session.execute(insert(ArchivedPost).from_select(
+        [*post_columns, 'archived_at'],
+        select(*(getattr(Post, name) for name in post_columns), archived_at).where(Post.id.in_(post_ids)),
+    ))
+
+    # Tag names are joined here rather than with GROUP_CONCAT, which MySQL silently
+    # truncates at group_concat_max_len; they never contain commas (the forms split on them)
+    tag_names = Tag.names_by_post(post_ids)
+    if tag_names:
+        db.session.execute(update(ArchivedPost), [
+            {'id': post_id, 'tags': ','.join(names)} for post_id, names in tag_names.items()
+        ])
+    comment_columns = ('id', 'content', 'date', 'is_hidden', 'user_id', 'post_id', 'parent_id')
+    db.session.execute(insert(ArchivedComment).from_select(
+        [*comment_columns, 'archived_at'],
+        select(*(getattr(Comment, name) for name in comment_columns), archived_at)
+        .where(Comment.post_id.in_(post_ids)),
+    ))
+
+
+def delete_posts(post_ids, archive=False):
+    """Delete posts with their comments, tag links and search entries.
+
+    Runs in the current transaction; the caller commits.
+
+    Args:
+        post_ids: Iterable of Integer, posts to delete; IDs that don't exist
+            are ignored.
+        archive: Boolean, copy the posts and comments to the archive tables
+            first.
+
+    Returns:
+        dict: Number of ``posts`` and ``comments`` deleted.
+    """
+    from caching import post_card_cache
+    from models import Comment, Post, Tag, post_tag
+    from search import get_search_index
+
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {'posts': 0, 'comments': 0}
+    if archive:
+        _copy_to_archive(post_ids, datetime.now(UTC))
+
+    # Replies are always on their parent's post, so clearing the links lets one
+    # DELETE take every comment: MySQL checks parent_id row by row
+    db.session.execute(
+        update(Comment).where(Comment.post_id.in_(post_ids), Comment.parent_id.isnot(None)).values(parent_id=None),
+        execution_options={'synchronize_session': False},
+    )
+    comments = db.session.execute(
+        delete(Comment).where(Comment.post_id.in_(post_ids)),
+        execution_options={'synchronize_session': False},
+    ).rowcount
+
+    tag_ids = list(db.session.scalars(
+        select(post_tag.c.tag_id).where(post_tag.c.post_id.in_(post_ids)).distinct()
+    ))
+    if tag_ids:
+        db.session.execute(delete(post_tag).where(post_tag.c.post_id.in_(post_ids)))
+    get_search_index().remove_posts(post_ids)
+    posts = db.session.execute(
+        delete(Post).where(Post.id.in_(post_ids)),
+        execution_options={'synchronize_session': False},
+    ).rowcount
+    if tag_ids:
+        Tag.recount_posts(tag_ids)
+
+    for post_id in post_ids:
+        post_card_cache.invalidate(post_id)
+    return {'posts': posts, 'comments': comments}
+
+
+def archive_posts(before, batch_size=500, progress=None):
+    """Move every post published before ``before`` to the archive tables.
+
+    Posts go oldest first with their whole comment trees, ``batch_size``
+    posts per transaction, so an interrupted run leaves every post either
+    live or archived.
+
+    Args:
+        before: DateTime, cutoff (naive UTC); older posts are archived.
+        batch_size: Integer, posts per transaction.
+        progress: Callable taking a message string, or None.
+
+    Returns:
+        dict: Number of ``posts`` and ``comments`` archived.
+    """
+    from models import Post
+
+    progress = progress or (lambda message: None)
+    totals = {'posts': 0, 'comments': 0}
+    while True:
+        post_ids = list(db.session.scalars(
+            select(Post.id).where(Post.date < before).order_by(Post.date, Post.id).limit(batch_size)
+        ))
+        if not post_ids:
+            break
+        counts = delete_posts(post_ids, archive=True)
+        db.session.commit()
+        totals = {key: totals[key] + counts[key] for key in totals}
+        progress(f"posts: {totals['posts']}, comments: {totals['comments']}")
+    return totals
@@ -0,0 +1,187 @@
+"""Fingerprinted, precompressed static assets for SIP311 Project Blog.
+
+``flask assets build`` copies every file under ``static/`` to ``static/build/``
+under a name carrying a digest of its content (``css/style.css`` becomes
+``build/css/style.3f2a9c1d4b5e.css``), writes Brotli and gzip copies of the
+compressible ones next to it, and records the mapping in
+``static/build/manifest.json``. Uploaded post images are skipped: they are
+already named after their content (see images.py).
+
+:class:`AssetManifest` loads the manifest at startup and then:
+
+* makes ``url_for('static', filename='css/style.css')`` emit the built name,
+  so templates keep using source paths;
+* serves the precompressed copy of a built file when the client accepts it;
+* marks built files and uploaded images ``public, max-age=31536000,
+  immutable``, as a changed file always gets a new name.
+
+Without a manifest, static URLs and caching stay as Flask makes them. A
+static files mapping on PythonAnywhere bypasses Flask, so it serves the
+hashed names without these headers; remove the mapping for ``/static/`` to
+get them. Re-run
+the build after changing CSS or JavaScript; old built files are kept (pages
+cached elsewhere may still link to them) unless ``--prune`` is given.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_from_directory
+
+from compression import COMPRESSIBLE_TYPES, available_encodings, compress
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Directories of static/ that are not built: the build output and uploads
+SKIPPED_DIRS = (BUILD_DIR, 'images')
+# File name suffix of each precompressed copy
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+# Uploaded images and their variants, named after a digest of the upload
+_UPLOADED_IMAGE = re.compile(r'^images/[0-9a-f]{24}(?:-\d+w)?\.(?:jpg|png|webp)$')
+
+
+def _write_file(path, data):
+    """Write ``data`` to ``path`` atomically, creating directories as needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(data)
+    os.replace(temporary, path)
+
+
+def build_assets(static_folder, prune=False):
+    """Write fingerprinted and precompressed copies of the static assets.
+
+    Args:
+        static_folder: String, the app's static directory.
+        prune: Boolean, delete built files the new manifest doesn't use.
+
+    Returns:
+        dict: The manifest, source path to built path (both relative to
+        ``static_folder``, with '/' separators).
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if os.path.samefile(directory, static_folder):
+            subdirectories[:] = [name for name in subdirectories if name not in SKIPPED_DIRS]
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as handle:
+                data = handle.read()
+
+            stem, extension = posixpath.splitext(name)
+            built = f'{BUILD_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+            manifest[name] = built
+            target = os.path.join(static_folder, *built.split('/'))
+            if not os.path.exists(target):
+                _write_file(target, data)
+
+            if mimetypes.guess_type(name)[0] not in COMPRESSIBLE_TYPES:
+                continue
+            for encoding in available_encodings():
+                compressed_target = target + ENCODING_SUFFIXES[encoding]
+                if not os.path.exists(compressed_target):
+                    compressed = compress(data, encoding, level=11 if encoding == 'br' else 9)
+                    # Tiny files can grow; then the plain copy is served
+                    if len(compressed) < len(data):
+                        _write_file(compressed_target, compressed)
+
+    _write_file(os.path.join(build_root, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    if prune:
+        keep = {os.path.join(static_folder, *built.split('/')) for built in manifest.values()}
+        keep |= {path + suffix for path in keep for suffix in ENCODING_SUFFIXES.values()}
+        keep.add(os.path.join(build_root, MANIFEST_NAME))
+        for directory, _, filenames in os.walk(build_root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if path not in keep:
+                    os.remove(path)
+    return manifest
+
+
+class AssetManifest:
+    """Flask extension serving the built assets under their fingerprinted names.
+
+    Attributes:
+        manifest: Dict, source path to built path; empty if not built.
+    """
+
+    def __init__(self):
+        self.manifest = {}
+        self._encodings = {}
+        self._static_folder = None
+
+    def init_app(self, app):
+        """Load the manifest and take over the ``static`` endpoint.
+
+        Args:
+            app: Flask, the application.
+        """
+        app.extensions['assets'] = self
+        self._static_folder = app.static_folder
+        self.load()
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = self.send_static_file
+
+    def load(self):
+        """(Re)read the manifest and note which precompressed copies exist."""
+        path = os.path.join(self._static_folder, BUILD_DIR, MANIFEST_NAME)
+        try:
+            with open(path) as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            manifest = {}
+
+        encodings = {}
+        for built in manifest.values():
+            target = os.path.join(self._static_folder, *built.split('/'))
+            encodings[built] = tuple(encoding for encoding, suffix in ENCODING_SUFFIXES.items()
+                                     if os.path.exists(target + suffix))
+        self.manifest, self._encodings = manifest, encodings
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint == 'static':
+            built = self.manifest.get(values.get('filename'))
+            if built:
+                values['filename'] = built
+
+    def send_static_file(self, filename):
+        """Serve a static file, precompressed and long-cached where possible.
+
+        Args:
+            filename: String, path below the static directory.
+
+        Returns:
+            Response: The file.
+        """
+        encodings = self._encodings.get(filename)
+        if encodings is None:
+            response = send_from_directory(self._static_folder, filename)
+        else:
+            encoding = request.accept_encodings.best_match(encodings) if encodings else None
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(self._static_folder, filename + ENCODING_SUFFIXES.get(encoding, ''),
+                                           mimetype=mimetype)
+            if encoding:
+                response.content_encoding = encoding
+            if encodings:
+                response.vary.add('Accept-Encoding')
+
+        if encodings is not None or _UPLOADED_IMAGE.match(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+
+asset_manifest = AssetManifest()
@@ -0,0 +1,374 @@
+"""Synthetic data and load generation for SIP311 Project Blog.
+
+:func:`seed_data` fills an empty database with users, posts, comments (some
+of them replies) and tags in batched multi-row inserts, then brings the
+denormalized counters and the search index up to date with the same
+set-based helpers the app uses.
+
+:func:`run_benchmark` drives a set of scenarios (see :data:`SCENARIOS`)
+through the Flask test client or a local threaded WSGI server at a fixed
+concurrency and reports throughput, latency percentiles, status codes and
+database queries per request as a JSON-ready dict, so two runs can be
+diffed. The contact scenario sends its mail to a local stub of the SMTP2GO
+API.
+
+Both are meant for a scratch database; run them through ``flask bench``.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import g, has_request_context, request_finished
+from sqlalchemy import event, insert
+
+from commands import _percentile
+from extensions import db
+
+# Every seeded user logs in with this password
+BENCH_PASSWORD = 'bench-password'
+
+WORDS = ('project', 'innovation', 'prototype', 'sensor', 'design', 'test', 'student', 'build', 'code',
+         'flask', 'database', 'update', 'result', 'board', 'circuit', 'model', 'research', 'idea',
+         'feedback', 'progress', 'week', 'team', 'launch', 'review', 'cache', 'query', 'latency')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def seed_data(users=200, posts=10_000, comments=100_000, tags=50, batch_size=10_000, reply_fraction=0.2,
+              seed=311, progress=None):
+    """Fill an empty database with synthetic blog data.
+
+    Args:
+        users: Integer, users to create; each logs in with ``BENCH_PASSWORD``.
+        posts: Integer, posts to create.
+        comments: Integer, comments to create across all posts.
+        tags: Integer, tags to create; each post gets one to three.
+        batch_size: Integer, rows per INSERT statement and transaction.
+        reply_fraction: Float, share of comments that reply to an earlier
+            comment on the same post.
+        seed: Integer, random seed, so runs at the same scale match.
+        progress: Callable taking a message string, or None.
+
+    Returns:
+        dict: Number of rows created per table.
+
+    Raises:
+        ValueError: If the database already has users or posts.
+    """
+    from hashing import password_hasher
+    from models import Comment, Post, Tag, User, post_tag
+    from search import get_search_index
+
+    progress = progress or (lambda message: None)
+    if db.session.scalar(db.select(User.id).limit(1)) or db.session.scalar(db.select(Post.id).limit(1)):
+        raise ValueError('The database already has users or posts; seed an empty one')
+
+    rng = random.Random(seed)
+    password = password_hasher.hash(BENCH_PASSWORD)
+
+    def insert_batches(model, rows, label):
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.session.execute(insert(model), batch)
+                db.session.commit()
+                total += len(batch)
+                batch = []
+                progress(f'{label}: {total}')
+        if batch:
+            db.session.execute(insert(model), batch)
+            db.session.commit()
+            total += len(batch)
+        progress(f'{label}: {total} done')
+        return total
+
+    insert_batches(User, (
+        {'id': i, 'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password': password,
+         'role': 'admin' if i == 1 else 'user'}
+        for i in range(1, users + 1)
+    ), 'users')
+    insert_batches(Tag, ({'id': i, 'name': f'topic{i}'} for i in range(1, tags + 1)), 'tags')
+
+    start = datetime(2024, 1, 1)
+    post_dates = {i: start + timedelta(minutes=30 * i) for i in range(1, posts + 1)}
+
+    def post_rows():
+        for post_id, date in post_dates.items():
+            content = _text(rng, 120)
+            yield {'id': post_id, 'title': _text(rng, 5).title(), 'date': date, 'content': content,
+                   'content_html': f'<p>{content}</p>', 'user_id': 1, 'revision': 0}
+
+    insert_batches(Post, post_rows(), 'posts')
+    insert_batches(post_tag, (
+        {'post_id': post_id, 'tag_id': tag_id, 'post_date': date}
+        for post_id, date in post_dates.items()
+        for tag_id in set(rng.choices(range(1, tags + 1), k=rng.randint(1, 3)))
+    ), 'post tags')
+
+    def comment_rows():
+        # Newest comment per post, so replies can point at a comment on the same post
+        latest = {}
+        for comment_id in range(1, comments + 1):
+            post_id = rng.randint(1, posts)
+            parent = latest.get(post_id) if rng.random() < reply_fraction else None
+            base = parent[1] if parent else post_dates[post_id]
+            date = base + timedelta(minutes=rng.randint(1, 60 * 24 * 7))
+            latest[post_id] = (comment_id, date)
+            yield {'id': comment_id, 'content': _text(rng, 20), 'date': date, 'is_hidden': rng.random() < 0.03,
+                   'user_id': rng.randint(1, users), 'post_id': post_id,
+                   'parent_id': parent[0] if parent else None}
+
+    insert_batches(Comment, comment_rows(), 'comments')
+
+    progress('recounting comments and tags, rebuilding the search index')
+    Post.recount_comments()
+    Tag.recount_posts()
+    search_index = get_search_index()
+    search_index.create()
+    search_index.rebuild()
+    db.session.commit()
+    return {'users': users, 'posts': posts, 'comments': comments, 'tags': tags}
+
+
+class QueryCounter:
+    """Counts database queries made while handling requests, per scenario.
+
+    Queries are attributed to the request whose context issued them, so the
+    mail worker and the benchmark's own setup queries are not counted.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.scenario = None
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def _on_query(self, *args):
+        if has_request_context():
+            g._bench_queries = g.get('_bench_queries', 0) + 1
+
+    def _on_request_finished(self, sender, response, **extra):
+        with self._lock:
+            self.totals[self.scenario] = self.totals.get(self.scenario, 0) + g.get('_bench_queries', 0)
+
+    def __enter__(self):
+        with self.app.app_context():
+            self._engine = db.engine
+        event.listen(self._engine, 'before_cursor_execute', self._on_query)
+        request_finished.connect(self._on_request_finished, self.app)
+        return self
+
+    def __exit__(self, *exc_info):
+        request_finished.disconnect(self._on_request_finished, self.app)
+        event.remove(self._engine, 'before_cursor_execute', self._on_query)
+
+
+class ClientTransport:
+    """Sends requests through the Flask test client, one client per thread."""
+
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, user_id=None):
+        client = self.app.test_client()
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        return client
+
+    def close(self):
+        pass
+
+
+class _WSGISession:
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self.http = requests.Session()
+
+    def get(self, path):
+        return self.http.get(self.base_url + path, allow_redirects=False)
+
+    def post(self, path, data=None):
+        return self.http.post(self.base_url + path, data=data, allow_redirects=False)
+
+
+class WSGITransport:
+    """Sends real HTTP requests to the app served by a local threaded WSGI server."""
+
+    name = 'wsgi'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, name='bench-wsgi', daemon=True)
+        self._thread.start()
+
+    def session(self, user_id=None):
+        session = _WSGISession(self.base_url)
+        if user_id is not None:
+            session.post('/login', data={'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD})
+        return session
+
+    def close(self):
+        self.server.shutdown()
+
+
+def _sip_request(session, rng, context):
+    if context['cursors'] and rng.random() < 0.5:
+        return session.get('/sip?before=' + rng.choice(context['cursors']))
+    return session.get('/sip')
+
+
+def _login_request(session, rng, context):
+    user_id = rng.randint(1, context['users'])
+    return session.post('/login', data={'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD})
+
+
+def _comment_request(session, rng, context):
+    post_id = rng.choice(context['post_ids'])
+    return session.post(f'/post/{post_id}/comment', data={'content': _text(rng, 12)})
+
+
+def _contact_request(session, rng, context):
+    return session.post('/contact', data={'name': 'Bench', 'email': 'bench@example.com', 'message': _text(rng, 30)})
+
+
+# Scenario name: (request function, session kind). 'anonymous' and 'user'
+# sessions are kept per thread; 'fresh' starts each request logged out.
+SCENARIOS = {
+    'sip': (_sip_request, 'anonymous'),
+    'login': (_login_request, 'fresh'),
+    'comment': (_comment_request, 'user'),
+    'contact': (_contact_request, 'anonymous'),
+}
+
+
+def _benchmark_context():
+    """Collect the ids and cursors the scenarios pick from."""
+    from models import Post, User
+    from pagination import encode_cursor
+
+    highest = db.session.scalar(db.select(db.func.max(Post.id))) or 0
+    sample = random.Random(0).sample(range(1, highest + 1), min(500, highest))
+    rows = db.session.execute(db.select(Post.id, Post.date).where(Post.id.in_(sample))).all()
+    return {
+        'users': db.session.scalar(db.select(db.func.count(User.id))),
+        'post_ids': [row.id for row in rows],
+        'cursors': [encode_cursor(row.date, row.id) for row in rows],
+    }
+
+
+def _run_scenario(name, transport, context, total, concurrency, seed):
+    make_request, kind = SCENARIOS[name]
+    local = threading.local()
+
+    def one(index):
+        if not hasattr(local, 'rng'):
+            local.rng = random.Random(f'{seed}-{name}-{threading.get_ident()}')
+        if kind == 'fresh' or not hasattr(local, 'session'):
+            local.session = transport.session(
+                user_id=local.rng.randint(1, context['users']) if kind == 'user' else None
+            )
+        started = time.perf_counter()
+        try:
+            status = make_request(local.session, local.rng, context).status_code
+        except Exception as error:
+            status = type(error).__name__
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'bench-{name}') as pool:
+        results = list(pool.map(one, range(total)))
+    return results, time.perf_counter() - started
+
+
+def run_benchmark(app, scenarios=tuple(SCENARIOS), requests_per_scenario=200, concurrency=8, transport='client',
+                  seed=311):
+    """Drive the app with concurrent requests and measure it.
+
+    CSRF protection is switched off and the mail API is pointed at a local
+    stub for the duration of the run.
+
+    Args:
+        app: Flask, the application, with a seeded database.
+        scenarios: Iterable of String, names from :data:`SCENARIOS`.
+        requests_per_scenario: Integer, requests sent per scenario.
+        concurrency: Integer, requests in flight at once.
+        transport: String, 'client' for the test client or 'wsgi' for a
+            local threaded WSGI server.
+        seed: Integer, random seed for request choices.
+
+    Returns:
+        dict: JSON-ready report with the run settings and per-scenario
+        results.
+    """
+    from mailer import make_stub_server
+
+    with app.app_context():
+        context = _benchmark_context()
+        dialect = db.engine.dialect.name
+    if not context['users'] or not context['post_ids']:
+        raise ValueError('The database has no users or posts; run `flask bench seed` first')
+
+    stub = make_stub_server(port=0)
+    threading.Thread(target=stub.serve_forever, name='bench-mail-stub', daemon=True).start()
+    overrides = {
+        'WTF_CSRF_ENABLED': False,
+        'SMTP2GO_API_URL': f'http://127.0.0.1:{stub.server_port}/email/send',
+    }
+    saved = {key: app.config.get(key) for key in overrides}
+    app.config.update(overrides)
+
+    report = {
+        'settings': {'transport': transport, 'concurrency': concurrency, 'requests_per_scenario':
+                     requests_per_scenario, 'database': dialect, 'seed': seed,
+                     'started_at': datetime.now().isoformat(timespec='seconds')},
+        'scenarios': {},
+    }
+    client = WSGITransport(app) if transport == 'wsgi' else ClientTransport(app)
+    try:
+        with QueryCounter(app) as counter:
+            for name in scenarios:
+                counter.scenario = name
+                results, elapsed = _run_scenario(name, client, context, requests_per_scenario, concurrency, seed)
+                latencies = [latency * 1000 for latency, _ in results]
+                statuses = {}
+                for _, status in results:
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                report['scenarios'][name] = {
+                    'requests': len(results),
+                    'throughput_rps': round(len(results) / elapsed, 1),
+                    'latency_ms': {
+                        'p50': round(_percentile(latencies, 50), 2),
+                        'p95': round(_percentile(latencies, 95), 2),
+                        'p99': round(_percentile(latencies, 99), 2),
+                        'max': round(max(latencies), 2),
+                    },
+                    'status_codes': statuses,
+                    'queries_per_request': round(counter.totals.get(name, 0) / len(results), 2),
+                }
+    finally:
+        client.close()
+        app.config.update(saved)
+        stub.shutdown()
+        stub.server_close()
+    report['mail_stub'] = dict(stub.stats)
+    return report
@@ -0,0 +1,571 @@
+"""Caching helpers for SIP311 Project Blog.
+
+Blog pages are validated against a cheap version stamp built from the newest
+post and comment timestamps, their row counts and the sum of the posts'
+revision counters, which moves on every write to a post or its comments,
+moderation included. When a client (or a reverse
+proxy) already holds the current version, the route answers ``304 Not
+Modified`` before running the listing queries or rendering any template.
+
+Pages that do have to be rendered reuse per-post card fragments from a bounded,
+in-process LRU cache. Fragments are keyed on the post id and its revision
+counter, which every write to a post or its comments increments.
+
+Pages with no data at all are rendered once per navbar variant (anonymous or
+logged in) and then served from memory, with strong ETags and precompressed
+Brotli and gzip bodies.
+
+Logged-in users are resolved from a short-lived per-process cache of identity
+snapshots, so authenticated requests don't query the users table just to find
+out who is asking.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import UTC
+
+from flask import current_app, g, get_template_attribute, make_response, render_template, request, session
+from flask_login import AnonymousUserMixin, UserMixin, current_user
+
+from compression import available_encodings, compress, negotiate_encoding
+from metrics import timing
+
+
+class BlogVersion:
+    """Version stamp of the blog's content.
+
+    Attributes:
+        stamp: String, digest that changes whenever posts or comments change.
+        last_modified: DateTime, newest post or comment timestamp (UTC), or None.
+    """
+
+    def __init__(self, stamp, last_modified):
+        self.stamp = stamp
+        self.last_modified = last_modified
+
+
+def blog_version():
+    """Compute the current blog version stamp with a single aggregate query.
+
+    Returns:
+        BlogVersion: Stamp and last-modified time of the blog's content.
+    """
+    from extensions import db
+    from models import Comment, Post
+
+    row = db.session.execute(db.select(
+        db.select(db.func.count(Post.id)).scalar_subquery(),
+        db.select(db.func.max(Post.date)).scalar_subquery(),
+        db.select(db.func.max(Post.updated_at)).scalar_subquery(),
+        db.select(db.func.count(Comment.id)).scalar_subquery(),
+        db.select(db.func.max(Comment.date)).scalar_subquery(),
+        # Hiding, showing and deleting comments only shows up here
+        db.select(db.func.sum(Post.revision)).scalar_subquery(),
+    )).one()
+
+    timestamps = [value for value in (row[1], row[2], row[4]) if value is not None]
+    last_modified = max(timestamps).replace(tzinfo=UTC, microsecond=0) if timestamps else None
+    stamp = hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+    return BlogVersion(stamp, last_modified)
+
+
+def page_etag(version, *parts):
+    """Build an ETag for one rendering of a page.
+
+    The tag covers the content version, the page's query string and the
+    viewer variant, since admins and logged-in users see different controls.
+
+    Args:
+        version: BlogVersion, current content version.
+        *parts: Any extra values that select what the page shows.
+
+    Returns:
+        str: Opaque ETag value (without quotes).
+    """
+    if current_user.is_authenticated:
+        viewer = f'user:{current_user.id}:{current_user.role}'
+    else:
+        viewer = 'anonymous'
+    key = '|'.join([version.stamp, viewer, request.query_string.decode('latin-1'), *map(str, parts)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def fragment_etag(*parts):
+    """Build an ETag for a viewer-independent fragment.
+
+    Args:
+        *parts: Values that identify the fragment's content, such as a post id
+            and revision.
+
+    Returns:
+        str: Opaque ETag value (without quotes).
+    """
+    key = '|'.join([request.query_string.decode('latin-1'), *map(str, parts)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _has_pending_flashes():
+    """Return True if the response must carry one-off flash messages."""
+    return bool(session.get('_flashes'))
+
+
+def not_modified_response(etag, last_modified=None):
+    """Answer a conditional GET with 304 if the client's copy is current.
+
+    Only ``If-None-Match`` is honoured (see :func:`_client_is_current`).
+    Requests with pending flash messages are never answered with 304, as the
+    messages would otherwise be lost.
+
+    Args:
+        etag: String, ETag of the current representation.
+        last_modified: DateTime, modification time of the representation.
+
+    Returns:
+        Response: A 304 response, or None if the page must be rendered.
+    """
+    if request.method not in ('GET', 'HEAD') or _has_pending_flashes():
+        return None
+    if not _client_is_current(etag):
+        return None
+    response = make_response('', 304)
+    return set_cache_headers(response, etag, last_modified)
+
+
+def _client_is_current(etag):
+    """Return True if the request's ``If-None-Match`` matches the representation.
+
+    ``If-Modified-Since`` is ignored: Last-Modified is the newest surviving
+    post or comment timestamp, so it moves backwards when that row is deleted
+    and would let a client keep a copy that still shows it.
+    """
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+
+def set_cache_headers(response, etag, last_modified=None):
+    """Attach validators and Cache-Control headers to a page response.
+
+    Pages for anonymous visitors are marked ``public`` with a short
+    ``max-age`` (``PUBLIC_CACHE_MAX_AGE``) so a reverse proxy can serve them.
+    Pages for logged-in users, and any response that changed the session
+    (for example by consuming flash messages), are ``private`` and
+    revalidated on every use.
+
+    Args:
+        response: Response, the page response.
+        etag: String, ETag of the representation.
+        last_modified: DateTime, modification time of the representation.
+
+    Returns:
+        Response: The same response, with headers set.
+    """
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    if current_user.is_authenticated or session.modified or _has_pending_flashes():
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PUBLIC_CACHE_MAX_AGE']
+    response.vary.add('Cookie')
+    return response
+
+
+class LRUCache:
+    """Thread-safe mapping bounded to ``max_entries`` with LRU eviction.
+
+    Attributes:
+        max_entries: Integer, number of entries kept before evicting.
+        hits: Integer, lookups that found an entry.
+        misses: Integer, lookups that found nothing usable.
+        evictions: Integer, entries dropped to stay within the bound.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value stored under ``key``, or None on a miss."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Remove ``key`` from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return a snapshot of the cache counters.
+
+        Returns:
+            dict: Entry count, bound, hits, misses and evictions.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class FragmentCache(LRUCache):
+    """LRU cache of rendered fragments keyed on an object id and revision.
+
+    Only the newest revision of each object is kept; asking for any other
+    revision counts as a miss.
+    """
+
+    def get(self, object_id, revision):
+        entry = super().get(object_id)
+        if entry is None:
+            return None
+        cached_revision, fragment = entry
+        if cached_revision != revision:
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return fragment
+
+    def set(self, object_id, revision, fragment):
+        super().set(object_id, (revision, fragment))
+
+    def invalidate(self, object_id):
+        """Drop any cached fragment for ``object_id``."""
+        self.pop(object_id)
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire ``ttl`` seconds after being stored.
+
+    Attributes:
+        ttl: Number, lifetime of an entry in seconds.
+    """
+
+    def __init__(self, max_entries=256, ttl=60):
+        super().__init__(max_entries)
+        self.ttl = ttl
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                self._entries.pop(key, None)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return value
+
+    def set(self, key, value):
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of the fields requests need about a user.
+
+    Flask-Login's ``current_user`` is one of these for logged-in users. Code
+    that needs to change the user must load the ``User`` row itself.
+
+    Attributes:
+        id: Integer, user ID.
+        username: String, username.
+        email: String, email address.
+        role: String, 'admin' or 'user'.
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+user_cache = TTLCache()
+
+
+def load_user_snapshot(user_id):
+    """Return the identity snapshot for ``user_id``, querying only on a miss.
+
+    Args:
+        user_id: Integer, ID of the user.
+
+    Returns:
+        UserSnapshot: Snapshot of the user, or None if no such user exists.
+    """
+    from extensions import db
+    from models import User
+
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+
+def invalidate_user(user_id):
+    """Drop the cached snapshot of a user whose role or password changed.
+
+    Other worker processes keep their copy until it expires, after at most
+    ``USER_CACHE_TTL_SECONDS``.
+
+    Args:
+        user_id: Integer, ID of the user.
+    """
+    user_cache.pop(user_id)
+
+
+class PostCard:
+    """Rendered, viewer-independent parts of a post card on the blog listing.
+
+    Attributes:
+        body: Markup, title, byline, tags, image and post body.
+        comments: Markup, comments toggle and the (initially empty) container
+            its comments are loaded into.
+    """
+
+    def __init__(self, body, comments):
+        self.body = body
+        self.comments = comments
+
+
+post_card_cache = FragmentCache()
+
+
+def render_post_cards(posts):
+    """Return the card fragments for ``posts``, rendering only cache misses.
+
+    ``posts`` need only have ``id`` and ``revision`` loaded. Missing cards are
+    rendered from a single eager-loaded listing query, so a warm cache costs
+    no further queries and almost no template work.
+
+    Args:
+        posts: Iterable of Post, the posts on the current page.
+
+    Returns:
+        dict: Mapping of post id to PostCard.
+    """
+    from models import Post
+
+    cards = {}
+    missing = []
+    for post in posts:
+        card = post_card_cache.get(post.id, post.revision)
+        if card is None:
+            missing.append(post.id)
+        else:
+            cards[post.id] = card
+
+    if missing:
+        with timing('cards'):
+            render_body = get_template_attribute('partials/post_card.html', 'card_body')
+            render_comments = get_template_attribute('partials/post_card.html', 'card_comments')
+            for post in Post.listing_query().filter(Post.id.in_(missing)).populate_existing():
+                card = PostCard(render_body(post), render_comments(post))
+                post_card_cache.set(post.id, post.revision, card)
+                cards[post.id] = card
+    return cards
+
+
+tag_cloud_cache = LRUCache(max_entries=4)
+
+
+def tag_cloud(version):
+    """Return the tags in use with their post counts.
+
+    Counts are maintained on write (``Tag.post_count``) and every change to a
+    post's tags also changes the blog version, so the cloud is cached per
+    version stamp and only the first page view after a change queries it.
+
+    Args:
+        version: BlogVersion, current content version.
+
+    Returns:
+        list: ``(name, post_count)`` pairs ordered by name.
+    """
+    from models import Tag
+
+    cloud = tag_cloud_cache.get(version.stamp)
+    if cloud is None:
+        cloud = Tag.cloud()
+        tag_cloud_cache.set(version.stamp, cloud)
+    return cloud
+
+
+document_cache = LRUCache(max_entries=64)
+
+
+def document_response(etag, last_modified, mimetype, render):
+    """Serve a viewer-independent document, such as a feed or an API page.
+
+    A client that already holds ``etag`` gets a 304 before anything is
+    rendered. Otherwise the body is served from a per-worker cache keyed on
+    ``etag``, so it is rendered once per content change. ``etag`` must
+    therefore change with the content, e.g. by covering the blog version
+    stamp. Responses are ``public`` for ``PUBLIC_CACHE_MAX_AGE`` seconds
+    whoever asks, as nothing in them depends on the viewer.
+
+    Args:
+        etag: String, ETag of the document.
+        last_modified: DateTime, modification time of the document.
+        mimetype: String, content type of the document.
+        render: Callable returning the document as a string.
+
+    Returns:
+        Response: The document, or 304 Not Modified.
+    """
+    if _client_is_current(etag):
+        response = make_response('', 304)
+    else:
+        body = document_cache.get(etag)
+        if body is None:
+            body = render().encode('utf-8')
+            document_cache.set(etag, body)
+        response = make_response(body)
+        response.mimetype = mimetype
+
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PUBLIC_CACHE_MAX_AGE']
+    return response
+
+
+class StaticPage:
+    """A fully rendered page held in memory.
+
+    Attributes:
+        body: Bytes, UTF-8 encoded HTML.
+        encoded_bodies: Dict, content coding ('br', 'gzip') to the HTML
+            compressed with it.
+        etag: String, strong ETag of the uncompressed HTML; encoded bodies
+            use it suffixed with the coding.
+    """
+
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.encoded_bodies = {encoding: compress(self.body, encoding, level=9) for encoding in available_encodings()}
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+class _WarmupUser(UserMixin):
+    """Stand-in for a logged-in user while pre-rendering pages at startup."""
+    id = None
+
+
+static_pages = {}
+_static_pages_lock = threading.Lock()
+
+
+def _render_static_page(template_name, authenticated):
+    page = StaticPage(render_template(template_name))
+    with _static_pages_lock:
+        static_pages[(template_name, authenticated)] = page
+    return page
+
+
+def static_page_response(template_name):
+    """Serve a data-free page from memory, rendering it on first use.
+
+    Only the navbar's login state varies between visitors, so each page is
+    rendered at most once per variant and worker. Requests carrying flash
+    messages are rendered normally so the messages are shown.
+
+    Args:
+        template_name: String, template of the page.
+
+    Returns:
+        Response: The page (compressed if accepted), or 304 Not Modified.
+    """
+    if _has_pending_flashes():
+        response = make_response(render_template(template_name))
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    authenticated = current_user.is_authenticated
+    page = static_pages.get((template_name, authenticated))
+    if page is None:
+        page = _render_static_page(template_name, authenticated)
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    etag = f'{page.etag}-{encoding}' if encoding else page.etag
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    elif encoding:
+        response = make_response(page.encoded_bodies[encoding])
+        response.content_encoding = encoding
+    else:
+        response = make_response(page.body)
+    response.content_type = 'text/html; charset=utf-8'
+    response.set_etag(etag)
+
+    if authenticated:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PUBLIC_CACHE_MAX_AGE']
+    response.vary.update(('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def warm_static_pages(app, template_names):
+    """Pre-render both navbar variants of each data-free page.
+
+    ``create_app`` calls it when ``WARM_STATIC_PAGES`` is set; otherwise
+    :func:`static_page_response` renders each page on its first request.
+
+    Args:
+        app: Flask, the application.
+        template_names: Iterable of String, templates to render.
+    """
+    for template_name in template_names:
+        for user in (AnonymousUserMixin(), _WarmupUser()):
+            with app.test_request_context('/'):
+                g._login_user = user
+                _render_static_page(template_name, user.is_authenticated)
@@ -0,0 +1,596 @@
+"""Flask CLI commands for SIP311 Project Blog.
+
+This module defines command groups registered on the application in
+``create_app()`` for maintenance tasks that should not run inside a web
+request, such as backfilling derived post data, draining the outbound mail
+queue, benchmarking, and checking query plans and budgets.
+"""
+
+import math
+
+import click
+from flask.cli import AppGroup
+
+posts_cli = AppGroup('posts', help='Maintenance commands for blog posts.')
+mail_cli = AppGroup('mail', help='Outbound mail queue commands.')
+auth_cli = AppGroup('auth', help='Password hashing commands.')
+check_cli = AppGroup('check', help='Performance regression checks.')
+search_cli = AppGroup('search', help='Full-text search commands.')
+bench_cli = AppGroup('bench', help='Synthetic data and load benchmarks.')
+assets_cli = AppGroup('assets', help='Static asset build commands.')
+
+
+def _percentile(values, percent):
+    """Return the nearest-rank percentile of a non-empty list of numbers."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@click.command('startup-profile')
+@click.option('--target', default=None, help='WSGI file defining `application`, or module defining `app` '
+                                            '(default: the PythonAnywhere WSGI file).')
+@click.option('--path', default='/', show_default=True, help='URL path of the first request.')
+@click.option('--top', default=15, show_default=True, help='Slowest imports to list.')
+@click.option('--max-ms', type=float, help='Fail above this cold start time (default: STARTUP_TARGET_MS).')
+def startup_profile(target, path, top, max_ms):
+    """Report import time per module and time to first request.
+
+    Starts a fresh interpreter that imports TARGET the way a new web worker
+    does and serves one request, then lists the slowest imports. The WSGI
+    file selects the production config, so its first request should be one
+    that needs no database, like the default "/".
+    """
+    import os
+
+    from flask import current_app
+
+    from startup_profile import STARTUP_TARGET_MS, WSGI_FILE, profile_startup
+
+    target = target or os.path.join(current_app.root_path, WSGI_FILE)
+    max_ms = max_ms or STARTUP_TARGET_MS
+    try:
+        result = profile_startup(target, path)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+
+    click.echo(f'target: {target}')
+    click.echo(f"imports and create_app(): {result['import_ms']:.0f} ms")
+    click.echo(f"first request ({path}, {result['status']}): {result['first_request_ms']:.0f} ms, "
+               f"next: {result['second_request_ms']:.0f} ms")
+    click.echo(f"time to first request: {result['total_ms']:.0f} ms (target {max_ms:.0f} ms)")
+
+    # Direct imports and theirs are what a change to this project can move
+    own = {name[:-3] for name in os.listdir(current_app.root_path) if name.endswith('.py')}
+    imports = result['imports']
+    click.echo('\nslowest imports (cumulative ms, self ms):')
+    for timing in sorted((t for t in imports if t.depth <= 2), key=lambda t: -t.cumulative_ms)[:top]:
+        click.echo(f"  {timing.cumulative_ms:8.1f} {timing.self_ms:8.1f}  {'  ' * (timing.depth - 1)}{timing.module}")
+    click.echo('\nproject modules (cumulative ms, self ms):')
+    for timing in sorted((t for t in imports if t.module in own), key=lambda t: -t.cumulative_ms):
+        click.echo(f'  {timing.cumulative_ms:8.1f} {timing.self_ms:8.1f}  {timing.module}')
+
+    if result['status'] >= 500:
+        raise click.ClickException(f"The first request to {path} failed with {result['status']}.")
+    if result['total_ms'] > max_ms:
+        raise click.ClickException(f"Cold start took {result['total_ms']:.0f} ms, over the {max_ms:.0f} ms target.")
+
+
+@posts_cli.command('backfill-html')
+@click.option('--all', 'render_all', is_flag=True, help='Re-render every post, not only those missing HTML.')
+@click.option('--batch-size', default=500, show_default=True, help='Posts rendered per transaction.')
+def backfill_html(render_all, batch_size):
+    """Render stored markdown into posts.content_html."""
+    from extensions import db
+    from models import Post
+
+    last_id = 0
+    rendered = 0
+    while True:
+        query = Post.query.filter(Post.id > last_id)
+        if not render_all:
+            query = query.filter(Post.content_html.is_(None))
+        batch = query.order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        for post in batch:
+            post.set_content(post.content)
+        db.session.commit()
+        rendered += len(batch)
+        last_id = batch[-1].id
+
+    click.echo(f'Rendered HTML for {rendered} post(s).')
+
+
+@posts_cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recompute posts' comment counters and last-comment dates."""
+    from extensions import db
+    from models import Post
+
+    changed = Post.recount_comments()
+    db.session.commit()
+    click.echo(f'Corrected comment counters on {changed} post(s).')
+
+
+@posts_cli.command('process-images')
+@click.option('--all', 'process_all', is_flag=True, help='Regenerate variants for every post image.')
+def process_images(process_all):
+    """Generate resized and WebP variants for post images."""
+    from flask import current_app
+
+    from extensions import db
+    from images import generate_variants, image_dir, record_variants
+    from models import Post
+
+    query = db.select(Post.image_path).where(Post.image_path.isnot(None)).distinct()
+    if not process_all:
+        query = query.where(Post.image_variants.is_(None))
+    directory = image_dir(current_app)
+
+    processed = 0
+    for filename in db.session.scalars(query).all():
+        try:
+            result = generate_variants(directory, filename, current_app.config['IMAGE_VARIANT_WIDTHS'])
+        except (OSError, ValueError) as error:
+            click.echo(f'Skipping {filename}: {error}', err=True)
+            continue
+        record_variants(filename, result)
+        processed += 1
+
+    click.echo(f'Processed {processed} image(s).')
+
+
+@posts_cli.command('archive')
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive posts published before this date (YYYY-MM-DD, UTC).')
+@click.option('--batch-size', default=500, show_default=True, help='Posts moved per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only count the posts and comments that would move.')
+def posts_archive(before, batch_size, dry_run):
+    """Move old posts and their comments to the archive tables."""
+    from archive import archive_posts
+    from extensions import db
+    from models import Comment, Post
+
+    if dry_run:
+        posts, comments = db.session.execute(db.select(
+            db.select(db.func.count(Post.id)).where(Post.date < before).scalar_subquery(),
+            db.select(db.func.count(Comment.id)).join(Post, Post.id == Comment.post_id)
+            .where(Post.date < before).scalar_subquery(),
+        )).one()
+        click.echo(f'Would archive {posts} post(s) and {comments} comment(s).')
+        return
+
+    totals = archive_posts(before, batch_size=batch_size, progress=lambda message: click.echo(message, err=True))
+    click.echo(f"Archived {totals['posts']} post(s) and {totals['comments']} comment(s).")
+
+
+@posts_cli.command('import')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--author', help='Username or email of the posts\' author (default: the first admin).')
+@click.option('--batch-size', default=1000, show_default=True, help='Posts per INSERT and transaction.')
+@click.option('--workers', type=int, help='Processes rendering markdown (default: one per CPU).')
+def posts_import(directory, author, batch_size, workers):
+    """Import the markdown files below DIRECTORY as posts.
+
+    Each file opens with a front matter block of `title:`, `date:` and
+    `tags:` lines between `---` lines; files without one are skipped.
+    """
+    import os
+    import time
+
+    from extensions import db
+    from models import User
+    from transfer import import_posts
+
+    query = db.select(User.id)
+    if author:
+        query = query.where(db.or_(User.username == author, User.email == author))
+    else:
+        query = query.where(User.role == 'admin').order_by(User.id).limit(1)
+    user_id = db.session.scalar(query)
+    if user_id is None:
+        raise click.ClickException(f'No user {author!r}.' if author else 'No admin user; pass --author.')
+
+    started = time.perf_counter()
+    totals = import_posts(directory, user_id, batch_size=batch_size, workers=workers or os.cpu_count() or 1,
+                          progress=lambda message: click.echo(message, err=True))
+    click.echo(f"Imported {totals['posts']} post(s), created {totals['tags']} tag(s), "
+               f"skipped {totals['skipped']} file(s) in {time.perf_counter() - started:.1f} s.")
+
+
+@posts_cli.command('export')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='File to write (default: stdout).')
+def posts_export(output):
+    """Write every tag, post and comment as JSON lines."""
+    from transfer import export_jsonl
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            counts = export_jsonl(handle)
+    else:
+        counts = export_jsonl(click.get_text_stream('stdout'))
+    click.echo(f"Exported {counts['tag']} tag(s), {counts['post']} post(s), {counts['comment']} comment(s).",
+               err=True)
+
+
+@mail_cli.command('worker')
+def mail_worker():
+    """Send queued mail until interrupted (for an always-on task)."""
+    from flask import current_app
+
+    from mailer import MailWorker
+
+    worker = MailWorker(current_app._get_current_object())
+    worker.start()
+    click.echo('Mail worker running; press Ctrl+C to stop.')
+    try:
+        while worker.is_alive():
+            worker.join(timeout=1)
+    except KeyboardInterrupt:
+        worker.stop()
+        worker.join()
+
+
+@mail_cli.command('flush')
+def mail_flush():
+    """Send every message that is currently due, then exit."""
+    from flask import current_app
+
+    from mailer import MailSender, deliver_batch
+
+    sender = MailSender.from_config(current_app.config)
+    totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+    try:
+        while True:
+            counts = deliver_batch(sender, current_app.config)
+            if not any(counts.values()):
+                break
+            for key, value in counts.items():
+                totals[key] += value
+    finally:
+        sender.close()
+    click.echo(f"Sent {totals['sent']}, retrying {totals['retrying']}, failed {totals['failed']}.")
+
+
+@mail_cli.command('stub-server')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8025, show_default=True)
+@click.option('--failure-rate', default=0.0, show_default=True, help='Fraction of sends answered with 503.')
+@click.option('--latency', default=0.0, show_default=True, help='Seconds to wait before each reply.')
+def mail_stub_server(host, port, failure_rate, latency):
+    """Run a local stand-in for the SMTP2GO API.
+
+    Point SMTP2GO_API_URL at http://HOST:PORT/v3/email/send to use it.
+    """
+    from mailer import run_stub_server
+
+    click.echo(f'SMTP2GO stub listening on http://{host}:{port}/v3/email/send')
+    run_stub_server(host, port, failure_rate, latency)
+
+
+@auth_cli.command('calibrate')
+@click.option('--target-ms', type=float, help='Latency budget per hash (default: BCRYPT_TARGET_MS).')
+def auth_calibrate(target_ms):
+    """Report the bcrypt cost this machine can afford."""
+    from flask import current_app
+
+    from hashing import calibrate_rounds
+
+    config = current_app.config
+    target_ms = target_ms or config['BCRYPT_TARGET_MS']
+    rounds = calibrate_rounds(target_ms, config['BCRYPT_MIN_ROUNDS'], config['BCRYPT_MAX_ROUNDS'])
+    click.echo(f'{rounds} rounds fit a {target_ms:g} ms budget '
+               f'(BCRYPT_LOG_ROUNDS: {config["BCRYPT_LOG_ROUNDS"] or "not set, calibrated on first hash"}).')
+
+
+@auth_cli.command('benchmark')
+@click.option('--concurrency', default=16, show_default=True, help='Simultaneous login requests.')
+@click.option('--requests', 'total', default=200, show_default=True, help='Total login requests.')
+def auth_benchmark(concurrency, total):
+    """Measure /login latency under concurrent load.
+
+    Creates a throwaway user, posts valid logins for it from CONCURRENCY
+    threads through the test client, then deletes the user.
+    """
+    import secrets
+    import time
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    from flask import current_app
+
+    from extensions import db
+    from hashing import password_hasher
+    from models import User
+
+    app = current_app._get_current_object()
+    email = f'bench-{secrets.token_hex(6)}@example.com'
+    password = secrets.token_urlsafe(12)
+    user = User(username=email, email=email, password=password_hasher.hash(password))
+    db.session.add(user)
+    db.session.commit()
+
+    def login(_):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/login', data={'email': email, 'password': password})
+        return time.perf_counter() - started, response.status_code
+
+    csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(login, range(total)))
+        elapsed = time.perf_counter() - started
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = csrf_enabled
+        db.session.delete(user)
+        db.session.commit()
+
+    statuses = Counter(status for _, status in results)
+    click.echo(f'bcrypt rounds: {password_hasher.rounds}, concurrency: {concurrency}, requests: {total}')
+    click.echo(f'throughput: {total / elapsed:.1f} req/s')
+    click.echo('status codes: ' + ', '.join(f'{code}={count}' for code, count in sorted(statuses.items())))
+    # Successful logins redirect; 503s are requests turned away by the full hashing queue
+    for label, wanted in (('logged in', {302}), ('all requests', None)):
+        latencies = [latency * 1000 for latency, status in results if wanted is None or status in wanted]
+        if latencies:
+            click.echo(f'{label}: p50 {_percentile(latencies, 50):.1f} ms, '
+                       f'p99 {_percentile(latencies, 99):.1f} ms')
+
+
+@check_cli.command('query-plans')
+@click.option('--app-db', is_flag=True, help='Explain against the configured database instead of seeded SQLite.')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not only failing ones.')
+def check_query_plans_command(app_db, verbose):
+    """Fail if a hot query's plan falls back to a table scan."""
+    from extensions import db
+    from query_plans import check_query_plans
+
+    results = check_query_plans(db.engine if app_db else None)
+    failures = 0
+    for name, (problems, lines) in results.items():
+        click.echo(f"{'FAIL' if problems else 'ok  '} {name}")
+        for problem in problems:
+            click.echo(f'       {problem}')
+        if problems or verbose:
+            for line in lines:
+                click.echo(f'       | {line}')
+        failures += bool(problems)
+
+    if failures:
+        raise click.ClickException(f'{failures} hot quer{"y" if failures == 1 else "ies"} without an index-backed plan.')
+
+
+@check_cli.command('query-budgets')
+@click.option('--verbose', '-v', is_flag=True, help='Print the statements of every request, not only failing ones.')
+def check_query_budgets_command(verbose):
+    """Fail if a route runs more SQL statements than its query budget.
+
+    Builds a second app on a temporary SQLite database seeded with a little
+    synthetic data, sends a request to every route with all caches cleared
+    and compares the statements each one runs with the budget declared by
+    @query_budget. The configured database is never touched.
+    """
+    import os
+    import tempfile
+
+    from app import create_app
+    from bench import seed_data
+    from extensions import db
+    from hashing import password_hasher
+    from query_budgets import check_query_budgets
+
+    handle, scratch_file = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{scratch_file}',
+            'SQLALCHEMY_ENGINE_OPTIONS': {},
+            'WTF_CSRF_ENABLED': False,
+            'MAIL_WORKER_IN_PROCESS': False,
+            'IMAGE_PROCESSING': 'inline',
+            'INSTRUMENTATION_ENABLED': True,
+            'CREATE_SCHEMA_ON_STARTUP': True,
+            'BCRYPT_LOG_ROUNDS': password_hasher.rounds,
+        })
+        with app.app_context():
+            seed_data(users=5, posts=30, comments=200, tags=5)
+        results = check_query_budgets(app)
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        os.remove(scratch_file)
+
+    failures = 0
+    for endpoint, method, path, status, statements, budget, problems in results:
+        request_line = f'{method} {path}' if method else '(not requested)'
+        click.echo(f"{'FAIL' if problems else 'ok  '} {endpoint:<22} {request_line:<40} "
+                   f"{statements if statements is not None else '-':>3} / {budget if budget is not None else '-'}")
+        for problem in problems:
+            for line in problem.splitlines():
+                click.echo(f'       {line}')
+        failures += bool(problems)
+
+    if failures:
+        raise click.ClickException(f'{failures} request{"" if failures == 1 else "s"} failed the query budget check.')
+
+
+@search_cli.command('rebuild')
+def search_rebuild():
+    """Create the full-text index if needed and re-index every post."""
+    from extensions import db
+    from search import get_search_index
+
+    search_index = get_search_index()
+    search_index.create()
+    search_index.rebuild()
+    db.session.commit()
+    click.echo('Search index rebuilt.')
+
+
+@search_cli.command('benchmark')
+@click.option('--posts', default=100_000, show_default=True, help='Synthetic posts to index.')
+@click.option('--queries', default=200, show_default=True, help='Searches timed through the index.')
+@click.option('--like-queries', default=20, show_default=True, help="Searches timed as LIKE '%term%' scans.")
+@click.option('--database-url', help='Empty scratch database to use instead of a temporary SQLite file.')
+def search_benchmark(posts, queries, like_queries, database_url):
+    """Compare indexed search with LIKE scans over many posts.
+
+    Fills a scratch database with POSTS synthetic posts (words drawn from a
+    Zipf-like vocabulary, so some terms are common and most are rare), builds
+    the full-text index and times single-word searches both ways. The
+    configured database is never touched.
+    """
+    import itertools
+    import os
+    import random
+    import tempfile
+    import time
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import create_engine, insert, text
+
+    from extensions import db
+    from models import Post, User
+    from search import get_search_index
+
+    scratch_file = None
+    if database_url is None:
+        handle, scratch_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{scratch_file}'
+    engine = create_engine(database_url)
+    search_index = get_search_index(engine.dialect.name)
+
+    rng = random.Random(311)
+    vocabulary = [f'word{i}' for i in range(5000)]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    start = datetime(2020, 1, 1)
+    try:
+        db.metadata.create_all(engine)
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@example.com',
+                                               'password': 'x', 'role': 'admin'}])
+            for first in range(1, posts + 1, 5000):
+                connection.execute(insert(Post), [
+                    {'id': i, 'title': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=6)),
+                     'content': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=80)),
+                     'date': start + timedelta(minutes=i), 'user_id': 1}
+                    for i in range(first, min(first + 5000, posts + 1))
+                ])
+        click.echo(f'Inserted {posts} posts in {time.perf_counter() - started:.1f} s')
+
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            search_index.create(connection)
+            search_index.rebuild(connection)
+        click.echo(f'Built the {engine.dialect.name} full-text index in {time.perf_counter() - started:.1f} s')
+
+        # Words outside the most common few hundred, like most real searches
+        terms = [rng.choice(vocabulary[200:]) for _ in range(max(queries, like_queries))]
+        like = text('SELECT id FROM posts WHERE title LIKE :pattern OR content LIKE :pattern'
+                    ' ORDER BY date DESC LIMIT 11')
+        with engine.connect() as connection:
+            indexed = []
+            for term in terms[:queries]:
+                started = time.perf_counter()
+                search_index.search(term, executor=connection)
+                indexed.append((time.perf_counter() - started) * 1000)
+            scanned = []
+            for term in terms[:like_queries]:
+                started = time.perf_counter()
+                connection.execute(like, {'pattern': f'%{term}%'}).all()
+                scanned.append((time.perf_counter() - started) * 1000)
+    finally:
+        engine.dispose()
+        if scratch_file:
+            os.remove(scratch_file)
+
+    for label, latencies in (('full-text index', indexed), ('LIKE scan', scanned)):
+        if latencies:
+            click.echo(f'{label}: {len(latencies)} searches, p50 {_percentile(latencies, 50):.1f} ms, '
+                       f'p99 {_percentile(latencies, 99):.1f} ms')
+
+
+@bench_cli.command('seed')
+@click.option('--users', default=200, show_default=True, help='Users to create.')
+@click.option('--posts', default=10_000, show_default=True, help='Posts to create.')
+@click.option('--comments', default=100_000, show_default=True, help='Comments to create across all posts.')
+@click.option('--tags', default=50, show_default=True, help='Tags to create.')
+@click.option('--batch-size', default=10_000, show_default=True, help='Rows per INSERT and transaction.')
+@click.option('--seed', default=311, show_default=True, help='Random seed.')
+def bench_seed(users, posts, comments, tags, batch_size, seed):
+    """Fill an empty database with synthetic users, posts, comments and tags.
+
+    Point DATABASE_URL at a scratch database first; seeding refuses to touch
+    a database that already has users or posts.
+    """
+    import time
+
+    from bench import seed_data
+
+    started = time.perf_counter()
+    try:
+        counts = seed_data(users=users, posts=posts, comments=comments, tags=tags, batch_size=batch_size,
+                           seed=seed, progress=click.echo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'Seeded {counts} in {time.perf_counter() - started:.1f} s')
+
+
+@bench_cli.command('run')
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(['sip', 'login', 'comment', 'contact']),
+              help='Scenario to run (repeatable); defaults to all.')
+@click.option('--requests', 'total', default=200, show_default=True, help='Requests per scenario.')
+@click.option('--concurrency', default=8, show_default=True, help='Requests in flight at once.')
+@click.option('--transport', type=click.Choice(['client', 'wsgi']), default='client', show_default=True,
+              help='Flask test client, or HTTP to a local threaded WSGI server.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Write the JSON report here.')
+def bench_run(scenarios, total, concurrency, transport, output):
+    """Load-test /sip, /login, commenting and /contact and report JSON.
+
+    Reports throughput, p50/p95/p99 latency, status codes and database
+    queries per request for each scenario. Mail from /contact goes to a
+    local stub of the SMTP2GO API. Run against a database filled by
+    `flask bench seed`; the comment and contact scenarios write to it.
+    """
+    import json
+
+    from flask import current_app
+
+    from bench import SCENARIOS, run_benchmark
+
+    try:
+        report = run_benchmark(current_app._get_current_object(), scenarios or tuple(SCENARIOS), total,
+                               concurrency, transport)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as handle:
+            handle.write(text + '\n')
+        click.echo(f'Wrote {output}')
+    else:
+        click.echo(text)
+
+
+@assets_cli.command('build')
+@click.option('--prune', is_flag=True, help='Delete built files the new manifest no longer uses.')
+def assets_build(prune):
+    """Write fingerprinted, precompressed copies of the static assets.
+
+    Restart the web app afterwards so workers load the new manifest.
+    """
+    from flask import current_app
+
+    from assets import build_assets
+
+    manifest = build_assets(current_app.static_folder, prune=prune)
+    for source, built in sorted(manifest.items()):
+        click.echo(f'{source} -> {built}')
+    click.echo(f'Built {len(manifest)} asset(s).')
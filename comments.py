@@ -0,0 +1,201 @@
+"""Threaded comment loading for SIP311 Project Blog.
+
+Comments form trees through ``Comment.parent_id``. Walking ``comment.replies``
+recursively would cost one query per node, so trees are instead fetched as flat
+rows and linked together in Python in a single O(n) pass by
+:func:`build_comment_tree`.
+
+:func:`load_comment_threads` fetches a page of threads (the top-level comments
+of a post, or the direct replies to one comment) together with all their
+replies down to ``COMMENT_MAX_DEPTH`` in one recursive CTE query. Comments at
+the depth limit that have further replies are flagged so the page can offer a
+"load more replies" link, which loads the next level of the tree from that
+comment.
+"""
+
+from sqlalchemy import literal, select
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from pagination import decode_cursor, encode_cursor
+
+
+class CommentNode:
+    """One comment in an assembled thread.
+
+    Attributes:
+        id: Integer, comment ID.
+        parent_id: Integer, ID of the parent comment, or None.
+        post_id: Integer, ID of the post commented on.
+        content: String, comment text.
+        date: DateTime, comment date.
+        is_hidden: Boolean, True if hidden by a moderator.
+        username: String, author's username.
+        depth: Integer, levels below the root of its thread (0 for roots).
+        has_more_replies: Boolean, True if replies exist that were not loaded.
+        children: List of CommentNode, loaded replies, oldest first.
+    """
+
+    def __init__(self, id, parent_id, post_id, content, date, is_hidden, username,
+                 has_more_replies=False):
+        self.id = id
+        self.parent_id = parent_id
+        self.post_id = post_id
+        self.content = content
+        self.date = date
+        self.is_hidden = bool(is_hidden)
+        self.username = username
+        self.depth = 0
+        self.has_more_replies = bool(has_more_replies)
+        self.children = []
+
+    @property
+    def shown(self):
+        """True unless the comment is hidden and has no replies to hold in place."""
+        return not self.is_hidden or bool(self.children) or self.has_more_replies
+
+    def to_dict(self):
+        """Return the comment and its loaded replies as JSON-ready data.
+
+        Hidden comments keep their place in the thread but lose their content
+        and author.
+        """
+        return {
+            'id': self.id,
+            'parent_id': self.parent_id,
+            'post_id': self.post_id,
+            'content': None if self.is_hidden else self.content,
+            'author': None if self.is_hidden else self.username,
+            'date': self.date.isoformat(),
+            'is_hidden': self.is_hidden,
+            'has_more_replies': self.has_more_replies,
+            'replies': [child.to_dict() for child in self.children if child.shown],
+        }
+
+
+class CommentThreadPage:
+    """A page of comment threads.
+
+    Attributes:
+        threads: List of CommentNode, root comments of the page with their
+            replies attached.
+        next_cursor: String, cursor for the next page of threads, or None.
+    """
+
+    def __init__(self, threads, next_cursor=None):
+        self.threads = threads
+        self.next_cursor = next_cursor
+
+
+def build_comment_tree(rows, max_depth=None):
+    """Link flat comment rows into trees in a single pass.
+
+    Rows whose parent is not among ``rows`` become roots. Roots and replies
+    keep the order of ``rows``; pass rows sorted by ``(date, id)`` for
+    chronological threads.
+
+    Args:
+        rows: Iterable of objects with ``id``, ``parent_id``, ``post_id``,
+            ``content``, ``date``, ``is_hidden`` and either ``username`` or
+            ``author.username``.
+        max_depth: Integer, deepest level to keep; replies below it are
+            dropped and their parent is flagged ``has_more_replies``.
+
+    Returns:
+        list: Root CommentNode objects.
+    """
+    nodes = {}
+    for row in rows:
+        username = row.username if hasattr(row, 'username') else row.author.username
+        nodes[row.id] = CommentNode(
+            row.id, row.parent_id, row.post_id, row.content, row.date, row.is_hidden, username,
+            has_more_replies=getattr(row, 'has_more_replies', False),
+        )
+
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.parent_id)
+        if parent is None:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+
+    stack = [(root, 0) for root in roots]
+    while stack:
+        node, depth = stack.pop()
+        node.depth = depth
+        if max_depth is not None and depth >= max_depth and node.children:
+            node.children = []
+            node.has_more_replies = True
+        stack.extend((child, depth + 1) for child in node.children)
+    return roots
+
+
+def load_comment_threads(post_id=None, parent_id=None, page_size=20, after=None, max_depth=3):
+    """Load one page of comment threads with their replies in a single query.
+
+    Exactly one of ``post_id`` (top-level comments of a post) or
+    ``parent_id`` (direct replies to a comment) selects the thread roots.
+    Roots are paginated oldest first with a ``(date, id)`` cursor; replies are
+    loaded ``max_depth`` levels below them.
+
+    Args:
+        post_id: Integer, post whose top-level threads to load.
+        parent_id: Integer, comment whose replies to load.
+        page_size: Integer, maximum root comments per page.
+        after: String, cursor; return roots newer than it.
+        max_depth: Integer, levels of replies to load below the roots.
+
+    Returns:
+        CommentThreadPage: The threads and a cursor for the next page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    from models import Comment, User
+
+    if (post_id is None) == (parent_id is None):
+        raise ValueError('Pass exactly one of post_id or parent_id')
+
+    roots = select(Comment.id, Comment.date, literal(0).label('depth'))
+    if post_id is not None:
+        roots = roots.where(Comment.post_id == post_id, Comment.parent_id.is_(None))
+    else:
+        roots = roots.where(Comment.parent_id == parent_id)
+    if after:
+        date, comment_id = decode_cursor(after)
+        roots = roots.where(Comment.date >= date, db.or_(Comment.date > date, Comment.id > comment_id))
+    # One extra root tells us whether another page exists
+    roots = roots.order_by(Comment.date, Comment.id).limit(page_size + 1).subquery('roots')
+
+    tree = select(roots.c.id, roots.c.depth).cte('comment_tree', recursive=True)
+    reply = aliased(Comment)
+    tree = tree.union_all(
+        select(reply.id, tree.c.depth + 1)
+        .join(tree, reply.parent_id == tree.c.id)
+        .where(tree.c.depth < max_depth)
+    )
+
+    child = aliased(Comment)
+    has_replies = select(child.id).where(child.parent_id == Comment.id).exists()
+    rows = db.session.execute(
+        select(Comment.id, Comment.parent_id, Comment.post_id, Comment.content, Comment.date,
+               Comment.is_hidden, User.username, tree.c.depth,
+               db.and_(tree.c.depth >= max_depth, has_replies).label('has_more_replies'))
+        .join(tree, tree.c.id == Comment.id)
+        .join(User, User.id == Comment.user_id)
+        .order_by(Comment.date, Comment.id)
+    ).all()
+
+    # Rows at depth 0 are the page's roots; drop the extra one and its replies
+    root_rows = [row for row in rows if row.depth == 0]
+    next_cursor = None
+    if len(root_rows) > page_size:
+        last_root = root_rows[page_size - 1]
+        next_cursor = encode_cursor(last_root.date, last_root.id)
+        extra_root_id = root_rows[page_size].id
+    else:
+        extra_root_id = None
+
+    threads = [root for root in build_comment_tree(rows) if root.id != extra_root_id]
+    return CommentThreadPage(threads, next_cursor)
@@ -0,0 +1,107 @@
+"""HTTP response compression for SIP311 Project Blog.
+
+:class:`Compressor` compresses text responses larger than
+``COMPRESS_MIN_SIZE`` bytes with Brotli or gzip, whichever the client prefers
+among those available. Brotli needs the optional ``brotli`` package; without
+it only gzip is offered.
+
+Responses that are already encoded (the precompressed static pages and
+assets), streamed, partial or marked ``no-transform`` are left alone. ETags
+of compressed responses are made weak, so the validators the routes compute
+from their content keep matching whatever encoding was sent.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip only without it
+    brotli = None
+
+from flask import current_app, request
+
+# Content types worth compressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = frozenset({
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'text/xml', 'text/csv',
+    'application/javascript', 'application/json', 'application/xml', 'application/atom+xml',
+    'image/svg+xml',
+})
+
+
+def available_encodings():
+    """Return the encodings this server can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with a content coding.
+
+    Args:
+        data: Bytes, the body to compress.
+        encoding: String, 'br' or 'gzip'.
+        level: Integer, Brotli quality (0-11) or gzip level (1-9); defaults
+            to a fast setting suited to per-request compression.
+
+    Returns:
+        bytes: Compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    # mtime=0 keeps the output, and so any ETag derived from it, deterministic
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def negotiate_encoding(accept_encodings, encodings=None):
+    """Pick the content coding to answer a request with.
+
+    Args:
+        accept_encodings: werkzeug Accept, the request's ``Accept-Encoding``.
+        encodings: Iterable of String, codings on offer, most preferred
+            first; defaults to :func:`available_encodings`.
+
+    Returns:
+        str: The chosen coding, or None to send the body as it is.
+    """
+    # Quality ties go to the first of ``encodings``, the smaller output
+    return accept_encodings.best_match(tuple(encodings or available_encodings()))
+
+
+class Compressor:
+    """Flask extension compressing responses on the way out."""
+
+    def init_app(self, app):
+        """Install the response hook unless ``COMPRESS_ENABLED`` is off.
+
+        Args:
+            app: Flask, the application.
+        """
+        app.extensions['compressor'] = self
+        if app.config.get('COMPRESS_ENABLED', True):
+            app.after_request(self._compress)
+
+    @staticmethod
+    def _compress(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.content_encoding = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compressor = Compressor()
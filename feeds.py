@@ -0,0 +1,89 @@
+"""Atom feed and JSON API serializers for SIP311 Project Blog.
+
+Both are built from the HTML stored with each post at write time
+(``Post.content_html``), so serving them never runs the markdown engine. The
+routes cache the serialized documents per blog version; see
+``caching.document_response``.
+"""
+
+from datetime import UTC
+from urllib.parse import urlsplit
+
+from flask import render_template, url_for
+
+from pagination import encode_cursor
+
+
+def _utc(value):
+    """Return a naive UTC datetime as an RFC 3339 string, or None."""
+    if value is None:
+        return None
+    return value.replace(tzinfo=UTC, microsecond=0).isoformat().replace('+00:00', 'Z')
+
+
+def post_url(post, external=True):
+    """Return the URL of the blog page that starts with ``post``.
+
+    Posts have no page of their own; this links to the listing page whose
+    first card is the post, anchored on it.
+
+    Args:
+        post: Post, or anything else with its ``id`` and ``date``, such as a
+            ``SearchHit``.
+        external: Boolean, return an absolute URL.
+
+    Returns:
+        str: The URL.
+    """
+    # The cursor sorts just above the post, so the page begins with it
+    return url_for('main.sip', before=encode_cursor(post.date, post.id + 1), _anchor=f'post{post.id}',
+                   _external=external)
+
+
+def post_to_dict(post):
+    """Serialize a post loaded with ``Post.listing_query()`` for the JSON API.
+
+    Args:
+        post: Post, the post.
+
+    Returns:
+        dict: JSON-ready representation of the post.
+    """
+    return {
+        'id': post.id,
+        'title': post.title,
+        'url': post_url(post),
+        'author': post.author.username,
+        'published': _utc(post.date),
+        'updated': _utc(post.updated_at or post.date),
+        'tags': [tag.name for tag in post.tags],
+        'content_html': post.content_html,
+        'image_url': (url_for('static', filename=f'images/{post.image_path}', _external=True)
+                      if post.image_path else None),
+        'comment_count': post.visible_comment_count,
+    }
+
+
+def render_atom_feed(posts, updated):
+    """Render the Atom feed of the newest posts.
+
+    Args:
+        posts: List of Post, loaded with ``Post.listing_query()``, newest first.
+        updated: DateTime, time the blog last changed (UTC), or None.
+
+    Returns:
+        str: Atom XML document.
+    """
+    # Entry ids are tag URIs (RFC 4151), which stay the same if URLs change
+    authority = urlsplit(url_for('main.index', _external=True)).hostname
+    entries = [{
+        'id': f'tag:{authority},{post.date:%Y-%m-%d}:post/{post.id}',
+        'title': post.title,
+        'url': post_url(post),
+        'author': post.author.username,
+        'published': _utc(post.date),
+        'updated': _utc(post.updated_at or post.date),
+        'tags': [tag.name for tag in post.tags],
+        'content_html': post.content_html,
+    } for post in posts]
+    return render_template('feed.xml', entries=entries, updated=_utc(updated) or '1970-01-01T00:00:00Z')
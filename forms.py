@@ -1,7 +1,10 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileAllowed
+from wtforms.fields.choices import SelectField
 from wtforms.fields.simple import FileField, PasswordField, StringField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, Email, EqualTo
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
+
+from images import EXTENSIONS, is_image
 
 
 class RegisterForm(FlaskForm):
@@ -24,11 +27,27 @@ class PostForm(FlaskForm):
     """Form for creating blog posts."""
     title = StringField('Title', validators=[DataRequired()])
     content = TextAreaField('Content (Markdown)', validators=[DataRequired()])
-    image = FileField('Image', validators=[FileAllowed(['jpg', 'png'])])
+    tags = StringField('Tags')
+    image = FileField('Image', validators=[FileAllowed([extension[1:] for extension in EXTENSIONS])])
     submit = SubmitField('Submit')
 
+    def validate_image(self, field):
+        """Reject uploads that aren't readable images, whatever their extension."""
+        if field.data and field.data.filename and not is_image(field.data.stream):
+            raise ValidationError('The file is not a valid JPEG or PNG image.')
+
 
 class CommentForm(FlaskForm):
     """Form for adding comments."""
     content = TextAreaField('Comment', validators=[DataRequired()])
     submit = SubmitField('Submit')
+
+
+class ModerationForm(FlaskForm):
+    """Form for bulk comment moderation; the ticked ids are read from the request."""
+    action = SelectField('Action', choices=[('hide', 'Hide'), ('show', 'Show'), ('delete', 'Delete')],
+                         validators=[DataRequired()])
+    scope = SelectField('Apply to', choices=[('selected', 'Selected comments'),
+                                             ('matching', 'All comments matching the filters')],
+                        validators=[DataRequired()])
+    submit = SubmitField('Apply')
@@ -0,0 +1,165 @@
+"""Password hashing service for SIP311 Project Blog.
+
+bcrypt is deliberately slow, and a burst of logins hashed on the request
+threads can starve every other route of CPU. The ``PasswordHasher`` runs
+hashes on a small, bounded thread pool (bcrypt releases the GIL while
+hashing) and refuses new work once too many hashes are waiting, so a login
+burst degrades into quick "busy" responses instead of a stalled site.
+
+The bcrypt cost is calibrated to the largest work factor that stays within
+``BCRYPT_TARGET_MS`` on the current machine, unless ``BCRYPT_LOG_ROUNDS``
+pins it. Calibration takes a few hashes' time, so it runs on a worker's first
+hash rather than at startup, keeping it off pages that never hash. Hashes made
+with a lower cost are upgraded the next time their owner logs in.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from extensions import bcrypt
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; the client should retry later."""
+
+
+class PasswordHasher:
+    """Bounded, calibrated front end to Flask-Bcrypt.
+
+    Attributes:
+        rounds: Integer, bcrypt log rounds used for new hashes.
+    """
+
+    def __init__(self, app=None):
+        self._rounds = None
+        self._config = None
+        self._calibration_lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._timeout = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Start the hashing pool.
+
+        Must run after ``bcrypt.init_app(app)``. Building another app (tests,
+        some CLI commands) shuts the previous pool down; hashes already
+        submitted to it still finish.
+
+        Args:
+            app: Flask, the application.
+        """
+        config = app.config
+        self._config = config
+        self._rounds = config.get('BCRYPT_LOG_ROUNDS')
+
+        workers = config['HASH_WORKERS']
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + config['HASH_MAX_PENDING'])
+        self._timeout = config['HASH_TIMEOUT_SECONDS']
+        app.extensions['password_hasher'] = self
+
+    @property
+    def rounds(self):
+        if self._rounds is None:
+            with self._calibration_lock:
+                if self._rounds is None:
+                    config = self._config
+                    rounds = calibrate_rounds(
+                        config['BCRYPT_TARGET_MS'], config['BCRYPT_MIN_ROUNDS'], config['BCRYPT_MAX_ROUNDS']
+                    )
+                    config['BCRYPT_LOG_ROUNDS'] = rounds
+                    self._rounds = rounds
+        return self._rounds
+
+    def _run(self, function, *args):
+        # Kept local: init_app may swap in a new pool before this hash finishes
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self._timeout)
+        except FuturesTimeout:
+            # The hash finishes in the background and frees its slot then
+            raise HashingBusy()
+
+    def hash(self, password):
+        """Hash a password at the current work factor.
+
+        Args:
+            password: String, plain-text password.
+
+        Returns:
+            str: bcrypt hash.
+
+        Raises:
+            HashingBusy: If the hashing queue is full or the hash takes
+                longer than ``HASH_TIMEOUT_SECONDS``.
+        """
+        # The cost is passed explicitly; Flask-Bcrypt's own default is never used
+        return self._run(bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash.
+
+        Args:
+            password_hash: String, stored bcrypt hash.
+            password: String, plain-text password to check.
+
+        Returns:
+            bool: True if the password matches.
+
+        Raises:
+            HashingBusy: If the hashing queue is full or the check takes
+                longer than ``HASH_TIMEOUT_SECONDS``.
+        """
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Return True if ``password_hash`` uses a lower cost than current."""
+        try:
+            return int(password_hash.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+def calibrate_rounds(target_ms, min_rounds=10, max_rounds=14, samples=3):
+    """Find the largest bcrypt cost whose hash time stays within ``target_ms``.
+
+    Each extra round doubles the work, so the cost is measured once at
+    ``min_rounds`` and extrapolated from there.
+
+    Args:
+        target_ms: Number, latency budget for one hash in milliseconds.
+        min_rounds: Integer, lowest cost ever chosen.
+        max_rounds: Integer, highest cost ever chosen.
+        samples: Integer, timed hashes at ``min_rounds`` (the fastest is used).
+
+    Returns:
+        int: bcrypt log rounds.
+    """
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.generate_password_hash('calibration-password', min_rounds)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    base_ms = min(timings)
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,242 @@
+"""Image upload pipeline for SIP311 Project Blog.
+
+Uploaded post images are streamed to ``static/images`` under a name derived
+from their SHA-256 digest, so identical uploads are stored once and different
+uploads can never overwrite each other. Resized width variants and WebP copies
+are then generated off the request (see ``IMAGE_PROCESSING``): in a worker
+process in development, and by a scheduled ``flask posts process-images`` in
+production. Their dimensions are recorded on the posts using the image so
+templates can emit ``srcset``, ``width`` and ``height`` attributes; until then
+cards show the original alone.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Canonical file extension for each accepted upload extension; PostForm
+# accepts exactly these
+EXTENSIONS = {'.jpg': '.jpg', '.jpeg': '.jpg', '.png': '.png'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def image_dir(app):
+    """Return the directory post images are stored in."""
+    return os.path.join(app.root_path, 'static', 'images')
+
+
+def is_image(stream):
+    """Return True if ``stream`` holds an image Pillow can decode.
+
+    The stream is rewound afterwards, ready to be saved.
+
+    Args:
+        stream: File object, the uploaded data.
+
+    Returns:
+        bool: True for a readable image.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(stream) as image:
+            image.verify()
+        return True
+    except Exception:
+        # Pillow raises a variety of errors (OSError, SyntaxError, ...) for bad data
+        return False
+    finally:
+        stream.seek(0)
+
+
+def save_upload(file_storage, directory):
+    """Stream an uploaded image to disk under a content-hash name.
+
+    Args:
+        file_storage: FileStorage, the uploaded file, already checked by
+            ``PostForm`` to have one of the :data:`EXTENSIONS`.
+        directory: String, directory to store the image in.
+
+    Returns:
+        tuple: ``(filename, is_new)``; ``is_new`` is False if an identical
+        image was already stored.
+    """
+    extension = EXTENSIONS[os.path.splitext(file_storage.filename)[1].lower()]
+
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while chunk := file_storage.stream.read(CHUNK_SIZE):
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        filename = f'{digest.hexdigest()[:24]}{extension}'
+        final_path = os.path.join(directory, filename)
+        if os.path.exists(final_path):
+            return filename, False
+        os.replace(temp_path, final_path)
+        return filename, True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def generate_variants(directory, filename, widths, quality=82):
+    """Write resized and WebP variants of an image.
+
+    May run in a worker process, so it only takes and returns plain data.
+    Widths at or above the original's are skipped; the original itself is
+    included in the result as the largest fallback.
+
+    Args:
+        directory: String, directory holding the image.
+        filename: String, name of the original image.
+        widths: Iterable of Integer, target widths in pixels.
+        quality: Integer, JPEG/WebP encoder quality.
+
+    Returns:
+        dict: ``width`` and ``height`` of the original and a ``variants``
+        list of ``{'filename', 'width', 'height', 'format'}`` dicts.
+    """
+    from PIL import Image, ImageOps
+
+    stem, extension = os.path.splitext(filename)
+    with Image.open(os.path.join(directory, filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        source_format = 'jpeg' if extension == '.jpg' else 'png'
+        variants = [{'filename': filename, 'width': width, 'height': height, 'format': source_format}]
+
+        targets = sorted({w for w in widths if w < width}) + [width]
+        for target in targets:
+            target_height = round(height * target / width)
+            resized = image if target == width else image.resize((target, target_height), Image.LANCZOS)
+
+            if target != width:
+                name = f'{stem}-{target}w{extension}'
+                if source_format == 'jpeg':
+                    resized.convert('RGB').save(os.path.join(directory, name), 'JPEG', quality=quality,
+                                                optimize=True, progressive=True)
+                else:
+                    resized.save(os.path.join(directory, name), 'PNG', optimize=True)
+                variants.append({'filename': name, 'width': target, 'height': target_height,
+                                 'format': source_format})
+
+            webp_name = f'{stem}-{target}w.webp'
+            resized.save(os.path.join(directory, webp_name), 'WEBP', quality=quality, method=6)
+            variants.append({'filename': webp_name, 'width': target, 'height': target_height,
+                             'format': 'webp'})
+
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def record_variants(filename, result):
+    """Store variant metadata on every post using ``filename``.
+
+    Bumps the posts' revisions so cached cards pick up the new markup.
+
+    Args:
+        filename: String, original image filename.
+        result: Dict, return value of :func:`generate_variants`.
+
+    Returns:
+        list: IDs of the posts updated.
+    """
+    from caching import post_card_cache
+    from models import Post
+
+    post_ids = db.session.scalars(db.select(Post.id).where(Post.image_path == filename)).all()
+    if post_ids:
+        db.session.execute(
+            db.update(Post)
+            .where(Post.id.in_(post_ids))
+            .values(image_width=result['width'], image_height=result['height'],
+                    image_variants=json.dumps(result['variants']), revision=Post.revision + 1)
+        )
+        db.session.commit()
+        for post_id in post_ids:
+            post_card_cache.invalidate(post_id)
+    return post_ids
+
+
+def copy_known_variants(post, filename):
+    """Reuse variant metadata from another post with the same image.
+
+    Args:
+        post: Post, post being saved.
+        filename: String, content-hash image filename.
+
+    Returns:
+        bool: True if metadata was found and copied.
+    """
+    from models import Post
+
+    with db.session.no_autoflush:
+        known = (Post.query
+                 .filter(Post.image_path == filename, Post.image_variants.isnot(None))
+                 .with_entities(Post.image_width, Post.image_height, Post.image_variants)
+                 .first())
+    if known is None:
+        return False
+    post.image_width, post.image_height, post.image_variants = known
+    return True
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=1)
+        return _executor
+
+
+def process_image(app, filename):
+    """Generate variants for ``filename`` and record them, per ``IMAGE_PROCESSING``.
+
+    With 'background' the work runs in a worker process and this returns at
+    once; the result is recorded from a callback. With 'inline' it runs here.
+    With 'task' nothing happens now: a scheduled ``flask posts
+    process-images`` picks the image up. Failures are logged, never raised, as
+    the post using the image is already saved.
+
+    Args:
+        app: Flask, the application (``current_app._get_current_object()``).
+        filename: String, content-hash image filename.
+    """
+    args = (image_dir(app), filename, app.config['IMAGE_VARIANT_WIDTHS'])
+    mode = app.config['IMAGE_PROCESSING']
+
+    if mode == 'task':
+        return
+    if mode == 'inline':
+        try:
+            record_variants(filename, generate_variants(*args))
+        except Exception:
+            logger.exception('Generating variants for %s failed', filename)
+            db.session.rollback()
+        return
+
+    def on_done(future):
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception('Generating variants for %s failed', filename)
+            return
+        with app.app_context():
+            record_variants(filename, result)
+
+    _get_executor().submit(generate_variants, *args).add_done_callback(on_done)
@@ -0,0 +1,387 @@
+"""Outbound mail queue for SIP311 Project Blog.
+
+Web requests never talk to SMTP2GO directly. They add an ``OutboundMail`` row
+with :func:`enqueue_mail` and return immediately. In production a
+PythonAnywhere task sends them: ``flask mail worker`` as an always-on task, or
+``flask mail flush`` as a scheduled task that drains the queue and exits. In
+development a :class:`MailWorker` thread runs inside the web process
+(``MAIL_WORKER_IN_PROCESS``). Either way due messages are claimed in batches
+and sent over one pooled, keep-alive HTTP session. Failures are retried with
+exponential backoff until ``MAIL_MAX_ATTEMPTS`` is reached.
+
+SMTP2GO's ``/email/send`` endpoint accepts one message per call, so a batch is
+a run of requests over the same connection rather than a single API call.
+
+:func:`run_stub_server` starts a local stand-in for the SMTP2GO API with
+configurable latency and failure rate, for testing without the network.
+"""
+
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying; any other 4xx means the message itself was rejected
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class PermanentMailError(Exception):
+    """Raised when the mail API rejects a message in a way retrying won't fix."""
+
+
+def enqueue_mail(sender, recipients, subject, text_body):
+    """Queue a message for delivery.
+
+    The message is added to the current session; the caller commits it.
+
+    Args:
+        sender: String, sender address.
+        recipients: List of String, recipient addresses.
+        subject: String, message subject.
+        text_body: String, plain-text message body.
+
+    Returns:
+        OutboundMail: The queued message.
+    """
+    from models import OutboundMail
+
+    mail = OutboundMail(
+        sender=sender,
+        recipients=json.dumps(list(recipients)),
+        subject=subject,
+        text_body=text_body,
+    )
+    db.session.add(mail)
+    return mail
+
+
+class MailSender:
+    """Sends queued messages to the SMTP2GO API over a pooled HTTP session.
+
+    Attributes:
+        api_url: String, SMTP2GO send endpoint.
+        api_key: String, SMTP2GO API key.
+        timeout: Tuple, (connect, read) timeouts in seconds.
+    """
+
+    def __init__(self, api_url, api_key, timeout=(5, 15), pool_size=4):
+        # requests is only needed once mail is sent, so web workers import it on first use
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a sender from the application config."""
+        return cls(
+            config['SMTP2GO_API_URL'],
+            config['SMTP2GO_API_KEY'],
+            timeout=(config['MAIL_CONNECT_TIMEOUT'], config['MAIL_READ_TIMEOUT']),
+        )
+
+    def send(self, mail):
+        """Send one message.
+
+        Args:
+            mail: OutboundMail, message to send.
+
+        Raises:
+            PermanentMailError: If the API rejected the message or any of its
+                recipients.
+            requests.RequestException: On timeouts, connection and retryable
+                HTTP errors.
+        """
+        payload = {
+            'api_key': self.api_key,
+            'sender': mail.sender,
+            'to': json.loads(mail.recipients),
+            'subject': mail.subject,
+            'text_body': mail.text_body,
+        }
+        response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        if response.status_code >= 400 and response.status_code not in RETRYABLE_STATUS_CODES:
+            raise PermanentMailError(f'{response.status_code}: {response.text[:500]}')
+        response.raise_for_status()
+
+        # SMTP2GO answers 200 even when it refuses recipients; the body says how many.
+        # Retrying would resend to the ones that were accepted, so the failure is final.
+        try:
+            data = response.json().get('data') or {}
+        except (ValueError, AttributeError):
+            data = {}
+        if data.get('failed'):
+            raise PermanentMailError(f"{data['failed']} recipient(s) refused: {str(data.get('failures'))[:500]}")
+
+    def close(self):
+        self.session.close()
+
+
+def retry_delay(attempts, base_seconds, max_seconds):
+    """Return the backoff before the next attempt, with jitter.
+
+    Args:
+        attempts: Integer, attempts made so far (at least 1).
+        base_seconds: Number, delay after the first failure.
+        max_seconds: Number, upper bound on the delay.
+
+    Returns:
+        float: Delay in seconds.
+    """
+    delay = min(max_seconds, base_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_stale_seconds(config):
+    """Return the age after which another worker may take over a claim.
+
+    Twice the longest a whole batch can take when every message times out, so
+    a live worker's claim is never taken over mid-batch.
+
+    Args:
+        config: Mapping, application config.
+
+    Returns:
+        float: Seconds.
+    """
+    return 2 * config['MAIL_BATCH_SIZE'] * (config['MAIL_CONNECT_TIMEOUT'] + config['MAIL_READ_TIMEOUT'])
+
+
+def claim_batch(batch_size, stale_after_seconds):
+    """Claim up to ``batch_size`` due messages for this worker.
+
+    Claims are taken with a conditional ``UPDATE`` so concurrent workers never
+    send the same message. Claims older than ``stale_after_seconds`` (from a
+    worker that died mid-batch) can be taken over.
+
+    Args:
+        batch_size: Integer, maximum messages to claim.
+        stale_after_seconds: Number, age after which a claim is abandoned;
+            see :func:`claim_stale_seconds`.
+
+    Returns:
+        list: Claimed OutboundMail rows.
+    """
+    from models import OutboundMail
+
+    now = datetime.now(UTC)
+    claimable = db.and_(
+        OutboundMail.status == 'pending',
+        OutboundMail.next_attempt_at <= now,
+        db.or_(OutboundMail.claim_token.is_(None),
+               OutboundMail.claimed_at < now - timedelta(seconds=stale_after_seconds)),
+    )
+    ids = db.session.scalars(
+        db.select(OutboundMail.id).where(claimable)
+        .order_by(OutboundMail.next_attempt_at, OutboundMail.id).limit(batch_size)
+    ).all()
+    if not ids:
+        return []
+
+    token = secrets.token_hex(16)
+    db.session.execute(
+        db.update(OutboundMail)
+        .where(OutboundMail.id.in_(ids), claimable)
+        .values(claim_token=token, claimed_at=now)
+    )
+    db.session.commit()
+    return OutboundMail.query.filter_by(claim_token=token).order_by(OutboundMail.id).all()
+
+
+def deliver_batch(sender, config):
+    """Claim and send one batch of due messages.
+
+    Args:
+        sender: MailSender, sender to use.
+        config: Mapping, application config.
+
+    Returns:
+        dict: Counts of messages 'sent', 'retrying' and 'failed'.
+    """
+    import requests
+
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    for mail in claim_batch(config['MAIL_BATCH_SIZE'], claim_stale_seconds(config)):
+        mail.attempts += 1
+        mail.claim_token = None
+        mail.claimed_at = None
+        try:
+            sender.send(mail)
+        except PermanentMailError as error:
+            mail.status = 'failed'
+            mail.last_error = str(error)
+            counts['failed'] += 1
+        except requests.RequestException as error:
+            mail.last_error = str(error)[:1000]
+            if mail.attempts >= config['MAIL_MAX_ATTEMPTS']:
+                mail.status = 'failed'
+                counts['failed'] += 1
+            else:
+                delay = retry_delay(mail.attempts, config['MAIL_RETRY_BASE_SECONDS'],
+                                    config['MAIL_RETRY_MAX_SECONDS'])
+                mail.next_attempt_at = datetime.now(UTC) + timedelta(seconds=delay)
+                counts['retrying'] += 1
+        else:
+            mail.status = 'sent'
+            mail.sent_at = datetime.now(UTC)
+            mail.last_error = None
+            counts['sent'] += 1
+        # Record each outcome as it happens so a crash can't resend delivered mail
+        db.session.commit()
+
+    if counts['failed']:
+        logger.warning('Gave up on %d queued message(s)', counts['failed'])
+    return counts
+
+
+class MailWorker(threading.Thread):
+    """Background thread that drains the mail queue.
+
+    The worker sleeps for ``MAIL_WORKER_POLL_SECONDS`` between empty polls,
+    or until :meth:`notify` signals that a message was just queued.
+    """
+
+    def __init__(self, app):
+        super().__init__(name='mail-worker', daemon=True)
+        self.app = app
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self):
+        """Wake the worker to send newly queued mail."""
+        self._wake.set()
+
+    def stop(self):
+        """Ask the worker to exit after its current batch."""
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        sender = MailSender.from_config(self.app.config)
+        try:
+            while not self._stopping.is_set():
+                with self.app.app_context():
+                    try:
+                        counts = deliver_batch(sender, self.app.config)
+                    except Exception:
+                        logger.exception('Mail worker batch failed')
+                        db.session.rollback()
+                        counts = {}
+                if not any(counts.values()):
+                    self._wake.wait(self.app.config['MAIL_WORKER_POLL_SECONDS'])
+                    self._wake.clear()
+        finally:
+            sender.close()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def notify_worker(app):
+    """Wake the in-process mail worker, starting it on first use.
+
+    Does nothing unless ``MAIL_WORKER_IN_PROCESS`` is set; otherwise queued
+    mail is picked up by a separate ``flask mail worker`` process.
+
+    Args:
+        app: Flask, the application (``current_app._get_current_object()``).
+    """
+    global _worker
+
+    if not app.config['MAIL_WORKER_IN_PROCESS']:
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = MailWorker(app)
+            _worker.start()
+    _worker.notify()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Request handler imitating SMTP2GO's ``/email/send`` endpoint."""
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if server.latency:
+            time.sleep(server.latency)
+
+        if random.random() < server.failure_rate:
+            with server.lock:
+                server.stats['failed'] += 1
+            self._reply(503, {'data': {'error': 'Stub failure'}})
+        elif not payload.get('to') or not payload.get('sender'):
+            with server.lock:
+                server.stats['rejected'] += 1
+            self._reply(400, {'data': {'error': 'Missing sender or recipients'}})
+        else:
+            # Like SMTP2GO, refused recipients still get a 200, with the count in the body
+            refused = [address for address in payload['to'] if address.endswith('.invalid')]
+            with server.lock:
+                server.stats['refused' if refused else 'accepted'] += 1
+            self._reply(200, {'data': {'succeeded': len(payload['to']) - len(refused), 'failed': len(refused),
+                                       'failures': refused, 'email_id': secrets.token_hex(8)}})
+
+    def do_GET(self):
+        with self.server.lock:
+            self._reply(200, dict(self.server.stats))
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(host='127.0.0.1', port=8025, failure_rate=0.0, latency=0.0):
+    """Create (but don't start) a local stub of the SMTP2GO API.
+
+    ``POST`` requests are answered like ``/email/send``, refusing recipients
+    in the ``.invalid`` domain; ``GET`` returns the accepted/failed/rejected/
+    refused counters as JSON.
+
+    Args:
+        host: String, interface to bind.
+        port: Integer, port to bind (0 picks a free port).
+        failure_rate: Float, fraction of sends answered with 503.
+        latency: Float, seconds to wait before answering each send.
+
+    Returns:
+        ThreadingHTTPServer: The server; call ``serve_forever()`` to run it.
+    """
+    server = ThreadingHTTPServer((host, port), _StubHandler)
+    server.failure_rate = failure_rate
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.stats = {'accepted': 0, 'failed': 0, 'rejected': 0, 'refused': 0}
+    return server
+
+
+def run_stub_server(host='127.0.0.1', port=8025, failure_rate=0.0, latency=0.0):
+    """Run the SMTP2GO stub until interrupted."""
+    server = make_stub_server(host, port, failure_rate, latency)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,217 @@
+"""Opt-in per-request instrumentation for SIP311 Project Blog.
+
+When ``INSTRUMENTATION_ENABLED`` is set, :class:`RequestMetrics` times every
+request and breaks the time down into database work (statement count and
+time, from SQLAlchemy engine events) and template rendering (from Flask's
+template signals, plus any blocks wrapped in :func:`timing`). The breakdown
+is sent back in a ``Server-Timing`` header, which browser dev tools display
+next to the request, e.g.::
+
+    Server-Timing: db;dur=4.1;desc="3 queries", render;dur=9.8, cards;dur=7.2, total;dur=16.0
+
+Each request is also added to per-endpoint latency histograms, exposed in
+Prometheus text format by the admin-only ``/admin/metrics`` route. The
+histograms are cumulative, as Prometheus expects; rolling windows come from
+``rate()`` over successive scrapes. Every worker process keeps its own.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the query-count histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class Histogram:
+    """Cumulative histogram with one series per label value.
+
+    Attributes:
+        name: String, metric name.
+        help: String, metric description.
+        buckets: Tuple of Number, bucket upper bounds, ascending.
+    """
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        """Add one observation to the series for ``label``."""
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def exposition(self, label_name):
+        """Return the histogram in Prometheus text format.
+
+        Args:
+            label_name: String, name of the label the series are keyed on.
+
+        Returns:
+            list: Lines of text.
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {label: dict(values, counts=list(values['counts'])) for label, values in self._series.items()}
+        for label, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="+Inf"}} {values["count"]}')
+            lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {values["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{label_name}="{label}"}} {values["count"]}')
+        return lines
+
+
+def _current():
+    """Return the measurements of the current request, or None."""
+    if has_request_context():
+        return g.get('_request_metrics')
+    return None
+
+
+@contextmanager
+def timing(name):
+    """Time a block and report it as its own ``Server-Timing`` entry.
+
+    Does nothing outside an instrumented request.
+
+    Args:
+        name: String, entry name (a token: letters, digits, '-' or '_').
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        measurements = _current()
+        if measurements is not None:
+            timings = measurements['timings']
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class RequestMetrics:
+    """Flask extension collecting the per-request measurements.
+
+    Attributes:
+        enabled: Boolean, True once installed on an app with
+            ``INSTRUMENTATION_ENABLED`` set.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        buckets = DEFAULT_BUCKETS
+        self.request_duration = Histogram(
+            'sip_request_duration_seconds', 'Time to build a response, by endpoint.', buckets)
+        self.db_duration = Histogram(
+            'sip_request_db_duration_seconds', 'Time spent in SQL statements per request, by endpoint.', buckets)
+        self.render_duration = Histogram(
+            'sip_request_render_duration_seconds', 'Time spent rendering templates per request, by endpoint.',
+            buckets)
+        self.db_queries = Histogram(
+            'sip_request_db_queries', 'SQL statements run per request, by endpoint.', QUERY_COUNT_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install the request hooks if ``INSTRUMENTATION_ENABLED`` is set.
+
+        Args:
+            app: Flask, the application.
+        """
+        app.extensions['request_metrics'] = self
+        if not app.config.get('INSTRUMENTATION_ENABLED'):
+            return
+        self.enabled = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        # Listening on the Engine class covers every engine; the hooks only
+        # count statements run inside an instrumented request
+        if not event.contains(Engine, 'before_cursor_execute', self._before_query):
+            event.listen(Engine, 'before_cursor_execute', self._before_query)
+            event.listen(Engine, 'after_cursor_execute', self._after_query)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+    @staticmethod
+    def _start():
+        g._request_metrics = {
+            'started': time.perf_counter(), 'db_count': 0, 'db_time': 0.0,
+            'render_time': 0.0, 'render_started': [], 'timings': {},
+        }
+
+    @staticmethod
+    def _before_query(conn, cursor, statement, parameters, context, executemany):
+        if _current() is not None:
+            conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_query(conn, cursor, statement, parameters, context, executemany):
+        measurements = _current()
+        started = conn.info.get('_query_started')
+        if measurements is not None and started:
+            measurements['db_count'] += 1
+            measurements['db_time'] += time.perf_counter() - started.pop()
+
+    @staticmethod
+    def _before_render(sender, template, context, **extra):
+        measurements = _current()
+        if measurements is not None:
+            measurements['render_started'].append(time.perf_counter())
+
+    @staticmethod
+    def _after_render(sender, template, context, **extra):
+        measurements = _current()
+        if measurements is not None and measurements['render_started']:
+            started = measurements['render_started'].pop()
+            # Only the outermost template counts, so includes aren't added twice
+            if not measurements['render_started']:
+                measurements['render_time'] += time.perf_counter() - started
+
+    def _finish(self, response):
+        measurements = g.pop('_request_metrics', None)
+        if measurements is None:
+            return response
+        total = time.perf_counter() - measurements['started']
+
+        entries = [
+            f'db;dur={measurements["db_time"] * 1000:.1f};desc="{measurements["db_count"]} queries"',
+            f'render;dur={measurements["render_time"] * 1000:.1f}',
+        ]
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in measurements['timings'].items()]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        response.headers.add('Server-Timing', ', '.join(entries))
+
+        endpoint = request.endpoint or 'unmatched'
+        self.request_duration.observe(endpoint, total)
+        self.db_duration.observe(endpoint, measurements['db_time'])
+        self.render_duration.observe(endpoint, measurements['render_time'])
+        self.db_queries.observe(endpoint, measurements['db_count'])
+        return response
+
+    def exposition(self):
+        """Return all histograms in Prometheus text format."""
+        lines = []
+        for histogram in (self.request_duration, self.db_duration, self.render_duration, self.db_queries):
+            lines += histogram.exposition('endpoint')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
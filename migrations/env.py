@@ -13,6 +13,9 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Use app's SQLALCHEMY_DATABASE_URI (escaped, as the config interpolates '%')
+config.set_main_option("sqlalchemy.url", app.config['SQLALCHEMY_DATABASE_URI'].replace('%', '%%'))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 from models import User, Post, Comment, Tag  # Import all models
@@ -20,6 +23,20 @@ from models import User, Post, Comment, Tag  # Import all models
 target_metadata = db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave the full-text search index out of autogenerate and `flask db check`.
+
+    It isn't part of the models: the SQLite FTS5 table (and its shadow tables)
+    is created by search.py and the MySQL FULLTEXT index by a migration, so
+    comparing against the models would drop them.
+    """
+    if type_ == 'table' and name.startswith('posts_fts'):
+        return False
+    if type_ == 'index' and name == 'ix_posts_fulltext':
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -42,6 +59,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -59,13 +77,12 @@ def run_migrations_online() -> None:
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
-    # Use app's SQLALCHEMY_DATABASE_URI
-    config.set_main_option("sqlalchemy.url", app.config['SQLALCHEMY_DATABASE_URI'])
 
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,38 @@
+"""Add rendered HTML column to posts
+
+Revision ID: 3b7e2c91a4d0
+Revises: 24d5446ee365
+Create Date: 2025-06-02 10:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e2c91a4d0'
+down_revision = '24d5446ee365'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    import markdown
+
+    op.add_column('posts', sa.Column('content_html', sa.Text(), nullable=True))
+
+    # Render existing posts now so no page shows an empty column; the same
+    # rendering is available later as `flask posts backfill-html --all`
+    posts = sa.table('posts', sa.column('id', sa.Integer), sa.column('content', sa.Text),
+                     sa.column('content_html', sa.Text))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(posts.c.id, posts.c.content)).all()
+    if rows:
+        connection.execute(
+            posts.update().where(posts.c.id == sa.bindparam('post_id')).values(content_html=sa.bindparam('html')),
+            [{'post_id': row.id, 'html': markdown.markdown(row.content or '')} for row in rows],
+        )
+
+
+def downgrade():
+    op.drop_column('posts', 'content_html')
@@ -0,0 +1,29 @@
+"""Add image dimension and variant columns to posts
+
+Revision ID: 4a6c1f8e2d93
+Revises: e2d84b6f90a1
+Create Date: 2025-06-10 09:51:33.270148
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a6c1f8e2d93'
+down_revision = 'e2d84b6f90a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generate variants for existing images with `flask posts process-images`.
+    op.add_column('posts', sa.Column('image_width', sa.Integer(), nullable=True))
+    op.add_column('posts', sa.Column('image_height', sa.Integer(), nullable=True))
+    op.add_column('posts', sa.Column('image_variants', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('posts', 'image_variants')
+    op.drop_column('posts', 'image_height')
+    op.drop_column('posts', 'image_width')
@@ -0,0 +1,41 @@
+"""Add indexes for hot queries
+
+Revision ID: 7d2e9b4c5a18
+Revises: 4a6c1f8e2d93
+Create Date: 2025-06-12 16:35:08.913027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e9b4c5a18'
+down_revision = '4a6c1f8e2d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Blog listing: keyset pagination on (date, id) and the version stamp
+    op.create_index('ix_posts_date_id', 'posts', ['date', 'id'])
+    op.create_index('ix_posts_updated_at', 'posts', ['updated_at'])
+    op.create_index('ix_posts_user_id', 'posts', ['user_id'])
+    # Comments: visible comments of a post in date order, reply trees, per-user lookups
+    op.create_index('ix_comments_post_id_is_hidden_date', 'comments', ['post_id', 'is_hidden', 'date'])
+    op.create_index('ix_comments_parent_id', 'comments', ['parent_id'])
+    op.create_index('ix_comments_user_id', 'comments', ['user_id'])
+    op.create_index('ix_comments_date_id', 'comments', ['date', 'id'])
+    # Tag listings: posts for a tag
+    op.create_index('ix_post_tag_tag_id_post_id', 'post_tag', ['tag_id', 'post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_post_tag_tag_id_post_id', table_name='post_tag')
+    op.drop_index('ix_comments_date_id', table_name='comments')
+    op.drop_index('ix_comments_user_id', table_name='comments')
+    op.drop_index('ix_comments_parent_id', table_name='comments')
+    op.drop_index('ix_comments_post_id_is_hidden_date', table_name='comments')
+    op.drop_index('ix_posts_user_id', table_name='posts')
+    op.drop_index('ix_posts_updated_at', table_name='posts')
+    op.drop_index('ix_posts_date_id', table_name='posts')
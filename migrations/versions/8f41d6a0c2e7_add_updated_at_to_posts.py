@@ -0,0 +1,24 @@
+"""Add updated_at to posts
+
+Revision ID: 8f41d6a0c2e7
+Revises: 3b7e2c91a4d0
+Create Date: 2025-06-03 18:40:05.117392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f41d6a0c2e7'
+down_revision = '3b7e2c91a4d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('posts', 'updated_at')
@@ -0,0 +1,31 @@
+"""Add comment moderation indexes
+
+Revision ID: a9d3c7e1f5b2
+Revises: f6c2d8a4b195
+Create Date: 2025-06-18 10:22:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3c7e1f5b2'
+down_revision = 'f6c2d8a4b195'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Moderation console: a post's or a user's comments, newest first.
+    # The (user_id, ...) index is created before the old one is dropped, as
+    # MySQL needs an index on the foreign key column at all times.
+    op.create_index('ix_comments_post_id_date_id', 'comments', ['post_id', 'date', 'id'])
+    op.create_index('ix_comments_user_id_date_id', 'comments', ['user_id', 'date', 'id'])
+    op.drop_index('ix_comments_user_id', table_name='comments')
+
+
+def downgrade():
+    op.create_index('ix_comments_user_id', 'comments', ['user_id'])
+    op.drop_index('ix_comments_user_id_date_id', table_name='comments')
+    op.drop_index('ix_comments_post_id_date_id', table_name='comments')
@@ -0,0 +1,57 @@
+"""Add post and comment archive tables
+
+Revision ID: b4e8f2a6c0d3
+Revises: a9d3c7e1f5b2
+Create Date: 2025-06-19 09:47:12.560831
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8f2a6c0d3'
+down_revision = 'a9d3c7e1f5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'posts_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('content_html', sa.Text(), nullable=True),
+        sa.Column('image_path', sa.String(length=200), nullable=True),
+        sa.Column('image_width', sa.Integer(), nullable=True),
+        sa.Column('image_height', sa.Integer(), nullable=True),
+        sa.Column('image_variants', sa.Text(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('tags', sa.Text(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_posts_archive_date', 'posts_archive', ['date'])
+    op.create_table(
+        'comments_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('is_hidden', sa.Boolean(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_comments_archive_post_id', 'comments_archive', ['post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_archive_post_id', table_name='comments_archive')
+    op.drop_table('comments_archive')
+    op.drop_index('ix_posts_archive_date', table_name='posts_archive')
+    op.drop_table('posts_archive')
@@ -0,0 +1,40 @@
+"""Add comment counters to posts
+
+Revision ID: b81f3c6d2a47
+Revises: 7d2e9b4c5a18
+Create Date: 2025-06-14 10:12:44.205318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f3c6d2a47'
+down_revision = '7d2e9b4c5a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('posts', sa.Column('visible_comment_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('posts', sa.Column('last_comment_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_posts_last_comment_at', 'posts', ['last_comment_at'])
+
+    # Fill the counters for existing posts in one set-based pass; the same
+    # recount is available later as `flask posts reconcile-counters`
+    op.execute(
+        'UPDATE posts SET '
+        'comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id), '
+        'visible_comment_count = (SELECT COUNT(*) FROM comments '
+        'WHERE comments.post_id = posts.id AND comments.is_hidden = 0), '
+        'last_comment_at = (SELECT MAX(comments.date) FROM comments WHERE comments.post_id = posts.id)'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_posts_last_comment_at', table_name='posts')
+    op.drop_column('posts', 'last_comment_at')
+    op.drop_column('posts', 'visible_comment_count')
+    op.drop_column('posts', 'comment_count')
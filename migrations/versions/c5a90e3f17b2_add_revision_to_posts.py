@@ -0,0 +1,24 @@
+"""Add revision counter to posts
+
+Revision ID: c5a90e3f17b2
+Revises: 8f41d6a0c2e7
+Create Date: 2025-06-05 21:03:52.664018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a90e3f17b2'
+down_revision = '8f41d6a0c2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('posts', 'revision')
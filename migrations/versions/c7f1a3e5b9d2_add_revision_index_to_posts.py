@@ -0,0 +1,26 @@
+"""Add revision index to posts
+
+Revision ID: c7f1a3e5b9d2
+Revises: b4e8f2a6c0d3
+Create Date: 2025-06-24 09:41:18.442915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f1a3e5b9d2'
+down_revision = 'b4e8f2a6c0d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The blog version stamp sums posts.revision on every page view; the index
+    # lets it read the narrow index instead of the whole table
+    op.create_index('ix_posts_revision', 'posts', ['revision'])
+
+
+def downgrade():
+    op.drop_index('ix_posts_revision', table_name='posts')
@@ -0,0 +1,38 @@
+"""Add tag listing columns
+
+Revision ID: d3a7e5f1c924
+Revises: b81f3c6d2a47
+Create Date: 2025-06-15 09:41:27.530164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7e5f1c924'
+down_revision = 'b81f3c6d2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # post_tag.post_date copies posts.date so tag listings page through one index
+    op.add_column('post_tag', sa.Column('post_date', sa.DateTime(), nullable=True))
+    op.execute('UPDATE post_tag SET post_date = (SELECT posts.date FROM posts WHERE posts.id = post_tag.post_id)')
+    with op.batch_alter_table('post_tag') as batch_op:
+        batch_op.alter_column('post_date', existing_type=sa.DateTime(), nullable=False)
+    # Created before the old index is dropped, as MySQL needs an index on the
+    # tag_id foreign key column at all times
+    op.create_index('ix_post_tag_tag_id_post_date_post_id', 'post_tag', ['tag_id', 'post_date', 'post_id'])
+    op.drop_index('ix_post_tag_tag_id_post_id', table_name='post_tag')
+
+    op.add_column('tags', sa.Column('post_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute('UPDATE tags SET post_count = (SELECT COUNT(*) FROM post_tag WHERE post_tag.tag_id = tags.id)')
+
+
+def downgrade():
+    op.drop_column('tags', 'post_count')
+    op.create_index('ix_post_tag_tag_id_post_id', 'post_tag', ['tag_id', 'post_id'])
+    op.drop_index('ix_post_tag_tag_id_post_date_post_id', table_name='post_tag')
+    op.drop_column('post_tag', 'post_date')
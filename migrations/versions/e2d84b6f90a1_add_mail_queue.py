@@ -0,0 +1,42 @@
+"""Add outbound mail queue
+
+Revision ID: e2d84b6f90a1
+Revises: c5a90e3f17b2
+Create Date: 2025-06-08 14:27:19.402551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2d84b6f90a1'
+down_revision = 'c5a90e3f17b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'mail_queue',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sender', sa.String(length=120), nullable=False),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('text_body', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_mail_queue_status_next_attempt_at', 'mail_queue', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('ix_mail_queue_status_next_attempt_at', table_name='mail_queue')
+    op.drop_table('mail_queue')
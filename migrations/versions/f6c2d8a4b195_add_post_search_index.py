@@ -0,0 +1,33 @@
+"""Add post search index
+
+Revision ID: f6c2d8a4b195
+Revises: d3a7e5f1c924
+Create Date: 2025-06-16 14:03:51.772409
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c2d8a4b195'
+down_revision = 'd3a7e5f1c924'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # MySQL indexes posts in place; SQLite keeps an FTS5 copy, filled here
+    # and maintained by the post routes (see search.py)
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, tokenize = 'unicode61')")
+        op.execute('INSERT INTO posts_fts (rowid, title, content) SELECT id, title, content FROM posts')
+    else:
+        op.create_index('ix_posts_fulltext', 'posts', ['title', 'content'], mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE posts_fts')
+    else:
+        op.drop_index('ix_posts_fulltext', table_name='posts')
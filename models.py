@@ -5,19 +5,28 @@ association for user authentication, blog post management, comment functionality
 and tag organization. The User model includes roles for admin and user privileges.
 Posts support markdown content and optional image uploads. Comments are linked to
 posts and users, with moderation capabilities. Tags allow categorization of posts.
+Old posts and their comments can be moved to archive tables; see archive.py.
 """
 
+import json
 from datetime import datetime, UTC
 
 from flask_login import UserMixin
+from sqlalchemy.orm import joinedload, load_only, selectinload
 
+from caching import invalidate_user
 from extensions import db
 
 # Association table for Post-Tag many-to-many relationship
 post_tag = db.Table(
     'post_tag',
     db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    # Copy of posts.date, so a tag's posts can be paged newest first from the
+    # index below without reading or sorting the posts table; see Post.set_tags
+    db.Column('post_date', db.DateTime, nullable=False),
+    # The primary key covers lookups by post; this covers listings by tag
+    db.Index('ix_post_tag_tag_id_post_date_post_id', 'tag_id', 'post_date', 'post_id'),
 )
 
 
@@ -47,6 +56,7 @@ class User(db.Model, UserMixin):
 
     def update_role(self, role):
         self.role = role
+        invalidate_user(self.id)
 
 
 class Post(db.Model):
@@ -56,25 +66,218 @@ class Post(db.Model):
         id: Integer, primary key.
         title: String, post title, required.
         date: DateTime, publication date, default to current UTC time.
-        content: Text, markdown content, required.
+        updated_at: DateTime, time of the last edit, nullable.
+        content: Text, markdown source of the post, required.
+        content_html: Text, HTML rendered from content when the post is saved.
         image_path: String, path to optional image in static/images/, nullable.
+        image_width: Integer, width of the original image in pixels, nullable.
+        image_height: Integer, height of the original image in pixels, nullable.
+        image_variants: Text, JSON list of resized/WebP variants, nullable.
         user_id: Integer, foreign key to User, required.
+        revision: Integer, incremented whenever the post or its comments change.
+        comment_count: Integer, number of comments on the post, hidden or not.
+        visible_comment_count: Integer, number of comments not hidden.
+        last_comment_at: DateTime, date of the newest comment, nullable.
         comments: Relationship, comments on the post.
-        tags: Relationship, tags associated with the post.
+        tags: Relationship, tags associated with the post (read-only; use
+            set_tags to change them).
     """
     __tablename__ = 'posts'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    # Set by update_post only: counter and revision UPDATEs must not mark a post edited
+    updated_at = db.Column(db.DateTime, nullable=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text, nullable=True)
     image_path = db.Column(db.String(200), nullable=True)
+    image_width = db.Column(db.Integer, nullable=True)
+    image_height = db.Column(db.Integer, nullable=True)
+    image_variants = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Denormalized from comments so listings never aggregate at read time;
+    # see record_comment, recount_comments and `flask posts reconcile-counters`
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    visible_comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_comment_at = db.Column(db.DateTime, nullable=True)
     comments = db.relationship('Comment', backref='post', lazy=True)
-    tags = db.relationship('Tag', secondary=post_tag, backref=db.backref('posts', lazy=True))
+    tags = db.relationship('Tag', secondary=post_tag, viewonly=True,
+                           backref=db.backref('posts', lazy=True, viewonly=True))
+
+    __table_args__ = (
+        db.Index('ix_posts_date_id', 'date', 'id'),
+        db.Index('ix_posts_updated_at', 'updated_at'),
+        db.Index('ix_posts_user_id', 'user_id'),
+        db.Index('ix_posts_last_comment_at', 'last_comment_at'),
+        # Covers sum(revision) in the blog version stamp
+        db.Index('ix_posts_revision', 'revision'),
+    )
 
     def __repr__(self):
         return f'<Post {self.title}>'
 
+    def set_content(self, source):
+        """Store the markdown source of the post along with its rendered HTML.
+
+        Rendering happens once here, on write, so pages that display the post
+        never need to run the markdown engine.
+
+        Args:
+            source: String, markdown source of the post.
+        """
+        # Imported here as only post writes need it, not worker startup
+        import markdown
+
+        self.content = source
+        self.content_html = markdown.markdown(source)
+
+    @property
+    def image_variants_by_format(self):
+        """Group the image's variants by format for ``srcset`` attributes.
+
+        Returns:
+            dict: Format name ('jpeg', 'png' or 'webp') to a list of variant
+            dicts (``filename``, ``width``, ``height``), smallest first.
+        """
+        if not self.image_variants:
+            return {}
+        grouped = {}
+        for variant in sorted(json.loads(self.image_variants), key=lambda v: v['width']):
+            grouped.setdefault(variant['format'], []).append(variant)
+        return grouped
+
+    def set_tags(self, names):
+        """Replace the post's tags, creating tags that don't exist yet.
+
+        ``post_tag`` rows carry a copy of the post date, so they are written
+        here rather than through the read-only ``tags`` relationship. The post
+        counts of tags gained or lost are recounted in the same transaction.
+
+        Args:
+            names: Iterable of String, tag names; blanks and duplicates are
+                ignored and names are lower-cased.
+        """
+        names = {name.strip().lower()[:50] for name in names if name.strip()}
+        if self.id is None:
+            db.session.flush()
+
+        tags = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))} if names else {}
+        for name in names - tags.keys():
+            tags[name] = Tag(name=name)
+            db.session.add(tags[name])
+        db.session.flush()
+
+        old_ids = set(db.session.scalars(db.select(post_tag.c.tag_id).where(post_tag.c.post_id == self.id)))
+        new_ids = {tag.id for tag in tags.values()}
+        if old_ids - new_ids:
+            db.session.execute(
+                db.delete(post_tag)
+                .where(post_tag.c.post_id == self.id, post_tag.c.tag_id.in_(old_ids - new_ids))
+            )
+        if new_ids - old_ids:
+            db.session.execute(db.insert(post_tag), [
+                {'post_id': self.id, 'tag_id': tag_id, 'post_date': self.date} for tag_id in new_ids - old_ids
+            ])
+        if old_ids ^ new_ids:
+            Tag.recount_posts(old_ids ^ new_ids)
+        db.session.expire(self, ['tags'])
+
+    @classmethod
+    def bump_revision(cls, post_id):
+        """Increment a post's revision in the current transaction.
+
+        Cached renderings of a post are keyed on its revision, so this marks
+        them stale in every worker process.
+
+        Args:
+            post_id: Integer, ID of the post that changed.
+        """
+        db.session.execute(
+            db.update(cls).where(cls.id == post_id).values(revision=cls.revision + 1)
+        )
+
+    @classmethod
+    def record_comment(cls, post_id, comment_date, visible=True):
+        """Count a new comment on a post in the current transaction.
+
+        Updates the post's comment counters and last-activity date and bumps
+        its revision in a single ``UPDATE``, so concurrent comments can't lose
+        each other's increments.
+
+        Args:
+            post_id: Integer, ID of the post commented on.
+            comment_date: DateTime, date of the new comment.
+            visible: Boolean, False if the comment starts out hidden.
+        """
+        db.session.execute(
+            db.update(cls).where(cls.id == post_id).values(
+                comment_count=cls.comment_count + 1,
+                visible_comment_count=cls.visible_comment_count + (1 if visible else 0),
+                last_comment_at=db.case(
+                    (db.or_(cls.last_comment_at.is_(None), cls.last_comment_at < comment_date), comment_date),
+                    else_=cls.last_comment_at,
+                ),
+                revision=cls.revision + 1,
+            )
+        )
+
+    @classmethod
+    def recount_comments(cls, post_ids=None):
+        """Recompute comment counters from the comments table, set-based.
+
+        Used after comments are hidden, shown or deleted, and by
+        ``flask posts reconcile-counters`` to repair drift. Only posts whose
+        stored values differ are written, and their revision is bumped so
+        cached cards pick up the new counts.
+
+        Args:
+            post_ids: List of Integer, posts to recount; None recounts all.
+
+        Returns:
+            int: Number of posts whose counters changed.
+        """
+        total = (db.select(db.func.count(Comment.id))
+                 .where(Comment.post_id == cls.id).scalar_subquery())
+        visible = (db.select(db.func.count(Comment.id))
+                   .where(Comment.post_id == cls.id, Comment.is_hidden == db.false()).scalar_subquery())
+        latest = (db.select(db.func.max(Comment.date))
+                  .where(Comment.post_id == cls.id).scalar_subquery())
+
+        statement = db.update(cls).where(db.or_(
+            cls.comment_count != total,
+            cls.visible_comment_count != visible,
+            cls.last_comment_at.is_distinct_from(latest),
+        ))
+        if post_ids is not None:
+            statement = statement.where(cls.id.in_(post_ids))
+        result = db.session.execute(
+            statement.values(comment_count=total, visible_comment_count=visible, last_comment_at=latest,
+                             revision=cls.revision + 1),
+            execution_options={'synchronize_session': False},
+        )
+        return result.rowcount
+
+    @classmethod
+    def listing_query(cls):
+        """Build the query used by the blog listing.
+
+        Eager-loads everything the listing template touches, restricted to the
+        columns it renders: the post author is joined in and tags are fetched
+        with one ``SELECT ... IN`` for the whole page. Comments are not loaded
+        at all; the listing shows only the denormalized
+        ``visible_comment_count`` and fetches them on demand.
+
+        Returns:
+            Query: Post query with loader options applied.
+        """
+        return cls.query.options(
+            load_only(cls.title, cls.date, cls.content_html, cls.image_path, cls.image_width, cls.image_height,
+                      cls.image_variants, cls.user_id, cls.revision, cls.visible_comment_count, cls.updated_at),
+            joinedload(cls.author).load_only(User.username),
+            selectinload(cls.tags).load_only(Tag.name),
+        )
+
 
 class Comment(db.Model):
     """Comment model for user feedback on blog posts.
@@ -98,6 +301,14 @@ class Comment(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True)
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_comments_post_id_is_hidden_date', 'post_id', 'is_hidden', 'date'),
+        db.Index('ix_comments_post_id_date_id', 'post_id', 'date', 'id'),
+        db.Index('ix_comments_parent_id', 'parent_id'),
+        db.Index('ix_comments_user_id_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_comments_date_id', 'date', 'id'),
+    )
+
     def __repr__(self):
         return f'<Comment {self.id} on Post {self.post_id}>'
 
@@ -108,10 +319,178 @@ class Tag(db.Model):
     Attributes:
         id: Integer, primary key.
         name: String, unique tag name, required.
+        post_count: Integer, number of posts with the tag, kept up to date
+            by Post.set_tags.
     """
     __tablename__ = 'tags'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<Tag {self.name}>'
+
+    @classmethod
+    def recount_posts(cls, tag_ids=None):
+        """Recompute tags' post counts from ``post_tag``, set-based.
+
+        Args:
+            tag_ids: Iterable of Integer, tags to recount; None recounts all.
+
+        Returns:
+            int: Number of tags whose count changed.
+        """
+        count = (db.select(db.func.count()).select_from(post_tag)
+                 .where(post_tag.c.tag_id == cls.id).scalar_subquery())
+        statement = db.update(cls).where(cls.post_count != count)
+        if tag_ids is not None:
+            statement = statement.where(cls.id.in_(list(tag_ids)))
+        result = db.session.execute(statement.values(post_count=count),
+                                    execution_options={'synchronize_session': False})
+        return result.rowcount
+
+    @classmethod
+    def names_by_post(cls, post_ids):
+        """Return the tag names of each post, in one query.
+
+        Args:
+            post_ids: List of Integer, posts to look up.
+
+        Returns:
+            dict: Post ID to a sorted list of tag names; posts without tags
+            are left out.
+        """
+        names = {}
+        rows = db.session.execute(
+            db.select(post_tag.c.post_id, cls.name).join(cls, cls.id == post_tag.c.tag_id)
+            .where(post_tag.c.post_id.in_(post_ids)).order_by(post_tag.c.post_id, cls.name)
+        )
+        for post_id, name in rows:
+            names.setdefault(post_id, []).append(name)
+        return names
+
+    @classmethod
+    def cloud(cls):
+        """Return ``(name, post_count)`` pairs of tags in use, by name."""
+        return db.session.execute(
+            db.select(cls.name, cls.post_count).where(cls.post_count > 0).order_by(cls.name)
+        ).all()
+
+
+class OutboundMail(db.Model):
+    """Queued outbound email awaiting delivery through the SMTP2GO API.
+
+    Messages are written here by web requests and sent by the mail worker in
+    ``mailer.py``, so no request waits on the mail API.
+
+    Attributes:
+        id: Integer, primary key.
+        sender: String, sender address, required.
+        recipients: Text, JSON list of recipient addresses, required.
+        subject: String, message subject, required.
+        text_body: Text, plain-text message body, required.
+        status: String, 'pending', 'sent' or 'failed', default 'pending'.
+        attempts: Integer, delivery attempts made so far, default 0.
+        next_attempt_at: DateTime, earliest time of the next attempt.
+        claim_token: String, token of the worker currently sending, nullable.
+        claimed_at: DateTime, time the current claim was taken, nullable.
+        last_error: Text, error from the most recent failed attempt, nullable.
+        created_at: DateTime, time the message was queued.
+        sent_at: DateTime, time the message was accepted by the API, nullable.
+    """
+    __tablename__ = 'mail_queue'
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(120), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    text_body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    claim_token = db.Column(db.String(32), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_mail_queue_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboundMail {self.id} {self.status}>'
+
+
+class ArchivedPost(db.Model):
+    """Post moved out of the posts table by ``flask posts archive``.
+
+    Keeps the post's own columns, with its tag names flattened into a string,
+    so the hot tables stay small without losing old content; see archive.py.
+
+    Attributes:
+        id: Integer, primary key, the post's original ID.
+        title: String, post title.
+        date: DateTime, publication date.
+        updated_at: DateTime, time of the last edit, nullable.
+        content: Text, markdown source of the post.
+        content_html: Text, rendered HTML, nullable.
+        image_path: String, path to the post image in static/images/, nullable.
+        image_width: Integer, width of the original image in pixels, nullable.
+        image_height: Integer, height of the original image in pixels, nullable.
+        image_variants: Text, JSON list of resized/WebP variants, nullable.
+        user_id: Integer, ID of the author (not a foreign key).
+        tags: String, comma-separated tag names, nullable.
+        archived_at: DateTime, time the post was archived.
+    """
+    __tablename__ = 'posts_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text, nullable=True)
+    image_path = db.Column(db.String(200), nullable=True)
+    image_width = db.Column(db.Integer, nullable=True)
+    image_height = db.Column(db.Integer, nullable=True)
+    image_variants = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    tags = db.Column(db.Text, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+
+    __table_args__ = (
+        db.Index('ix_posts_archive_date', 'date'),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedPost {self.title}>'
+
+
+class ArchivedComment(db.Model):
+    """Comment moved out of the comments table along with its post.
+
+    Attributes:
+        id: Integer, primary key, the comment's original ID.
+        content: Text, comment text.
+        date: DateTime, comment date.
+        is_hidden: Boolean, whether the comment was hidden by a moderator.
+        user_id: Integer, ID of the author (not a foreign key).
+        post_id: Integer, ID of the archived post.
+        parent_id: Integer, ID of the parent comment, nullable.
+        archived_at: DateTime, time the comment was archived.
+    """
+    __tablename__ = 'comments_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    is_hidden = db.Column(db.Boolean, nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    parent_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+
+    __table_args__ = (
+        db.Index('ix_comments_archive_post_id', 'post_id'),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedComment {self.id} on Post {self.post_id}>'
@@ -0,0 +1,195 @@
+"""Comment moderation for SIP311 Project Blog.
+
+The admin console at ``/admin/comments`` lists comments newest first with
+keyset pagination, filtered by post, author, date range and hidden state.
+Moderators act either on the comments they ticked or on every comment
+matching the filters.
+
+Every action is set-based: hiding and showing is one ``UPDATE ... WHERE``
+over the selection, and deleting removes the selected comments and all their
+replies with an ``UPDATE`` and a ``DELETE`` per :data:`ID_CHUNK_SIZE` ids. No
+ORM objects are loaded. Afterwards the affected posts' comment counters are
+recounted with ``Post.recount_comments``, which also bumps their revision so
+cached cards and comment fragments are rebuilt.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from extensions import db
+
+# Ids per IN (...) list, well under every database's parameter limit
+ID_CHUNK_SIZE = 1000
+
+# Hidden-state filters offered by the console
+STATUSES = ('all', 'visible', 'hidden')
+
+
+def comment_criteria(post_id=None, username=None, since=None, until=None, status='all'):
+    """Build the WHERE clauses selecting the comments matching the filters.
+
+    The clauses only refer to the comments table (the author is matched
+    through a scalar subquery), so they work in UPDATE and DELETE statements
+    as well as in the listing.
+
+    Args:
+        post_id: Integer, only comments on this post.
+        username: String, only comments by this user.
+        since: Date, only comments made on or after this day.
+        until: Date, only comments made on or before this day.
+        status: String, one of :data:`STATUSES`.
+
+    Returns:
+        list: SQL expressions to AND together.
+    """
+    from models import Comment, User
+
+    criteria = []
+    if post_id is not None:
+        criteria.append(Comment.post_id == post_id)
+    if username:
+        criteria.append(Comment.user_id == select(User.id).where(User.username == username).scalar_subquery())
+    if since is not None:
+        criteria.append(Comment.date >= since)
+    if until is not None:
+        criteria.append(Comment.date < until + timedelta(days=1))
+    if status == 'visible':
+        criteria.append(Comment.is_hidden == db.false())
+    elif status == 'hidden':
+        criteria.append(Comment.is_hidden == db.true())
+    return criteria
+
+
+def moderation_query(criteria):
+    """Build the console's listing of comments matching ``criteria``.
+
+    Args:
+        criteria: List of SQL expressions from :func:`comment_criteria`.
+
+    Returns:
+        Query: Rows with the comment's ``id``, ``date``, ``content``,
+        ``is_hidden``, ``post_id`` and ``parent_id``, its author's
+        ``username`` and its post's ``title``, ready for ``keyset_page``.
+    """
+    from models import Comment, Post, User
+
+    return (db.session.query(Comment.id, Comment.date, Comment.content, Comment.is_hidden, Comment.post_id,
+                             Comment.parent_id, User.username, Post.title.label('post_title'))
+            .join(User, User.id == Comment.user_id)
+            .join(Post, Post.id == Comment.post_id)
+            .filter(*criteria))
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
+
+def _recount(post_ids):
+    from caching import post_card_cache
+    from models import Post
+
+    if post_ids:
+        Post.recount_comments(post_ids)
+        for post_id in post_ids:
+            post_card_cache.invalidate(post_id)
+
+
+def set_hidden(criteria, hidden):
+    """Hide or show every comment matching ``criteria`` in one UPDATE.
+
+    Runs in the current transaction; the caller commits.
+
+    Args:
+        criteria: List of SQL expressions, e.g. ``[Comment.id.in_(ids)]`` or
+            the output of :func:`comment_criteria`.
+        hidden: Boolean, True to hide, False to show.
+
+    Returns:
+        int: Number of comments changed.
+    """
+    from models import Comment
+
+    # Comments already in the wanted state are left out, so only posts whose counts move are recounted
+    criteria = [*criteria, Comment.is_hidden.isnot(hidden)]
+    post_ids = list(db.session.scalars(select(Comment.post_id).where(*criteria).distinct()))
+    if not post_ids:
+        return 0
+    result = db.session.execute(
+        db.update(Comment).where(*criteria).values(is_hidden=hidden),
+        execution_options={'synchronize_session': False},
+    )
+    _recount(post_ids)
+    return result.rowcount
+
+
+def comment_tree_ids(criteria):
+    """Return the ids of the comments matching ``criteria`` and all their replies.
+
+    Args:
+        criteria: List of SQL expressions selecting the root comments.
+
+    Returns:
+        list: Integer comment ids, replies included.
+    """
+    from models import Comment
+
+    tree = select(Comment.id).where(*criteria).cte('comment_tree', recursive=True)
+    reply = db.aliased(Comment)
+    tree = tree.union(select(reply.id).join(tree, reply.parent_id == tree.c.id))
+    return list(db.session.scalars(select(tree.c.id)))
+
+
+def delete_comment_ids(comment_ids):
+    """Delete comments by id, set-based, whatever order their replies are in.
+
+    Self-references inside the set are cleared first: MySQL checks the
+    ``parent_id`` foreign key row by row, so a DELETE reaching a parent before
+    its replies would fail. Callers must include every reply of the deleted
+    comments (see :func:`comment_tree_ids`). Comment counters are not touched.
+
+    Args:
+        comment_ids: List of Integer, comments to delete.
+
+    Returns:
+        int: Number of comments deleted.
+    """
+    from models import Comment
+
+    deleted = 0
+    for chunk in _chunks(comment_ids):
+        db.session.execute(
+            db.update(Comment).where(Comment.id.in_(chunk), Comment.parent_id.isnot(None)).values(parent_id=None),
+            execution_options={'synchronize_session': False},
+        )
+    for chunk in _chunks(comment_ids):
+        deleted += db.session.execute(
+            db.delete(Comment).where(Comment.id.in_(chunk)),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+    return deleted
+
+
+def delete_comments(criteria):
+    """Delete every comment matching ``criteria`` together with its replies.
+
+    Runs in the current transaction; the caller commits.
+
+    Args:
+        criteria: List of SQL expressions selecting the comments.
+
+    Returns:
+        int: Number of comments deleted, replies included.
+    """
+    from models import Comment
+
+    comment_ids = comment_tree_ids(criteria)
+    if not comment_ids:
+        return 0
+    post_ids = set()
+    for chunk in _chunks(comment_ids):
+        post_ids.update(db.session.scalars(select(Comment.post_id).where(Comment.id.in_(chunk)).distinct()))
+    deleted = delete_comment_ids(comment_ids)
+    _recount(list(post_ids))
+    return deleted
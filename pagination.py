@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination helpers for SIP311 Project Blog.
+
+Listings are ordered newest first on a ``(date, id)`` pair. Instead of
+``OFFSET``, each page seeks directly to the row after (or before) an opaque
+cursor built from the boundary row's date and id, so the cost of a page stays
+the same no matter how deep into the listing it is or how large the table grows.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import or_
+
+
+class KeysetPage:
+    """A single page of keyset-paginated results.
+
+    Attributes:
+        items: List, rows on this page, newest first.
+        older_cursor: String, cursor for the next (older) page, or None.
+        newer_cursor: String, cursor for the previous (newer) page, or None.
+    """
+
+    def __init__(self, items, older_cursor=None, newer_cursor=None):
+        self.items = items
+        self.older_cursor = older_cursor
+        self.newer_cursor = newer_cursor
+
+    @property
+    def has_older(self):
+        return self.older_cursor is not None
+
+    @property
+    def has_newer(self):
+        return self.newer_cursor is not None
+
+
+def encode_cursor(date, row_id):
+    """Encode a ``(date, id)`` pair as an opaque, URL-safe cursor.
+
+    Args:
+        date: DateTime, sort date of the boundary row.
+        row_id: Integer, primary key of the boundary row.
+
+    Returns:
+        str: URL-safe cursor string.
+    """
+    raw = f'{date.isoformat()}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by :func:`encode_cursor`.
+
+    Args:
+        cursor: String, cursor from a query string.
+
+    Returns:
+        tuple: ``(datetime, int)`` boundary pair.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (binascii.Error, UnicodeError, ValueError) as error:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from error
+
+
+def keyset_page(query, date_column, id_column, page_size, before=None, after=None):
+    """Fetch one page of ``query`` ordered newest first on ``(date, id)``.
+
+    At most ``page_size + 1`` rows are read; the extra row only tells us whether
+    another page exists in the direction of travel. The seek condition is
+    written with a plain range on ``date`` so an index on ``(date, id)`` can
+    start at the cursor rather than scanning from the top.
+
+    Args:
+        query: SQLAlchemy query to paginate (without ORDER BY or LIMIT).
+        date_column: Column, primary sort key (descending).
+        id_column: Column, tie-breaking sort key (descending).
+        page_size: Integer, maximum number of rows per page.
+        before: String, cursor; return rows older than it.
+        after: String, cursor; return rows newer than it.
+
+    Returns:
+        KeysetPage: The requested page and cursors for its neighbours.
+
+    Raises:
+        ValueError: If either cursor is malformed.
+    """
+    if after:
+        date, row_id = decode_cursor(after)
+        rows = (query
+                .filter(date_column >= date, or_(date_column > date, id_column > row_id))
+                .order_by(date_column.asc(), id_column.asc())
+                .limit(page_size + 1)
+                .all())
+        has_newer = len(rows) > page_size
+        items = list(reversed(rows[:page_size]))
+        # We arrived here from an older page, so one always exists.
+        has_older = True
+    else:
+        if before:
+            date, row_id = decode_cursor(before)
+            query = query.filter(date_column <= date, or_(date_column < date, id_column < row_id))
+        rows = (query
+                .order_by(date_column.desc(), id_column.desc())
+                .limit(page_size + 1)
+                .all())
+        has_older = len(rows) > page_size
+        items = rows[:page_size]
+        has_newer = before is not None
+
+    older_cursor = newer_cursor = None
+    if items:
+        if has_older:
+            older_cursor = encode_cursor(items[-1].date, items[-1].id)
+        if has_newer:
+            newer_cursor = encode_cursor(items[0].date, items[0].id)
+    return KeysetPage(items, older_cursor=older_cursor, newer_cursor=newer_cursor)
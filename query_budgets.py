@@ -0,0 +1,253 @@
+"""Per-route SQL query budgets for SIP311 Project Blog.
+
+Every view in routes.py declares, with :func:`query_budget`, the most SQL
+statements one request to it may run. A new lazy relationship touched from a
+template, or a query moved into a loop, then shows up as a broken budget
+instead of a quietly slower page.
+
+:class:`QueryBudgets` checks each request against its view's budget. What
+happens when a budget is broken depends on ``QUERY_BUDGET_MODE``:
+
+* ``raise`` raises :class:`QueryBudgetExceeded`, listing the statements;
+* ``log`` logs the same report as a warning;
+* ``off`` records nothing.
+
+When the mode is not set it is ``raise`` under ``app.testing``, ``log`` under
+``app.debug`` and ``off`` otherwise, so production requests pay nothing.
+
+Budgets are for the worst case: cold caches, a logged-in user who is not yet
+in the user cache. Each is that measured worst case plus one statement of
+headroom, so a budget isn't broken by an extra lookup on a rare path while an
+N+1 query still breaks it at the first page with two rows.
+:func:`check_query_budgets` sends a request to every route with all caches
+cleared, against seeded data, and fails on any route that breaks its budget,
+has no budget or has no request case. It runs in the test suite
+(tests/test_query_budgets.py) and as ``flask check query-budgets``.
+"""
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more SQL statements than its view's budget.
+
+    Attributes:
+        endpoint: String, endpoint of the request.
+        budget: Integer, statements allowed.
+        statements: List of String, statements the request ran.
+    """
+
+    def __init__(self, endpoint, budget, statements):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.statements = statements
+        listing = '\n'.join(f'  {number}. {" ".join(statement.split())}'
+                            for number, statement in enumerate(statements, 1))
+        super().__init__(f'{endpoint} ran {len(statements)} SQL statements, budget {budget}:\n{listing}')
+
+
+def query_budget(limit):
+    """Declare the most SQL statements one request to a view may run.
+
+    Apply it below ``@main.route`` (the order among the other view decorators
+    does not matter, as they copy the attribute it sets).
+
+    Args:
+        limit: Integer, statements allowed per request.
+
+    Returns:
+        Callable: Decorator that records the budget on the view.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def budget_for(app, endpoint):
+    """Return the query budget of an endpoint, or None if it has none."""
+    return getattr(app.view_functions.get(endpoint), 'query_budget', None)
+
+
+class QueryBudgets:
+    """Flask extension enforcing the budgets declared with :func:`query_budget`."""
+
+    def init_app(self, app):
+        """Install the request hooks.
+
+        Args:
+            app: Flask, the application.
+        """
+        app.extensions['query_budgets'] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if not event.contains(Engine, 'before_cursor_execute', self._record):
+            event.listen(Engine, 'before_cursor_execute', self._record)
+
+    @staticmethod
+    def mode(app):
+        """Return the budget mode of an app: 'raise', 'log' or 'off'."""
+        mode = app.config.get('QUERY_BUDGET_MODE')
+        if mode:
+            return mode
+        if app.testing:
+            return 'raise'
+        return 'log' if app.debug else 'off'
+
+    def _start(self):
+        if self.mode(current_app) != 'off':
+            g._budget_statements = []
+
+    @staticmethod
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            statements = g.get('_budget_statements')
+            if statements is not None:
+                statements.append(statement)
+
+    def _finish(self, response):
+        statements = g.pop('_budget_statements', None)
+        if statements is None:
+            return response
+        budget = budget_for(current_app, request.endpoint)
+        if budget is not None and len(statements) > budget:
+            error = QueryBudgetExceeded(request.endpoint, budget, statements)
+            if self.mode(current_app) == 'raise':
+                raise error
+            current_app.logger.warning('%s', error)
+        return response
+
+
+query_budgets = QueryBudgets()
+
+
+# Requests sent by check_query_budgets(): endpoint, method, path, form data,
+# who is logged in ('admin', 'user' or None) and the expected status. Ids
+# refer to the rows created by seed_data(users=5, posts=30) in bench.py.
+def _request_cases():
+    from bench import BENCH_PASSWORD
+
+    comment = {'content': 'Budget check comment'}
+    post = {'title': 'Budget check post', 'content': 'Some *markdown*.', 'tags': 'topic1, budget'}
+    return [
+        ('main.index', 'GET', '/', None, None, 200),
+        ('main.sip', 'GET', '/sip', None, None, 200),
+        ('main.sip', 'GET', '/sip', None, 'user', 200),
+        ('main.sip_tag', 'GET', '/sip/tag/topic1', None, None, 200),
+        ('main.search', 'GET', '/search?q=sensor', None, None, 200),
+        ('main.feed', 'GET', '/feed.atom', None, None, 200),
+        ('main.api_posts', 'GET', '/api/posts?since=2024-01-01T12:00:00Z', None, None, 200),
+        ('main.sip_brief', 'GET', '/sip_brief', None, None, 200),
+        ('main.boards', 'GET', '/boards', None, None, 200),
+        ('main.projects', 'GET', '/projects', None, None, 200),
+        ('main.contact', 'GET', '/contact', None, None, 200),
+        ('main.contact', 'POST', '/contact',
+         {'name': 'Budget', 'email': 'budget@example.com', 'message': 'Hello'}, None, 302),
+        ('main.register', 'GET', '/register', None, None, 200),
+        ('main.register', 'POST', '/register',
+         {'username': 'budget', 'email': 'budget@example.com', 'password': 'secret', 'confirm_password': 'secret'},
+         None, 302),
+        ('main.login', 'GET', '/login', None, None, 200),
+        ('main.login', 'POST', '/login', {'email': 'bench2@example.com', 'password': BENCH_PASSWORD}, None, 302),
+        ('main.add_post', 'GET', '/sip/add', None, 'admin', 200),
+        ('main.add_post', 'POST', '/sip/add', post, 'admin', 302),
+        ('main.update_post', 'GET', '/post/1/update', None, 'admin', 200),
+        ('main.update_post', 'POST', '/post/1/update', post, 'admin', 302),
+        ('main.add_comment', 'POST', '/post/1/comment', comment, 'user', 302),
+        ('main.reply_comment', 'POST', '/comment/1/reply', comment, 'user', 302),
+        ('main.post_comments', 'GET', '/post/1/comments', None, None, 200),
+        ('main.post_comments', 'GET', '/post/1/comments?format=json', None, None, 200),
+        ('main.comment_replies', 'GET', '/comment/1/replies', None, None, 200),
+        ('main.delete_post', 'GET', '/post/10/delete', None, 'admin', 302),
+        ('main.delete_post', 'GET', '/post/999/delete', None, 'admin', 404),
+        ('main.admin_metrics', 'GET', '/admin/metrics', None, 'admin', 200),
+        ('main.admin_comments', 'GET', '/admin/comments', None, 'admin', 200),
+        ('main.admin_comments', 'GET', '/admin/comments?post=2&status=visible&since=2024-01-01', None, 'admin', 200),
+        ('main.moderate_comments', 'POST', '/admin/comments/moderate',
+         {'action': 'hide', 'scope': 'selected', 'comment_id': ['3', '4']}, 'admin', 302),
+        ('main.moderate_comments', 'POST', '/admin/comments/moderate?post=2',
+         {'action': 'show', 'scope': 'matching'}, 'admin', 302),
+        ('main.moderate_comments', 'POST', '/admin/comments/moderate',
+         {'action': 'delete', 'scope': 'selected', 'comment_id': ['5']}, 'admin', 302),
+        ('main.test_db', 'GET', '/test_db', None, None, 200),
+        ('main.make_me_admin', 'GET', '/make_me_admin', None, 'user', 200),
+        ('main.logout', 'GET', '/logout', None, 'user', 302),
+    ]
+
+
+def _clear_caches():
+    """Empty every in-process cache, so each request meets them cold."""
+    from caching import document_cache, post_card_cache, static_pages, tag_cloud_cache, user_cache
+
+    for cache in (post_card_cache, tag_cloud_cache, user_cache, document_cache, static_pages):
+        cache.clear()
+
+
+def check_query_budgets(app, endpoints=None):
+    """Send a request to every route and compare its statements with its budget.
+
+    Caches are cleared before each request and enforcement is switched off,
+    so every case runs to completion and is reported here instead. Writes go
+    to the app's database, which should be a scratch database filled by
+    ``seed_data()``.
+
+    Args:
+        app: Flask, the application, with CSRF protection off and
+            instrumentation on (for ``/admin/metrics``).
+        endpoints: Iterable of String, only check these endpoints; None
+            checks every endpoint of the ``main`` blueprint.
+
+    Returns:
+        list: One ``(endpoint, method, path, status, statements, budget,
+        problems)`` tuple per request, where ``problems`` lists what failed.
+        Endpoints with no request case are reported with a method and path of None.
+    """
+    ids = {'admin': 1, 'user': 2}
+    if endpoints is None:
+        endpoints = [endpoint for endpoint in app.view_functions if endpoint.startswith('main.')]
+    endpoints = set(endpoints)
+    cases = [case for case in _request_cases() if case[0] in endpoints]
+    results = []
+    saved_mode = app.config.get('QUERY_BUDGET_MODE')
+    app.config['QUERY_BUDGET_MODE'] = 'off'
+    try:
+        for endpoint, method, path, data, who, expected_status in cases:
+            _clear_caches()
+            client = app.test_client()
+            if who:
+                with client.session_transaction() as session:
+                    session['_user_id'] = str(ids[who])
+                    session['_fresh'] = True
+
+            statements = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                if has_request_context():
+                    statements.append(statement)
+
+            event.listen(Engine, 'before_cursor_execute', record)
+            try:
+                response = client.open(path, method=method, data=data)
+            finally:
+                event.remove(Engine, 'before_cursor_execute', record)
+
+            budget = budget_for(app, endpoint)
+            problems = []
+            if response.status_code != expected_status:
+                problems.append(f'status {response.status_code}, expected {expected_status}')
+            if budget is None:
+                problems.append('no query budget declared')
+            elif len(statements) > budget:
+                problems.append(str(QueryBudgetExceeded(endpoint, budget, statements)))
+            results.append((endpoint, method, path, response.status_code, len(statements), budget, problems))
+    finally:
+        app.config['QUERY_BUDGET_MODE'] = saved_mode
+        _clear_caches()
+
+    covered = {case[0] for case in cases}
+    for endpoint in sorted(endpoints):
+        if endpoint not in covered:
+            results.append((endpoint, None, None, None, None, budget_for(app, endpoint), ['no request case']))
+    return results
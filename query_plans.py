@@ -0,0 +1,197 @@
+"""Query-plan regression checks for SIP311 Project Blog.
+
+Each entry in :func:`hot_queries` mirrors a query the site runs on a hot path.
+:func:`check_query_plans` runs ``EXPLAIN`` on every one of them and reports
+any that would read a whole table (or sort rows the index should already
+deliver in order), which usually means an index is missing or a query was
+changed so it can no longer use one.
+
+By default the checks run against a throwaway in-memory SQLite database built
+from the models and seeded with enough rows for the planner to prefer indexes,
+both in the test suite (tests/test_query_plans.py, which also checks a scratch
+MySQL database when ``TEST_MYSQL_URL`` is set) and through ``flask check
+query-plans``; ``--app-db`` runs them against the configured database
+instead, e.g. the MySQL schema produced by the migrations.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select, text
+
+from extensions import db
+
+# Boundary values used in the hot queries; any realistic value will do
+CURSOR_DATE = datetime(2025, 3, 1)
+CURSOR_ID = 500
+
+_SQLITE_TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?\w+(?: AS \w+)?$')
+
+
+def hot_queries():
+    """Return the queries whose plans must stay index-backed.
+
+    Returns:
+        dict: Query name to SQLAlchemy select.
+    """
+    from models import Comment, OutboundMail, Post, Tag, User, post_tag
+
+    newest_first = (Post.date.desc(), Post.id.desc())
+    comments_newest_first = (Comment.date.desc(), Comment.id.desc())
+    return {
+        'blog page': select(Post.id, Post.date, Post.revision).order_by(*newest_first).limit(11),
+        'blog page after cursor': (
+            select(Post.id, Post.date, Post.revision)
+            .where(Post.date <= CURSOR_DATE, db.or_(Post.date < CURSOR_DATE, Post.id < CURSOR_ID))
+            .order_by(*newest_first).limit(11)
+        ),
+        'posts with a tag': (
+            select(Post.id, Post.date, Post.revision)
+            .join(post_tag, post_tag.c.post_id == Post.id)
+            .join(Tag, Tag.id == post_tag.c.tag_id)
+            .where(Tag.name == 'tag3', post_tag.c.post_date <= CURSOR_DATE,
+                   db.or_(post_tag.c.post_date < CURSOR_DATE, post_tag.c.post_id < CURSOR_ID))
+            .order_by(post_tag.c.post_date.desc(), post_tag.c.post_id.desc()).limit(11)
+        ),
+        'blog version stamp': select(
+            select(db.func.count(Post.id)).scalar_subquery(),
+            select(db.func.max(Post.date)).scalar_subquery(),
+            select(db.func.max(Post.updated_at)).scalar_subquery(),
+            select(db.func.count(Comment.id)).scalar_subquery(),
+            select(db.func.max(Comment.date)).scalar_subquery(),
+            select(db.func.sum(Post.revision)).scalar_subquery(),
+        ),
+        'comment threads of a post': (
+            select(Comment.id, Comment.date)
+            .where(Comment.post_id == 1, Comment.parent_id.is_(None), Comment.date >= CURSOR_DATE,
+                   db.or_(Comment.date > CURSOR_DATE, Comment.id > CURSOR_ID))
+            .order_by(Comment.date, Comment.id).limit(21)
+        ),
+        'visible comments of a post': (
+            select(Comment.id, Comment.content)
+            .where(Comment.post_id == 1, Comment.is_hidden == db.false())
+            .order_by(Comment.date, Comment.id)
+        ),
+        'replies to a comment': select(Comment.id).where(Comment.parent_id == 1),
+        'comments by a user': select(Comment.id).where(Comment.user_id == 1),
+        'moderation queue': select(Comment.id).order_by(*comments_newest_first).limit(51),
+        'moderation queue for a post': (
+            select(Comment.id).where(Comment.post_id == 1).order_by(*comments_newest_first).limit(51)
+        ),
+        'moderation queue for a user': (
+            select(Comment.id)
+            .where(Comment.user_id == select(User.id).where(User.username == 'user1').scalar_subquery())
+            .order_by(*comments_newest_first).limit(51)
+        ),
+        'user by email': select(User.id, User.password).where(User.email == 'someone@example.com'),
+        'due mail': (
+            select(OutboundMail.id)
+            .where(OutboundMail.status == 'pending', OutboundMail.next_attempt_at <= CURSOR_DATE)
+            .order_by(OutboundMail.next_attempt_at, OutboundMail.id).limit(20)
+        ),
+    }
+
+
+def seed_sample_data(engine, posts=2000, comments_per_post=10, users=50, tags=20):
+    """Create the schema on ``engine`` and fill it with synthetic rows.
+
+    Args:
+        engine: Engine, an empty database.
+        posts: Integer, number of posts.
+        comments_per_post: Integer, comments on each post.
+        users: Integer, number of users.
+        tags: Integer, number of tags.
+    """
+    from models import Comment, OutboundMail, Post, Tag, User, post_tag
+
+    db.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'role': 'user'}
+            for i in range(1, users + 1)
+        ])
+        connection.execute(insert(Tag), [{'id': i, 'name': f'tag{i}'} for i in range(1, tags + 1)])
+        connection.execute(insert(Post), [
+            {'id': i, 'title': f'Post {i}', 'date': start + timedelta(hours=i), 'content': 'x',
+             'content_html': '<p>x</p>', 'user_id': i % users + 1, 'revision': 0}
+            for i in range(1, posts + 1)
+        ])
+        connection.execute(insert(post_tag), [
+            {'post_id': i, 'tag_id': tag, 'post_date': start + timedelta(hours=i)}
+            for i in range(1, posts + 1) for tag in {i % tags + 1, (i * 7) % tags + 1}
+        ])
+        connection.execute(insert(Comment), [
+            {'content': 'x', 'date': start + timedelta(hours=post_id, minutes=n), 'is_hidden': n % 9 == 0,
+             'user_id': (post_id + n) % users + 1, 'post_id': post_id, 'parent_id': None}
+            for post_id in range(1, posts + 1) for n in range(comments_per_post)
+        ])
+        connection.execute(insert(OutboundMail), [
+            {'sender': 'a@example.com', 'recipients': '[]', 'subject': 's', 'text_body': 'b',
+             'status': 'sent' if i % 10 else 'pending', 'attempts': 1,
+             'next_attempt_at': start + timedelta(minutes=i), 'created_at': start}
+            for i in range(posts)
+        ])
+        if engine.dialect.name == 'sqlite':
+            connection.execute(text('ANALYZE'))
+        elif engine.dialect.name == 'mysql':
+            tables = ', '.join(table.name for table in (User.__table__, Tag.__table__, Post.__table__, post_tag,
+                                                        Comment.__table__, OutboundMail.__table__))
+            connection.execute(text(f'ANALYZE TABLE {tables}'))
+
+
+def explain(connection, statement):
+    """Return the plan problems and plan lines for one statement.
+
+    Args:
+        connection: Connection, database to explain against.
+        statement: Select, statement to explain.
+
+    Returns:
+        tuple: ``(problems, plan_lines)`` lists of strings.
+    """
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    problems = []
+    lines = []
+
+    if dialect.name == 'sqlite':
+        for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}')):
+            detail = row[-1]
+            lines.append(detail)
+            if _SQLITE_TABLE_SCAN.match(detail):
+                problems.append(f'table scan: {detail}')
+            elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                problems.append(f'sort not served by an index: {detail}')
+    elif dialect.name == 'mysql':
+        for row in connection.execute(text(f'EXPLAIN {sql}')).mappings():
+            lines.append(', '.join(f'{key}={value}' for key, value in row.items()))
+            if row['type'] == 'ALL':
+                problems.append(f"table scan of {row['table']}")
+            if row['Extra'] and 'Using filesort' in row['Extra']:
+                problems.append(f"sort not served by an index on {row['table']}")
+    else:
+        raise ValueError(f'No plan checks for the {dialect.name} dialect')
+
+    return problems, lines
+
+
+def check_query_plans(engine=None):
+    """Explain every hot query and collect the ones with bad plans.
+
+    Args:
+        engine: Engine to check against; defaults to a seeded in-memory SQLite
+            database.
+
+    Returns:
+        dict: Query name to ``(problems, plan_lines)``.
+    """
+    if engine is None:
+        engine = create_engine('sqlite://')
+        seed_sample_data(engine)
+
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in hot_queries().items():
+            results[name] = explain(connection, statement)
+    return results
@@ -1,87 +1,303 @@
 """Routes for SIP311 Project Blog using a Flask Blueprint.
 
 This module defines a 'main' blueprint containing routes for the homepage, project
-blog, SIP brief, boards, projects, contact, user registration, login, logout, and
-admin post creation. It integrates with Flask-SQLAlchemy, Flask-Bcrypt, Flask-Login,
-Flask-WTF, python-markdown, and SMTP2GO's API.
+blog, SIP brief, boards, projects, contact, user registration, login, logout,
+admin post creation and comment moderation. It integrates with Flask-SQLAlchemy,
+Flask-Bcrypt, Flask-Login, Flask-WTF, and SMTP2GO's API.
 """
-import os
 from datetime import datetime, UTC
-import markdown
-import requests
-from flask import Blueprint, current_app, render_template, request, flash, redirect, url_for, abort
+from flask import (Blueprint, current_app, render_template, request, flash, redirect, url_for, abort, jsonify,
+                   make_response)
 from flask_login import login_user, logout_user, login_required, current_user
-
-from forms import CommentForm, RegisterForm, LoginForm, PostForm
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import load_only
+
+from caching import (blog_version, document_response, fragment_etag, invalidate_user, not_modified_response,
+                     page_etag, post_card_cache, render_post_cards, set_cache_headers, static_page_response,
+                     tag_cloud)
+from comments import load_comment_threads
+from feeds import post_to_dict, post_url, render_atom_feed
+from forms import CommentForm, ModerationForm, RegisterForm, LoginForm, PostForm
+from hashing import HashingBusy, password_hasher
+from images import copy_known_variants, image_dir, process_image, save_upload
+from mailer import enqueue_mail, notify_worker
+from metrics import request_metrics
+from pagination import keyset_page
+from query_budgets import query_budget
+from search import get_search_index
 
 main = Blueprint('main', __name__)
 
+# Templates served by static_page_response(); they use no data beyond login state
+STATIC_PAGE_TEMPLATES = ('index.html', 'sip_brief.html', 'boards.html', 'projects.html')
+
 
 @main.route('/')
+@query_budget(1)
 def index():
     """Render the homepage.
 
     Returns:
-        str: Rendered HTML template for the homepage.
+        Response: Homepage, served from the in-memory page cache.
     """
-    return render_template('index.html')
+    return static_page_response('index.html')
 
 
 @main.route('/sip')
+@query_budget(7)
 def sip():
-    """Render the project blog page.
+    """Render one page of the project blog.
+
+    Posts are paginated newest first with keyset cursors on ``(date, id)``.
+    The ``before`` query parameter selects the page of posts older than a
+    cursor and ``after`` the page of posts newer than it. The page size comes
+    from the ``SIP_PAGE_SIZE`` config value.
+
+    Conditional requests are answered with 304 when the blog's version stamp
+    has not changed, before any listing query or template rendering runs.
+    Otherwise only the ids and revisions of the page's posts are queried, and
+    post cards are served from the fragment cache where possible.
 
     Returns:
-        str: Rendered HTML template for the project blog.
+        Response: Rendered project blog, or 304 Not Modified.
     """
     from models import Post
 
-    posts = Post.query.order_by(Post.date.desc()).all()
+    return _blog_listing(Post.query, Post.date, Post.id)
+
+
+@main.route('/sip/tag/<name>')
+@query_budget(6)
+def sip_tag(name):
+    """Render one page of the project blog's posts with a tag.
+
+    Works like :func:`sip`, but pages through ``post_tag`` on its
+    ``(tag_id, post_date, post_id)`` index, so a filtered page reads only the
+    rows it shows.
+
+    Args:
+        name: String, tag name.
+
+    Returns:
+        Response: Rendered tag listing, or 304 Not Modified.
+    """
+    from models import Post, Tag, post_tag
+
+    query = (Post.query
+             .join(post_tag, post_tag.c.post_id == Post.id)
+             .join(Tag, Tag.id == post_tag.c.tag_id)
+             .filter(Tag.name == name))
+    return _blog_listing(query, post_tag.c.post_date, post_tag.c.post_id, tag=name)
+
+
+def _blog_listing(query, date_column, id_column, tag=None):
+    """Render one keyset-paginated page of blog posts.
+
+    Args:
+        query: Post query selecting the posts to list.
+        date_column: Column, date to page on (descending).
+        id_column: Column, post id to break ties on (descending).
+        tag: String, name of the tag being listed, if any.
+
+    Returns:
+        Response: Rendered listing, or 304 Not Modified.
+    """
+    from models import Post, Tag
+
+    version = blog_version()
+    etag = page_etag(version, tag or '')
+    not_modified = not_modified_response(etag, version.last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        page = keyset_page(
+            query.options(load_only(Post.date, Post.revision)),
+            date_column,
+            id_column,
+            current_app.config['SIP_PAGE_SIZE'],
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+        )
+    except ValueError:
+        abort(400)
+    if tag and not page.items and Tag.query.filter_by(name=tag).first() is None:
+        abort(404)
+
+    cards = render_post_cards(page.items)
     form = CommentForm()
-    return render_template('sip.html', posts=posts, markdown=markdown, form=form)
+    response = make_response(render_template(
+        'sip.html', posts=page.items, cards=cards, page=page, form=form, tag=tag, tags=tag_cloud(version),
+    ))
+    return set_cache_headers(response, etag, version.last_modified)
+
+
+@main.route('/search')
+@query_budget(3)
+def search():
+    """Search the project blog.
+
+    The ``q`` query parameter holds the search text and ``page`` the 1-based
+    results page. Results are ranked and highlighted by the database's
+    full-text index (see search.py); pages are ``SEARCH_PAGE_SIZE`` results
+    long and stop at ``SEARCH_MAX_PAGE``.
+
+    Returns:
+        Response: Rendered search results, or 304 Not Modified.
+    """
+    query = request.args.get('q', '').strip()
+    page_number = request.args.get('page', 1, type=int)
+    if not 1 <= page_number <= current_app.config['SEARCH_MAX_PAGE']:
+        abort(400)
+
+    version = blog_version()
+    etag = page_etag(version)
+    not_modified = not_modified_response(etag, version.last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    results = None
+    if query:
+        results = get_search_index().search(query, page_number, current_app.config['SEARCH_PAGE_SIZE'])
+    response = make_response(render_template('search.html', query=query, results=results, post_url=post_url))
+    return set_cache_headers(response, etag, version.last_modified)
+
+
+@main.route('/feed.atom')
+@query_budget(4)
+def feed():
+    """Serve the Atom feed of the newest posts.
+
+    Built from the stored post HTML and cached per blog version, so a poll
+    costs the version query and, if the reader is current, nothing more.
+
+    Returns:
+        Response: Atom feed of the newest ``FEED_SIZE`` posts, or 304 Not
+        Modified.
+    """
+    from models import Post
+
+    version = blog_version()
+
+    def render():
+        posts = (Post.listing_query()
+                 .order_by(Post.date.desc(), Post.id.desc())
+                 .limit(current_app.config['FEED_SIZE'])
+                 .all())
+        return render_atom_feed(posts, version.last_modified)
+
+    return document_response(fragment_etag('feed', version.stamp), version.last_modified,
+                             'application/atom+xml', render)
+
+
+@main.route('/api/posts')
+@query_budget(4)
+def api_posts():
+    """List posts as JSON, newest first.
+
+    Query parameters:
+
+    * ``before`` / ``after``: keyset cursors (``next_cursor`` and
+      ``prev_cursor`` of another page) selecting older or newer posts;
+    * ``since``: ISO 8601 time; only posts created or changed after it are
+      listed, so pollers can fetch just what is new.
+
+    Pages are ``API_PAGE_SIZE`` posts long and cached per blog version and
+    query string, with ETag/304 support.
+
+    Returns:
+        Response: JSON page of posts, 304 Not Modified, or 400 for malformed
+        parameters.
+    """
+    from extensions import db
+    from models import Post
+
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        except ValueError:
+            abort(400)
+        if since.tzinfo is not None:
+            since = since.astimezone(UTC).replace(tzinfo=None)
+
+    version = blog_version()
+    page_size = current_app.config['API_PAGE_SIZE']
+
+    def render():
+        query = Post.listing_query()
+        if since:
+            query = query.filter(db.or_(Post.date > since, Post.updated_at > since))
+        page = keyset_page(query, Post.date, Post.id, page_size,
+                           before=request.args.get('before'), after=request.args.get('after'))
+
+        def page_url(**cursor):
+            return url_for('main.api_posts', **cursor, **({'since': request.args['since']} if since else {}),
+                           _external=True)
+
+        return current_app.json.dumps({
+            'posts': [post_to_dict(post) for post in page.items],
+            'next_cursor': page.older_cursor,
+            'next_url': page_url(before=page.older_cursor) if page.older_cursor else None,
+            'prev_cursor': page.newer_cursor,
+            'prev_url': page_url(after=page.newer_cursor) if page.newer_cursor else None,
+        })
+
+    try:
+        return document_response(fragment_etag('api_posts', version.stamp), version.last_modified,
+                                 'application/json', render)
+    except ValueError:
+        abort(400)
 
 
 @main.route('/sip_brief')
+@query_budget(1)
 def sip_brief():
     """Render the SIP Brief page.
 
     Returns:
-        str: Rendered HTML template for the SIP Brief.
+        Response: SIP Brief page, served from the in-memory page cache.
     """
-    return render_template('sip_brief.html')
+    return static_page_response('sip_brief.html')
 
 
 @main.route('/boards')
+@query_budget(1)
 def boards():
     """Render the boards page.
 
     Returns:
-        str: Rendered HTML template for the boards page.
+        Response: Boards page, served from the in-memory page cache.
     """
-    return render_template('boards.html')
+    return static_page_response('boards.html')
 
 
 @main.route('/projects')
+@query_budget(1)
 def projects():
     """Render the projects page.
 
     Returns:
-        str: Rendered HTML template for the projects page.
+        Response: Projects page, served from the in-memory page cache.
     """
-    return render_template('projects.html')
+    return static_page_response('projects.html')
 
 
 @main.route('/contact', methods=['GET', 'POST'])
+@query_budget(2)
 def contact():
     """Handle contact form submission and render the contact page.
 
-    Processes form data on POST requests, sending an email via SMTP2GO's API.
+    Processes form data on POST requests, queuing an email for the mail worker
+    to send via SMTP2GO's API, so the request never waits on the API.
     Handles both regular contact forms and error reports.
     Renders the contact page on GET requests.
 
     Returns:
         str: Rendered HTML template or redirect on successful submission.
     """
+    from extensions import db
+
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
@@ -108,23 +324,14 @@ This is an automated error report from the SIP Website.'''
             subject = 'SIP Website Contact Form Submitted'
             body = f'Name: {name}\nEmail: {email}\nMessage: {message}'
 
-        payload = {
-            'api_key': current_app.config['SMTP2GO_API_KEY'],
-            'sender': email,
-            'to': ['arolfe90275@uat.edu'],
-            'subject': subject,
-            'text_body': body
-        }
-
-        headers = {'Content-Type': 'application/json'}
-
         try:
-            response = requests.post(
-                current_app.config['SMTP2GO_API_URL'],
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
+            enqueue_mail(email, ['arolfe90275@uat.edu'], subject, body)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            flash('An error occurred while sending your message. Please try again.', 'danger')
+        else:
+            notify_worker(current_app._get_current_object())
 
             if error_type:
                 flash('Thank you for reporting this issue! We will investigate and fix it as soon as possible.',
@@ -133,13 +340,12 @@ This is an automated error report from the SIP Website.'''
                 flash('Your message has been sent successfully!', 'success')
 
             return redirect(url_for('main.contact'))
-        except requests.RequestException:
-            flash('An error occurred while sending your message. Please try again.', 'danger')
 
     return render_template('contact.html')
 
 
 @main.route('/register', methods=['GET', 'POST'])
+@query_budget(2)
 def register():
     """Handle user registration.
 
@@ -149,7 +355,7 @@ def register():
     Returns:
         str: Rendered HTML template or redirect on successful registration.
     """
-    from extensions import bcrypt, db
+    from extensions import db
 
     from models import User
 
@@ -158,7 +364,11 @@ def register():
 
     form = RegisterForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        try:
+            hashed_password = password_hasher.hash(form.password.data)
+        except HashingBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('register.html', form=form), 503
         user = User(
             username=form.username.data,
             email=form.email.data,
@@ -175,15 +385,18 @@ def register():
 
 
 @main.route('/login', methods=['GET', 'POST'])
+@query_budget(3)
 def login():
     """Handle user login.
 
-    Authenticates user credentials and logs in the user.
+    Authenticates user credentials and logs in the user. Passwords hashed
+    with an outdated bcrypt cost are rehashed at the current cost when the
+    hashing pool has room; a busy pool never blocks the login itself.
 
     Returns:
         str: Rendered HTML template or redirect on successful login.
     """
-    from app import bcrypt
+    from extensions import db
     from models import User
 
     if current_user.is_authenticated:
@@ -192,7 +405,22 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        try:
+            authenticated = user is not None and password_hasher.verify(user.password, form.password.data)
+        except HashingBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('login.html', form=form), 503
+
+        if authenticated:
+            # Upgrading the hash is best-effort; when busy the old one is kept until the next login
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(form.password.data)
+                except HashingBusy:
+                    pass
+                else:
+                    db.session.commit()
+                    invalidate_user(user.id)
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('main.index'))
@@ -203,6 +431,7 @@ def login():
 
 
 @main.route('/logout')
+@query_budget(2)
 @login_required
 def logout():
     """Log out the current user.
@@ -216,6 +445,7 @@ def logout():
 
 
 @main.route('/sip/add', methods=['GET', 'POST'])
+@query_budget(14)
 @login_required
 def add_post():
     """Handle creation of new blog posts (admin only).
@@ -237,28 +467,29 @@ def add_post():
         title = request.form.get('title')
         content = request.form.get('content')
 
-        # Convert markdown to html
-        html_content = markdown.markdown(content)
-
-        # Prepare your Post model and save to DB
-        post = Post(title=title, content=html_content, author=current_user)
-
-        # Check request.files contents
-        print(f"request.files: {request.files}")
+        # Prepare your Post model, rendering the markdown once, and save to DB
+        post = Post(title=title, user_id=current_user.id)
+        post.set_content(content)
 
-        # check if the post request has the file part
-        if 'image' in request.files:
-            image = request.files['image']
-            print(f"Image filename: {image.filename}")
-            if image.filename != '':
-                # save the file and set path to the model post.image_path
-                image_path = os.path.join(current_app.root_path, 'static/images', image.filename)
-                print(f"Image path: {image_path}")
-                image.save(image_path)
-                post.image_path = image.filename
+        # Store the image under its content hash; identical uploads are stored once
+        new_image = None
+        image = request.files.get('image')
+        if image and image.filename != '':
+            filename, is_new = save_upload(image, image_dir(current_app))
+            post.image_path = filename
+            if is_new or not copy_known_variants(post, filename):
+                new_image = filename
 
         db.session.add(post)
+        post.set_tags((form.tags.data or '').split(','))
+        get_search_index().index_post(post.id, post.title, post.content)
         db.session.commit()
+        post_card_cache.invalidate(post.id)
+
+        # Resized and WebP variants are generated off the request (see IMAGE_PROCESSING)
+        if new_image:
+            process_image(current_app._get_current_object(), new_image)
+
         flash('Post created successfully!', 'success')
         return redirect(url_for('main.sip'))
 
@@ -267,6 +498,7 @@ def add_post():
 
 # TODO: Remove this route prior to publishing to production
 @main.route('/make_me_admin', methods=['GET'])
+@query_budget(5)
 @login_required
 def make_me_admin():
     """
@@ -281,14 +513,18 @@ def make_me_admin():
     Returns:
         str: A message acknowledging the successful change of role.
     """
-    from app import db
+    from extensions import db
+    from models import User
 
-    current_user.role = 'admin'
+    user = db.session.get(User, current_user.id)
+    user.update_role('admin')
     db.session.commit()
+    invalidate_user(user.id)
     return "You are now an admin!"
 
 
 @main.route('/post/<int:id>/update', methods=['GET', 'POST'])
+@query_budget(14)
 @login_required
 def update_post(id):
     """
@@ -316,10 +552,15 @@ def update_post(id):
     if form.validate_on_submit():
         # Fetch the form data
         post.title = form.title.data
-        post.content = form.content.data
+        post.set_content(form.content.data)
+        post.set_tags((form.tags.data or '').split(','))
+        post.revision = Post.revision + 1
+        post.updated_at = datetime.now(UTC)
+        get_search_index().index_post(post.id, post.title, post.content)
 
         # Save to DB
         db.session.commit()
+        post_card_cache.invalidate(post.id)
 
         flash('Your post has been updated!', 'success')
         return redirect(url_for('main.sip'))
@@ -327,6 +568,7 @@ def update_post(id):
     elif request.method == 'GET':
         form.title.data = post.title
         form.content.data = post.content
+        form.tags.data = ', '.join(tag.name for tag in post.tags)
 
     if current_user.role == 'admin':
         return render_template('update_post.html', post=post, form=form)
@@ -335,13 +577,15 @@ def update_post(id):
 
 
 @main.route('/post/<int:id>/delete', methods=['GET'])
+@query_budget(9)
 @login_required
 def delete_post(id):
     """
     Delete a post.
 
-    This function will delete the post with the provided ID from the database
-    and then redirect the user to the home page.
+    This function will delete the post with the provided ID from the database,
+    along with its comments and tag links (see archive.py), and then redirect
+    the user to the home page.
 
     Args:
         id (int): ID of the post to be deleted.
@@ -349,17 +593,16 @@ def delete_post(id):
     Returns:
         HTTP response.
     """
+    from archive import delete_posts
     from extensions import db
-    from models import Post
 
     if not current_user.role == 'admin':
         return "401 Unauthorized", 401
 
-    # Query our Post by id
-    post = Post.query.get_or_404(id)
-
-    # Delete the queried post
-    db.session.delete(post)
+    # Delete the post with its comment tree and tag links, set-based
+    if not delete_posts([id])['posts']:
+        db.session.rollback()
+        abort(404)
     db.session.commit()
 
     flash('Your post has been deleted!', 'success')
@@ -367,10 +610,11 @@ def delete_post(id):
 
 
 @main.route('/post/<int:post_id>/comment', methods=['POST'])
+@query_budget(4)
 @login_required
 def add_comment(post_id):
     from extensions import db
-    from models import Comment
+    from models import Comment, Post
 
     form = CommentForm()
     if form.validate_on_submit():
@@ -378,9 +622,12 @@ def add_comment(post_id):
         content = form.content.data
 
         # Prepare your Comment model and save to DB
-        comment = Comment(content=content, user_id=current_user.id, post_id=post_id)
+        comment = Comment(content=content, user_id=current_user.id, post_id=post_id,
+                          date=datetime.now(UTC))
         db.session.add(comment)
+        Post.record_comment(post_id, comment.date)
         db.session.commit()
+        post_card_cache.invalidate(post_id)
         flash('Your comment has been added!', 'success')
         return redirect(url_for('main.sip'))
     else:
@@ -388,7 +635,285 @@ def add_comment(post_id):
         return redirect(url_for('main.sip'))
 
 
+@main.route('/comment/<int:comment_id>/reply', methods=['POST'])
+@query_budget(6)
+@login_required
+def reply_comment(comment_id):
+    """Handle a reply to an existing comment.
+
+    Args:
+        comment_id: Integer, ID of the comment being replied to.
+
+    Returns:
+        Response: Redirect to the project blog.
+    """
+    from extensions import db
+    from models import Comment, Post
+
+    parent = db.session.get(Comment, comment_id, options=[load_only(Comment.post_id)])
+    if parent is None:
+        abort(404)
+
+    form = CommentForm()
+    if form.validate_on_submit():
+        reply = Comment(content=form.content.data, user_id=current_user.id,
+                        post_id=parent.post_id, parent_id=parent.id, date=datetime.now(UTC))
+        db.session.add(reply)
+        Post.record_comment(parent.post_id, reply.date)
+        db.session.commit()
+        post_card_cache.invalidate(parent.post_id)
+        flash('Your reply has been added!', 'success')
+    else:
+        flash('Reply failed. Please try again.', 'danger')
+    return redirect(url_for('main.sip'))
+
+
+@main.route('/post/<int:post_id>/comments')
+@query_budget(3)
+def post_comments(post_id):
+    """Render one page of a post's comment threads.
+
+    The blog listing only shows a comment count; this endpoint is fetched
+    when a post's Comments button is first opened. Top-level comments are
+    paginated oldest first, ``COMMENT_PAGE_SIZE`` at a time, each with its
+    replies ``COMMENT_MAX_DEPTH`` levels deep, all in a single query. The
+    ``after`` query parameter is a cursor from the previous page.
+
+    Responses are an HTML fragment, or JSON when ``format=json`` is given.
+    Their ETag follows the post's revision, so unchanged comments are
+    answered with 304 after a single primary-key lookup.
+
+    Args:
+        post_id: Integer, ID of the post.
+
+    Returns:
+        Response: Comments fragment or JSON page, or 304 Not Modified.
+    """
+    from extensions import db
+    from models import Post
+
+    post = db.session.execute(
+        db.select(Post.revision, Post.updated_at).where(Post.id == post_id)
+    ).first()
+    if post is None:
+        abort(404)
+    return _comment_page_response(post, 'main.post_comments', {'post_id': post_id}, 'More comments')
+
+
+@main.route('/comment/<int:comment_id>/replies')
+@query_budget(3)
+def comment_replies(comment_id):
+    """Render the next page of replies to a comment.
+
+    Used by the "load more replies" links below comments at the depth limit.
+    Works like :func:`post_comments`, with the replies to one comment as the
+    threads.
+
+    Args:
+        comment_id: Integer, ID of the comment whose replies to load.
+
+    Returns:
+        Response: Replies fragment or JSON page, or 304 Not Modified.
+    """
+    from extensions import db
+    from models import Comment, Post
+
+    post = db.session.execute(
+        db.select(Post.revision, Post.updated_at)
+        .join(Comment, Comment.post_id == Post.id)
+        .where(Comment.id == comment_id)
+    ).first()
+    if post is None:
+        abort(404)
+    return _comment_page_response(post, 'main.comment_replies', {'comment_id': comment_id}, 'Load more replies')
+
+
+def _comment_page_response(post, endpoint, roots, more_label):
+    """Load and render a page of comment threads for the comment endpoints.
+
+    Args:
+        post: Row, ``revision`` and ``updated_at`` of the post the comments
+            belong to.
+        endpoint: String, endpoint serving the page, for the next-page link.
+        roots: Dict, the endpoint's URL arguments: ``post_id`` for a post's
+            top-level comments or ``comment_id`` for a comment's replies.
+        more_label: String, text of the next-page link.
+
+    Returns:
+        Response: Fragment or JSON page with cache validators, or 304.
+    """
+    as_json = request.args.get('format') == 'json'
+    etag = fragment_etag(endpoint, *roots.values(), post.revision)
+    not_modified = not_modified_response(etag, post.updated_at)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        page = load_comment_threads(
+            post_id=roots.get('post_id'),
+            parent_id=roots.get('comment_id'),
+            page_size=current_app.config['COMMENT_PAGE_SIZE'],
+            after=request.args.get('after'),
+            max_depth=current_app.config['COMMENT_MAX_DEPTH'],
+        )
+    except ValueError:
+        abort(400)
+
+    next_url = None
+    if page.next_cursor:
+        next_url = url_for(endpoint, after=page.next_cursor, **roots, **({'format': 'json'} if as_json else {}))
+    if as_json:
+        response = jsonify({
+            'comments': [node.to_dict() for node in page.threads if node.shown],
+            'next_cursor': page.next_cursor,
+            'next_url': next_url,
+        })
+    else:
+        response = make_response(render_template(
+            'partials/comment_page.html', page=page, next_url=next_url, more_label=more_label,
+            nested='comment_id' in roots,
+        ))
+    return set_cache_headers(response, etag, post.updated_at)
+
+
+def _moderation_filters():
+    """Read the comment moderation filters from the query string.
+
+    Returns:
+        tuple: ``(filters, criteria)``, the filters given (for building URLs)
+        and the matching WHERE clauses from ``moderation.comment_criteria``.
+    """
+    from datetime import date
+
+    from moderation import STATUSES, comment_criteria
+
+    filters = {name: request.args[name].strip() for name in ('post', 'user', 'since', 'until', 'status')
+               if request.args.get(name, '').strip()}
+    try:
+        post_id = int(filters['post']) if 'post' in filters else None
+        since = date.fromisoformat(filters['since']) if 'since' in filters else None
+        until = date.fromisoformat(filters['until']) if 'until' in filters else None
+    except ValueError:
+        abort(400)
+    status = filters.get('status', 'all')
+    if status not in STATUSES:
+        abort(400)
+    return filters, comment_criteria(post_id, filters.get('user'), since, until, status)
+
+
+@main.route('/admin/comments')
+@query_budget(3)
+@login_required
+def admin_comments():
+    """List comments for moderation, newest first (admin only).
+
+    Filters come from the query string: ``post`` (post ID), ``user``
+    (username), ``since`` and ``until`` (ISO dates, inclusive) and ``status``
+    (all, visible or hidden). Pages are keyset-paginated with the ``before``
+    and ``after`` cursors, ``MODERATION_PAGE_SIZE`` comments at a time.
+
+    Returns:
+        Response: The moderation console, or 403 for non-admins.
+    """
+    from models import Comment
+    from moderation import STATUSES, moderation_query
+
+    if current_user.role != 'admin':
+        abort(403)
+
+    filters, criteria = _moderation_filters()
+    try:
+        page = keyset_page(
+            moderation_query(criteria),
+            Comment.date,
+            Comment.id,
+            current_app.config['MODERATION_PAGE_SIZE'],
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+        )
+    except ValueError:
+        abort(400)
+
+    response = make_response(render_template(
+        'admin_comments.html', page=page, filters=filters, statuses=STATUSES, form=ModerationForm(),
+    ))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@main.route('/admin/comments/moderate', methods=['POST'])
+@query_budget(7)
+@login_required
+def moderate_comments():
+    """Hide, show or delete comments in bulk (admin only).
+
+    Acts on the ticked ``comment_id`` values, or with ``scope=matching`` on
+    every comment matching the filters in the query string, with set-based
+    statements; see moderation.py. Deleting a comment deletes its replies.
+
+    Returns:
+        Response: Redirect back to the console with the same filters.
+    """
+    from extensions import db
+    from models import Comment
+    from moderation import delete_comments, set_hidden
+
+    if current_user.role != 'admin':
+        abort(403)
+
+    filters, criteria = _moderation_filters()
+    form = ModerationForm()
+    if not form.validate_on_submit():
+        flash('Moderation failed. Please try again.', 'danger')
+        return redirect(url_for('main.admin_comments', **filters))
+
+    if form.scope.data == 'selected':
+        try:
+            comment_ids = sorted({int(value) for value in request.form.getlist('comment_id')})
+        except ValueError:
+            abort(400)
+        if not comment_ids:
+            flash('No comments selected.', 'warning')
+            return redirect(url_for('main.admin_comments', **filters))
+        criteria = [Comment.id.in_(comment_ids)]
+
+    if form.action.data == 'delete':
+        changed = delete_comments(criteria)
+    else:
+        changed = set_hidden(criteria, form.action.data == 'hide')
+    db.session.commit()
+
+    verb = {'hide': 'Hid', 'show': 'Showed', 'delete': 'Deleted'}[form.action.data]
+    flash(f'{verb} {changed} comment{"" if changed == 1 else "s"}.', 'success')
+    return redirect(url_for('main.admin_comments', **filters))
+
+
+@main.route('/admin/metrics')
+@query_budget(2)
+@login_required
+def admin_metrics():
+    """Serve the request latency histograms in Prometheus text format (admin only).
+
+    Only available when ``INSTRUMENTATION_ENABLED`` is set; see metrics.py.
+    The figures are those of the worker process that answers.
+
+    Returns:
+        HTTP response: Prometheus exposition text, 403 for non-admins, or 404
+        when instrumentation is off.
+    """
+    if current_user.role != 'admin':
+        abort(403)
+    if not request_metrics.enabled:
+        abort(404)
+
+    response = make_response(request_metrics.exposition())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @main.route('/test_db')
+@query_budget(2)
 def test_db():
     """Test database connection."""
     from extensions import db
@@ -0,0 +1,307 @@
+"""Full-text search over blog posts for SIP311 Project Blog.
+
+Search runs on the database's own full-text index instead of
+``LIKE '%term%'`` scans: an FTS5 virtual table on SQLite (development) and a
+``FULLTEXT`` index on MySQL (production). Both sit behind the small
+:class:`SearchIndex` interface; :func:`get_search_index` picks the one for the
+current database.
+
+The routes that create, update and delete posts keep the index current in the
+same transaction as the post itself. On MySQL that is a no-op, since InnoDB
+maintains ``FULLTEXT`` indexes on its own; the FTS5 table is written
+explicitly.
+
+Results are ranked by relevance (BM25 on SQLite, MySQL's natural-language
+score on MySQL) and paginated by page number, as ranked results have no
+stable key to seek on. Matched terms are highlighted in the title and in a
+short snippet of the post's markdown source.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+
+from extensions import db
+
+# Words of a query that are searched for; anything else is ignored
+_TERM = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 10
+
+# Markers placed around matches by the database, replaced by <mark> after escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+
+
+class SearchHit:
+    """One post matching a search.
+
+    Attributes:
+        id: Integer, ID of the post.
+        title: Markup, post title with matches highlighted.
+        date: DateTime, publication date of the post.
+        snippet: Markup, excerpt of the post with matches highlighted.
+    """
+
+    def __init__(self, id, title, date, snippet):
+        self.id = id
+        self.title = title
+        self.date = date
+        self.snippet = snippet
+
+
+class SearchPage:
+    """One page of search results.
+
+    Attributes:
+        hits: List of SearchHit, best match first.
+        page: Integer, 1-based page number.
+        has_next: Boolean, True if another page of results exists.
+    """
+
+    def __init__(self, hits, page, has_next):
+        self.hits = hits
+        self.page = page
+        self.has_next = has_next
+
+
+def search_terms(query):
+    """Split a search query into the words that are searched for.
+
+    Args:
+        query: String, text typed by the user.
+
+    Returns:
+        list: Lower-cased words, at most ``MAX_TERMS``.
+    """
+    return _TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def _highlighted(marked):
+    """Escape text containing match markers and turn the markers into <mark>."""
+    return Markup(str(escape(marked)).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+class SearchIndex(ABC):
+    """Interface to a database's full-text index of posts.
+
+    Subclasses must implement :meth:`search`; the write methods default to
+    doing nothing, for databases that maintain their index on their own.
+    Every method takes an optional ``executor`` (a Session or Connection) and
+    defaults to ``db.session``, so index writes join the caller's transaction.
+    """
+
+    def create(self, executor=None):
+        """Create the index if it does not exist.
+
+        Returns:
+            bool: True if the index was created (and needs filling).
+        """
+        return False
+
+    def rebuild(self, executor=None):
+        """Re-index every post."""
+
+    def index_post(self, post_id, title, content, executor=None):
+        """Add or replace one post in the index.
+
+        Args:
+            post_id: Integer, ID of the post.
+            title: String, post title.
+            content: String, markdown source of the post.
+        """
+
+    def index_range(self, first_id, last_id, executor=None):
+        """Add or replace the posts with IDs from ``first_id`` to ``last_id``.
+
+        Used by bulk imports; one statement indexes the whole range.
+
+        Args:
+            first_id: Integer, lowest post ID, inclusive.
+            last_id: Integer, highest post ID, inclusive.
+        """
+
+    def remove_post(self, post_id, executor=None):
+        """Remove one post from the index.
+
+        Args:
+            post_id: Integer, ID of the post.
+        """
+
+    def remove_posts(self, post_ids, executor=None):
+        """Remove several posts from the index in one statement.
+
+        Args:
+            post_ids: List of Integer, IDs of the posts.
+        """
+
+    @abstractmethod
+    def search(self, query, page=1, page_size=10, executor=None):
+        """Find the posts matching ``query``, best match first.
+
+        Args:
+            query: String, text typed by the user.
+            page: Integer, 1-based page number.
+            page_size: Integer, results per page.
+
+        Returns:
+            SearchPage: The requested page of results.
+        """
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """Search backed by an FTS5 table, ``posts_fts``, keyed on post id."""
+
+    def create(self, executor=None):
+        executor = executor or db.session
+        exists = executor.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")
+        ).first()
+        if exists:
+            return False
+        executor.execute(text(
+            "CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, tokenize = 'unicode61')"
+        ))
+        return True
+
+    def rebuild(self, executor=None):
+        executor = executor or db.session
+        executor.execute(text('DELETE FROM posts_fts'))
+        executor.execute(text(
+            'INSERT INTO posts_fts (rowid, title, content) SELECT id, title, content FROM posts'
+        ))
+
+    def index_post(self, post_id, title, content, executor=None):
+        executor = executor or db.session
+        self.remove_post(post_id, executor)
+        executor.execute(
+            text('INSERT INTO posts_fts (rowid, title, content) VALUES (:id, :title, :content)'),
+            {'id': post_id, 'title': title, 'content': content},
+        )
+
+    def index_range(self, first_id, last_id, executor=None):
+        executor = executor or db.session
+        bounds = {'first': first_id, 'last': last_id}
+        executor.execute(text('DELETE FROM posts_fts WHERE rowid BETWEEN :first AND :last'), bounds)
+        executor.execute(text(
+            'INSERT INTO posts_fts (rowid, title, content)'
+            ' SELECT id, title, content FROM posts WHERE id BETWEEN :first AND :last'
+        ), bounds)
+
+    def remove_post(self, post_id, executor=None):
+        executor = executor or db.session
+        executor.execute(text('DELETE FROM posts_fts WHERE rowid = :id'), {'id': post_id})
+
+    def remove_posts(self, post_ids, executor=None):
+        executor = executor or db.session
+        executor.execute(
+            text('DELETE FROM posts_fts WHERE rowid IN :ids').bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(post_ids)},
+        )
+
+    def search(self, query, page=1, page_size=10, executor=None):
+        executor = executor or db.session
+        terms = search_terms(query)
+        if not terms:
+            return SearchPage([], page, False)
+
+        # Quoted terms are matched literally and all must appear; titles weigh
+        # five times as much as the body
+        rows = executor.execute(text(
+            'SELECT posts.id, posts.date,'
+            ' highlight(posts_fts, 0, :open, :close) AS title,'
+            " snippet(posts_fts, 1, :open, :close, '…', 24) AS snippet"
+            ' FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid'
+            ' WHERE posts_fts MATCH :match'
+            ' ORDER BY bm25(posts_fts, 5.0, 1.0)'
+            ' LIMIT :limit OFFSET :offset'
+        ), {
+            'match': ' '.join(f'"{term}"' for term in terms),
+            'open': _OPEN, 'close': _CLOSE,
+            'limit': page_size + 1, 'offset': (page - 1) * page_size,
+        }).all()
+
+        hits = [SearchHit(row.id, _highlighted(row.title), _as_datetime(row.date), _highlighted(row.snippet))
+                for row in rows[:page_size]]
+        return SearchPage(hits, page, len(rows) > page_size)
+
+
+class MySQLSearchIndex(SearchIndex):
+    """Search backed by the ``ix_posts_fulltext`` FULLTEXT index on posts.
+
+    InnoDB updates the index as posts are written, so writes and rebuilds
+    need no work here.
+    """
+
+    SNIPPET_CHARS = 160
+
+    def create(self, executor=None):
+        executor = executor or db.session
+        exists = executor.execute(text(
+            'SELECT 1 FROM information_schema.statistics'
+            " WHERE table_schema = DATABASE() AND table_name = 'posts' AND index_name = 'ix_posts_fulltext'"
+            ' LIMIT 1'
+        )).first()
+        if exists:
+            return False
+        executor.execute(text('ALTER TABLE posts ADD FULLTEXT INDEX ix_posts_fulltext (title, content)'))
+        return True
+
+    def search(self, query, page=1, page_size=10, executor=None):
+        executor = executor or db.session
+        terms = search_terms(query)
+        if not terms:
+            return SearchPage([], page, False)
+
+        rows = executor.execute(text(
+            'SELECT id, title, date, content,'
+            ' MATCH (title, content) AGAINST (:query IN NATURAL LANGUAGE MODE) AS score'
+            ' FROM posts'
+            ' WHERE MATCH (title, content) AGAINST (:query IN NATURAL LANGUAGE MODE)'
+            ' ORDER BY score DESC, id DESC'
+            ' LIMIT :limit OFFSET :offset'
+        ), {'query': ' '.join(terms), 'limit': page_size + 1, 'offset': (page - 1) * page_size}).all()
+
+        pattern = re.compile(r'\b(' + '|'.join(map(re.escape, terms)) + r')\b', re.IGNORECASE)
+        hits = [SearchHit(row.id, self._mark(pattern, row.title), row.date,
+                          self._mark(pattern, self._excerpt(pattern, row.content)))
+                for row in rows[:page_size]]
+        return SearchPage(hits, page, len(rows) > page_size)
+
+    def _excerpt(self, pattern, content):
+        """Cut ``content`` to a window around its first match."""
+        match = pattern.search(content)
+        start = max(0, (match.start() if match else 0) - self.SNIPPET_CHARS // 4)
+        excerpt = content[start:start + self.SNIPPET_CHARS]
+        return ('…' if start else '') + excerpt + ('…' if start + self.SNIPPET_CHARS < len(content) else '')
+
+    @staticmethod
+    def _mark(pattern, value):
+        return _highlighted(pattern.sub(lambda match: _OPEN + match.group(0) + _CLOSE, value))
+
+
+def get_search_index(dialect_name=None):
+    """Return the search index for a database dialect.
+
+    Args:
+        dialect_name: String, SQLAlchemy dialect name; defaults to that of
+            ``db.engine``.
+
+    Returns:
+        SearchIndex: Index implementation for the dialect.
+
+    Raises:
+        ValueError: If the dialect has no full-text search support here.
+    """
+    dialect_name = dialect_name or db.engine.dialect.name
+    if dialect_name == 'sqlite':
+        return SQLiteSearchIndex()
+    if dialect_name in ('mysql', 'mariadb'):
+        return MySQLSearchIndex()
+    raise ValueError(f'No full-text search for the {dialect_name} dialect')
+
+
+def _as_datetime(value):
+    # Raw SQL on SQLite returns DateTime columns as ISO strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
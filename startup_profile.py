@@ -0,0 +1,124 @@
+"""Cold-start profiling for SIP311 Project Blog.
+
+A PythonAnywhere worker that boots imports the WSGI file, which imports
+``app`` and builds the application, and then serves its first request. Every
+import and every line of ``create_app()`` sits on that path.
+:func:`profile_startup` measures it in a fresh interpreter with Python's
+``-X importtime`` switch, so nothing the calling process has already
+imported skews the figures.
+
+The target is :data:`STARTUP_TARGET_MS`, from interpreter start to the first
+response of the WSGI file's ``application``. ``flask startup-profile``
+compares every run with it.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Budget from interpreter start to the first response served by a new worker
+STARTUP_TARGET_MS = 1500
+
+WSGI_FILE = 'ARolfeUAT_pythonanywhere_com_wsgi.py'
+
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+# Runs in the child interpreter; prints its measurements as JSON on stdout
+_CHILD = '''
+import json, runpy, sys, time
+started = time.perf_counter()
+target, path = sys.argv[1], sys.argv[2]
+if target.endswith('.py'):
+    application = runpy.run_path(target)['application']
+else:
+    application = __import__(target).app
+imported = time.perf_counter()
+client = application.test_client()
+first = client.get(path)
+served = time.perf_counter()
+served_at = time.time()
+second = client.get(path)
+print(json.dumps({
+    'served_at': served_at,
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'second_request_ms': (time.perf_counter() - served) * 1000,
+    'status': first.status_code,
+}))
+'''
+
+
+class ImportTiming:
+    """Time taken to import one module.
+
+    Attributes:
+        module: String, dotted module name.
+        self_ms: Float, time spent in the module's own code.
+        cumulative_ms: Float, time including the modules it imported.
+        depth: Integer, nesting level; 1 for modules imported directly by
+            the startup code.
+    """
+
+    def __init__(self, module, self_ms, cumulative_ms, depth):
+        self.module = module
+        self.self_ms = self_ms
+        self.cumulative_ms = cumulative_ms
+        self.depth = depth
+
+
+def parse_import_times(output):
+    """Parse the ``-X importtime`` report written to stderr.
+
+    Args:
+        output: String, the child's stderr.
+
+    Returns:
+        list: ImportTiming per import, in the order they finished.
+    """
+    timings = []
+    for line in output.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(ImportTiming(module, int(self_us) / 1000, int(cumulative_us) / 1000,
+                                        (len(indent) + 1) // 2))
+    return timings
+
+
+def profile_startup(target=WSGI_FILE, path='/', env=None):
+    """Start a fresh interpreter, load ``target`` and serve one request.
+
+    Args:
+        target: String, path of a WSGI file defining ``application``, or the
+            name of a module defining ``app``.
+        path: String, URL path of the first request.
+        env: Mapping of extra environment variables for the child.
+
+    Returns:
+        dict: ``total_ms`` (interpreter start to first response),
+        ``import_ms``, ``first_request_ms``, ``second_request_ms``,
+        ``status`` and ``imports`` (list of ImportTiming).
+
+    Raises:
+        RuntimeError: If the child process fails.
+    """
+    started_at = time.time()
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD, target, path],
+        capture_output=True, text=True, env={**os.environ, **(env or {})},
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if child.returncode != 0:
+        raise RuntimeError(f'Profiling {target} failed:\n{_without_import_times(child.stderr)}')
+
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result['total_ms'] = (result.pop('served_at') - started_at) * 1000
+    result['imports'] = parse_import_times(child.stderr)
+    return result
+
+
+def _without_import_times(output):
+    return '\n'.join(line for line in output.splitlines() if not _IMPORT_TIME.match(line))
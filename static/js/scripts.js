@@ -0,0 +1,74 @@
+// Comments are not part of the blog listing. Each post's comment container
+// is filled from its data-comments-url the first time it is opened, and
+// "load more" links fetch the next part of a thread in place. The fragments
+// are cached and shared by every visitor, so they carry no forms of their
+// own: reply forms are cloned from the page's #reply-form-template (present
+// only for logged-in users).
+document.addEventListener('DOMContentLoaded', function () {
+    var replyTemplate = document.getElementById('reply-form-template');
+
+    function loadInto(container, url, onError) {
+        return fetch(url, {headers: {'X-Requested-With': 'fetch'}})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                container.insertAdjacentHTML('beforeend', html);
+                if (!replyTemplate) {
+                    container.querySelectorAll('.reply-toggle').forEach(function (button) {
+                        button.remove();
+                    });
+                }
+                return true;
+            })
+            .catch(onError);
+    }
+
+    document.querySelectorAll('.comments[data-comments-url]').forEach(function (container) {
+        container.addEventListener('show.bs.collapse', function (event) {
+            if (event.target !== container || container.dataset.loaded) {
+                return;
+            }
+            container.dataset.loaded = 'true';
+            loadInto(container, container.dataset.commentsUrl, function () {
+                delete container.dataset.loaded;
+                container.textContent = 'Could not load comments. Try again.';
+            });
+        });
+    });
+
+    document.addEventListener('click', function (event) {
+        var toggle = event.target.closest('.reply-toggle');
+        if (toggle && replyTemplate) {
+            var open = toggle.nextElementSibling;
+            if (open && open.classList.contains('reply-form')) {
+                open.remove();
+                return;
+            }
+            var form = replyTemplate.content.firstElementChild.cloneNode(true);
+            form.action = toggle.dataset.replyUrl;
+            toggle.after(form);
+            form.querySelector('textarea, input[type="text"]').focus();
+            return;
+        }
+
+        var more = event.target.closest('.load-replies');
+        if (more) {
+            event.preventDefault();
+            var container = more.previousElementSibling;
+            if (!container || !container.classList.contains('comment-replies')) {
+                container = more.parentElement;
+            }
+            loadInto(container, more.href, function () {
+                more.textContent = 'Could not load more. Try again.';
+            }).then(function (loaded) {
+                if (loaded) {
+                    more.remove();
+                }
+            });
+        }
+    });
+});
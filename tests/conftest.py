@@ -0,0 +1,101 @@
+"""Shared fixtures for the SIP311 Project Blog tests.
+
+Every test gets its own app from ``create_app()`` on a scratch SQLite file,
+with the settings the ``flask check`` commands use: CSRF off, no background
+mail or image workers, and the cheapest bcrypt cost. The in-process caches
+are cleared around each test, so requests meet them cold.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py builds an app when imported; keep that one off instance/sip.db too
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('MAIL_WORKER_IN_PROCESS', 'false')
+os.environ.setdefault('IMAGE_PROCESSING', 'inline')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+# Users with these ids in seeded data: seed_data() makes the first user an admin
+USER_IDS = {'admin': 1, 'user': 2}
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Return a factory building an app on a fresh scratch database.
+
+    The factory takes ``seed_data()`` arguments; with none the database is
+    left empty. Apps are disposed of at the end of the test.
+    """
+    from app import create_app
+    from bench import seed_data
+    from extensions import db
+    from query_budgets import _clear_caches
+
+    apps = []
+
+    def factory(**seed):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / f"test{len(apps)}.db"}',
+            'SQLALCHEMY_ENGINE_OPTIONS': {},
+            'WTF_CSRF_ENABLED': False,
+            'MAIL_WORKER_IN_PROCESS': False,
+            'IMAGE_PROCESSING': 'inline',
+            'INSTRUMENTATION_ENABLED': True,
+            'CREATE_SCHEMA_ON_STARTUP': True,
+            'BCRYPT_LOG_ROUNDS': 4,
+        })
+        apps.append(app)
+        if seed:
+            with app.app_context():
+                seed_data(**seed)
+        _clear_caches()
+        return app
+
+    yield factory
+
+    _clear_caches()
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+
+
+@pytest.fixture
+def seeded_app(make_app):
+    """App on the data the query budget cases refer to."""
+    return make_app(users=5, posts=30, comments=200, tags=5)
+
+
+def login(client, who):
+    """Log a test client in as the seeded 'admin' or 'user'."""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(USER_IDS[who])
+        session['_fresh'] = True
+
+
+@contextmanager
+def count_queries():
+    """Record the SQL statements run while handling requests.
+
+    Yields:
+        list: String statements, filled in as requests run.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
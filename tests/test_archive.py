@@ -0,0 +1,21 @@
+"""Archiving old posts."""
+
+from datetime import datetime
+
+
+def test_archive_keeps_every_tag_of_a_post(seeded_app):
+    from archive import archive_posts
+    from extensions import db
+    from models import ArchivedPost, Post
+
+    # More tag text than MySQL's default group_concat_max_len of 1024 bytes
+    names = sorted(f'{"long-tag-name-" * 3}{number:02d}' for number in range(30))
+    with seeded_app.app_context():
+        db.session.get(Post, 1).set_tags(names)
+        db.session.commit()
+
+        totals = archive_posts(datetime(2100, 1, 1), batch_size=7)
+
+        assert totals == {'posts': 30, 'comments': 200}
+        assert db.session.get(ArchivedPost, 1).tags.split(',') == names
+        assert db.session.scalar(db.select(db.func.count()).where(ArchivedPost.tags.is_(None))) == 0
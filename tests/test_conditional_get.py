@@ -0,0 +1,43 @@
+"""Conditional GETs of the blog listing."""
+
+from conftest import login
+
+
+def test_deleting_the_newest_post_invalidates_cached_copies(seeded_app):
+    client = seeded_app.test_client()
+    first = client.get('/sip')
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert client.get('/sip', headers={'If-None-Match': etag}).status_code == 304
+
+    admin = seeded_app.test_client()
+    login(admin, 'admin')
+    assert admin.get('/post/30/delete').status_code == 302
+
+    # Last-Modified moved backwards, so If-Modified-Since alone must not give a 304
+    assert client.get('/sip', headers={'If-Modified-Since': last_modified}).status_code == 200
+    assert client.get('/sip', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_moderation_invalidates_cached_copies(seeded_app):
+    from extensions import db
+    from models import Comment, Post
+
+    client = seeded_app.test_client()
+    etags = {path: client.get(path).headers['ETag'] for path in ('/sip', '/feed.atom', '/api/posts')}
+    with seeded_app.app_context():
+        comment = db.session.scalars(
+            db.select(Comment).join(Post).where(Comment.is_hidden == db.false()).order_by(Post.date.desc())
+        ).first()
+        comment_id, post_id = comment.id, comment.post_id
+        visible = db.session.get(Post, post_id).visible_comment_count
+
+    admin = seeded_app.test_client()
+    login(admin, 'admin')
+    response = admin.post('/admin/comments/moderate',
+                          data={'action': 'hide', 'scope': 'selected', 'comment_id': [str(comment_id)]})
+    assert response.status_code == 302
+
+    for path, etag in etags.items():
+        assert client.get(path, headers={'If-None-Match': etag}).status_code == 200, path
+    posts = client.get('/api/posts').get_json()['posts']
+    assert next(post for post in posts if post['id'] == post_id)['comment_count'] == visible - 1
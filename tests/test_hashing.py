@@ -0,0 +1,17 @@
+"""The password hashing pool."""
+
+import pytest
+
+
+def test_building_an_app_shuts_down_the_previous_hashing_pool(make_app):
+    from hashing import password_hasher
+
+    make_app()
+    old_pool = password_hasher._executor
+    password_hasher.hash('secret')
+
+    make_app()
+
+    with pytest.raises(RuntimeError):
+        old_pool.submit(print)
+    assert password_hasher.verify(password_hasher.hash('secret'), 'secret')
@@ -0,0 +1,65 @@
+"""Post image uploads."""
+
+import io
+import os
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def image_files(seeded_app):
+    """Remove the images a test stores under static/images."""
+    from images import image_dir
+
+    directory = image_dir(seeded_app)
+    before = set(os.listdir(directory))
+    yield directory
+    for name in set(os.listdir(directory)) - before:
+        os.remove(os.path.join(directory, name))
+
+
+def _png(width=1000, height=600):
+    from PIL import Image
+
+    data = io.BytesIO()
+    Image.new('RGB', (width, height), 'teal').save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def test_add_post_with_image_and_new_tags_processes_inline_within_budget(seeded_app, image_files):
+    from extensions import db
+    from models import Post
+
+    client = seeded_app.test_client()
+    login(client, 'admin')
+    response = client.post('/sip/add', content_type='multipart/form-data', data={
+        'title': 'With image', 'content': 'Look.', 'tags': 'photos, brand-new',
+        'image': (_png(), 'photo.png'),
+    })
+
+    assert response.status_code == 302
+    with seeded_app.app_context():
+        post = db.session.scalars(db.select(Post).where(Post.title == 'With image')).one()
+        assert post.image_width == 1000
+        assert {variant['width'] for variant in post.image_variants_by_format['webp']} == {480, 960, 1000}
+
+
+def test_add_post_rejects_a_file_that_is_not_an_image(seeded_app, image_files):
+    from extensions import db
+    from models import Post
+
+    stored = set(os.listdir(image_files))
+    client = seeded_app.test_client()
+    login(client, 'admin')
+    response = client.post('/sip/add', content_type='multipart/form-data', data={
+        'title': 'Broken image', 'content': 'Oops.', 'image': (io.BytesIO(b'notanimage'), 'y.jpg'),
+    })
+
+    assert response.status_code == 200
+    assert 'not a valid JPEG or PNG image' in response.get_data(as_text=True)
+    assert set(os.listdir(image_files)) == stored
+    with seeded_app.app_context():
+        assert db.session.scalars(db.select(Post).where(Post.title == 'Broken image')).first() is None
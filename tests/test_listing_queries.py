@@ -0,0 +1,41 @@
+"""The blog listings must run the same number of queries at any data size.
+
+A lazy relationship touched per post or per comment (an N+1 query) makes the
+count grow with the rows; these tests seed two databases of different sizes
+and compare the statements each listing runs with all caches cold.
+"""
+
+import pytest
+
+from conftest import count_queries, login
+
+SMALL = {'users': 5, 'posts': 30, 'comments': 200, 'tags': 5}
+LARGE = {'users': 20, 'posts': 120, 'comments': 2000, 'tags': 10}
+
+
+def _statements(app, path, who):
+    from query_budgets import _clear_caches
+
+    _clear_caches()
+    client = app.test_client()
+    if who:
+        login(client, who)
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    return statements
+
+
+@pytest.mark.parametrize('path, who', [
+    ('/sip', None),
+    ('/sip', 'user'),
+    ('/sip/tag/topic1', None),
+    ('/feed.atom', None),
+    ('/api/posts', None),
+    ('/post/1/comments', None),
+])
+def test_listing_queries_do_not_grow_with_rows(make_app, path, who):
+    small = _statements(make_app(**SMALL), path, who)
+    large = _statements(make_app(**LARGE), path, who)
+
+    assert len(small) == len(large), '\n'.join(['small:', *small, 'large:', *large])
@@ -0,0 +1,37 @@
+"""Sending queued mail to the SMTP2GO stub."""
+
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def stub_sender():
+    from mailer import MailSender, make_stub_server
+
+    stub = make_stub_server(port=0)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    sender = MailSender(f'http://127.0.0.1:{stub.server_port}/email/send', 'key')
+    yield sender
+    sender.close()
+    stub.shutdown()
+    stub.server_close()
+
+
+def _mail(*recipients):
+    import json
+
+    from models import OutboundMail
+
+    return OutboundMail(sender='blog@example.com', recipients=json.dumps(recipients), subject='Hi', text_body='Hi')
+
+
+def test_send_accepted(stub_sender):
+    stub_sender.send(_mail('someone@example.com'))
+
+
+def test_send_raises_when_a_recipient_is_refused_with_200(stub_sender):
+    from mailer import PermanentMailError
+
+    with pytest.raises(PermanentMailError, match='1 recipient'):
+        stub_sender.send(_mail('someone@example.com', 'nobody@example.invalid'))
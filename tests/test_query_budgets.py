@@ -0,0 +1,25 @@
+"""Every route must stay within its query budget on cold caches.
+
+One test per endpoint of the ``main`` blueprint in ``app.url_map``, so a new
+route without a ``@query_budget`` or without a request case in
+query_budgets.py fails here too.
+"""
+
+import pytest
+
+
+def _main_endpoints():
+    from app import app
+
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith('main.')})
+
+
+@pytest.mark.parametrize('endpoint', _main_endpoints())
+def test_route_within_query_budget(seeded_app, endpoint):
+    from query_budgets import check_query_budgets
+
+    results = check_query_budgets(seeded_app, [endpoint])
+
+    failures = [f'{method} {path}: {problem}'
+                for _, method, path, _, _, _, problems in results for problem in problems]
+    assert not failures, '\n'.join(failures)
@@ -0,0 +1,29 @@
+"""Bulk export of posts."""
+
+import io
+import json
+
+
+def test_export_keeps_every_tag_of_a_post(seeded_app, monkeypatch):
+    import transfer
+    from extensions import db
+    from models import Post
+
+    # Several chunks of posts
+    monkeypatch.setattr(transfer, 'EXPORT_CHUNK_SIZE', 7)
+
+    # More tag text than MySQL's default group_concat_max_len of 1024 bytes
+    names = sorted(f'{"long-tag-name-" * 3}{number:02d}' for number in range(30))
+    with seeded_app.app_context():
+        post = db.session.get(Post, 1)
+        post.set_tags(names)
+        db.session.commit()
+
+        output = io.StringIO()
+        counts = transfer.export_jsonl(output)
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    posts = {record['id']: record for record in records if record['type'] == 'post'}
+    assert counts['post'] == len(posts) == 30
+    assert posts[1]['tags'] == names
+    assert all(record['tags'] for record in posts.values())
@@ -0,0 +1,277 @@
+"""Bulk import and export of posts for SIP311 Project Blog.
+
+:func:`import_posts` loads a directory of markdown files, each opening with a
+front matter block::
+
+    ---
+    title: Sensor board, second revision
+    date: 2024-03-05T14:30:00Z
+    tags: hardware, sensors
+    ---
+    The post's markdown...
+
+Files are read, rendered and inserted ``batch_size`` at a time, with one
+multi-row INSERT per table and one transaction per batch, instead of the
+commit per post of the add-post form. Tags are normalized the way
+``Post.set_tags`` does it and created once, however many posts name them;
+tag counts and the search index are brought up to date batch by batch.
+
+:func:`export_jsonl` writes every tag, post and comment as one JSON object
+per line. Tags and comments are read through a server-side cursor, posts
+a keyset chunk at a time with their tag names, so memory use stays flat
+however large the blog is.
+
+Run both through ``flask posts import`` and ``flask posts export``.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import UTC, datetime
+
+from sqlalchemy import insert
+
+from extensions import db
+
+# Rows fetched per round trip while exporting
+EXPORT_CHUNK_SIZE = 1000
+
+
+class FrontMatterError(ValueError):
+    """A post file whose front matter is missing or invalid."""
+
+
+def _parse_date(value):
+    """Parse an ISO 8601 date or time into a naive UTC datetime."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(UTC).replace(tzinfo=None)
+    return parsed
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
+
+
+def parse_post_file(text, default_date=None):
+    """Split a post file into its front matter and markdown body.
+
+    The front matter is a block of ``key: value`` lines between two ``---``
+    lines. ``title`` is required; ``date`` is an ISO 8601 date or time
+    (naive times are taken as UTC) and ``tags`` a comma-separated list,
+    optionally in square brackets. Other keys are ignored.
+
+    Args:
+        text: String, content of the file.
+        default_date: DateTime, date used when the front matter has none.
+
+    Returns:
+        dict: ``title``, ``date``, ``tags`` (set of normalized names) and
+        ``content`` (the markdown body).
+
+    Raises:
+        FrontMatterError: If the front matter is missing, unterminated or
+            has no title or an unreadable date.
+    """
+    lines = text.lstrip('\ufeff').splitlines()
+    if not lines or lines[0].strip() != '---':
+        raise FrontMatterError('no front matter block')
+    try:
+        end = next(index for index, line in enumerate(lines[1:], 1) if line.strip() == '---')
+    except StopIteration:
+        raise FrontMatterError('front matter block is not closed')
+
+    fields = {}
+    for line in lines[1:end]:
+        key, separator, value = line.partition(':')
+        if separator and key.strip():
+            fields[key.strip().lower()] = value.strip()
+
+    title = _unquote(fields.get('title', ''))
+    if not title:
+        raise FrontMatterError('no title')
+    try:
+        date = _parse_date(_unquote(fields['date'])) if fields.get('date') else default_date
+    except ValueError:
+        raise FrontMatterError(f"unreadable date {fields['date']!r}")
+
+    tags = fields.get('tags', '').strip()
+    if tags.startswith('[') and tags.endswith(']'):
+        tags = tags[1:-1]
+    names = (_unquote(name) for name in tags.split(','))
+    return {
+        'title': title[:200],
+        'date': date or datetime.now(UTC).replace(tzinfo=None),
+        # Normalized as Post.set_tags does
+        'tags': {name.strip().lower()[:50] for name in names if name.strip()},
+        'content': '\n'.join(lines[end + 1:]).strip('\n') + '\n',
+    }
+
+
+def _post_files(directory):
+    """Yield the markdown files below ``directory`` in a stable order."""
+    for root, subdirectories, filenames in os.walk(directory):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(('.md', '.markdown')):
+                yield os.path.join(root, filename)
+
+
+_renderer = None
+
+
+def _render(source):
+    """Render markdown with a converter kept for the life of the process."""
+    global _renderer
+    if _renderer is None:
+        import markdown
+        _renderer = markdown.Markdown()
+    # reset() clears the converter's state between documents
+    return _renderer.reset().convert(source)
+
+
+def import_posts(directory, user_id, batch_size=1000, workers=1, progress=None):
+    """Insert every markdown post file below ``directory``.
+
+    Args:
+        directory: String, directory to read ``*.md`` files from,
+            recursively.
+        user_id: Integer, ID of the user the posts are attributed to.
+        batch_size: Integer, posts per INSERT statement and transaction.
+        workers: Integer, processes rendering markdown; 1 renders in this
+            process.
+        progress: Callable taking a message string, or None.
+
+    Returns:
+        dict: Number of ``posts`` imported, ``tags`` created and files
+        ``skipped`` for bad front matter.
+    """
+    from models import Post, Tag, post_tag
+    from search import get_search_index
+
+    progress = progress or (lambda message: None)
+    search_index = get_search_index()
+    # Rendering is the CPU-bound part of an import; spread it over processes
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    render = (lambda sources: list(pool.map(_render, sources, chunksize=64))) if pool else (
+        lambda sources: [_render(source) for source in sources])
+    tag_ids = dict(db.session.execute(db.select(Tag.name, Tag.id)).all())
+    next_id = (db.session.scalar(db.select(db.func.max(Post.id))) or 0) + 1
+    totals = {'posts': 0, 'tags': 0, 'skipped': 0}
+
+    def flush(batch):
+        nonlocal next_id
+        for post, html in zip(batch, render([post['content'] for post in batch])):
+            post['content_html'] = html
+        new_names = set().union(*(post['tags'] for post in batch)) - tag_ids.keys()
+        if new_names:
+            db.session.execute(insert(Tag), [{'name': name} for name in sorted(new_names)])
+            tag_ids.update(db.session.execute(
+                db.select(Tag.name, Tag.id).where(Tag.name.in_(new_names))
+            ).all())
+            totals['tags'] += len(new_names)
+
+        for post in batch:
+            post['id'] = next_id
+            next_id += 1
+        db.session.execute(insert(Post), [
+            {'id': post['id'], 'title': post['title'], 'date': post['date'], 'content': post['content'],
+             'content_html': post['content_html'], 'user_id': user_id, 'revision': 0}
+            for post in batch
+        ])
+        links = [{'post_id': post['id'], 'tag_id': tag_ids[name], 'post_date': post['date']}
+                 for post in batch for name in post['tags']]
+        if links:
+            db.session.execute(insert(post_tag), links)
+            Tag.recount_posts({link['tag_id'] for link in links})
+        search_index.index_range(batch[0]['id'], batch[-1]['id'])
+        db.session.commit()
+        totals['posts'] += len(batch)
+        progress(f"posts: {totals['posts']}")
+
+    batch = []
+    try:
+        for path in _post_files(directory):
+            with open(path, encoding='utf-8') as handle:
+                text = handle.read()
+            modified = datetime.fromtimestamp(os.path.getmtime(path), UTC).replace(tzinfo=None)
+            try:
+                batch.append(parse_post_file(text, default_date=modified))
+            except FrontMatterError as error:
+                progress(f'Skipping {path}: {error}')
+                totals['skipped'] += 1
+                continue
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if pool:
+            pool.shutdown()
+    return totals
+
+
+def _utc(value):
+    """Return a naive UTC datetime as an ISO 8601 string, or None."""
+    return value.replace(tzinfo=UTC).isoformat() if value is not None else None
+
+
+def _stream(statement):
+    """Yield the rows of ``statement`` from a server-side cursor."""
+    return db.session.execute(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+
+
+def export_jsonl(stream):
+    """Write every tag, post and comment to ``stream`` as JSON lines.
+
+    Each line is an object with a ``type`` of ``tag``, ``post`` or
+    ``comment``; tags come first, then posts (with their tag names), then
+    comments, each in ID order, so a reader can recreate them in one pass.
+
+    Args:
+        stream: Text file object to write to.
+
+    Returns:
+        dict: Number of lines written per type.
+    """
+    from models import Comment, Post, Tag, User
+
+    counts = {'tag': 0, 'post': 0, 'comment': 0}
+
+    def write(kind, record):
+        stream.write(json.dumps({'type': kind, **record}, ensure_ascii=False) + '\n')
+        counts[kind] += 1
+
+    for row in _stream(db.select(Tag.id, Tag.name).order_by(Tag.id)):
+        write('tag', {'id': row.id, 'name': row.name})
+
+    # Tag names are looked up per chunk rather than aggregated in SQL, as MySQL
+    # silently truncates GROUP_CONCAT at group_concat_max_len
+    posts = (db.select(Post.id, Post.title, Post.date, Post.updated_at, Post.content, Post.content_html,
+                       Post.image_path, Post.user_id, User.username)
+             .join(User, User.id == Post.user_id).order_by(Post.id).limit(EXPORT_CHUNK_SIZE))
+    last_id = 0
+    while rows := db.session.execute(posts.where(Post.id > last_id)).all():
+        last_id = rows[-1].id
+        tag_names = Tag.names_by_post([row.id for row in rows])
+        for row in rows:
+            write('post', {
+                'id': row.id, 'title': row.title, 'date': _utc(row.date), 'updated_at': _utc(row.updated_at),
+                'user_id': row.user_id, 'author': row.username, 'tags': tag_names.get(row.id, []),
+                'content': row.content, 'content_html': row.content_html, 'image_path': row.image_path,
+            })
+
+    comments = (db.select(Comment.id, Comment.post_id, Comment.parent_id, Comment.user_id, User.username,
+                          Comment.date, Comment.is_hidden, Comment.content)
+                .join(User, User.id == Comment.user_id).order_by(Comment.id))
+    for row in _stream(comments):
+        write('comment', {
+            'id': row.id, 'post_id': row.post_id, 'parent_id': row.parent_id, 'user_id': row.user_id,
+            'author': row.username, 'date': _utc(row.date), 'is_hidden': bool(row.is_hidden),
+            'content': row.content,
+        })
+    return counts